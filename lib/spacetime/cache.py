@@ -18,6 +18,12 @@
 
 import os
 import sqlite3
+import hashlib
+import shutil
+import itertools
+import threading
+import time
+import numpy
 try:
 	import cPickle as pickle
 except ImportError:
@@ -26,8 +32,8 @@ except ImportError:
 import logging
 logger = logging.getLogger(__name__)
 
-from . import util
-from .modules.generic.datasources import RGBImage
+from . import util, version
+from .modules.generic.datasources import probe_timeinfo
 
 
 # sqlite requires the buffer type for blobs, but pickle doesn't grok that
@@ -39,33 +45,116 @@ def blob2obj(blob):
 
 
 class Cache(object):
+	"""Persistent store for metadata of files, such as image timestamps.
+
+	Entries are keyed on the path and are only valid as long as the size
+	and modification time of the file do not change. Writes are queued and
+	stored in bulk, replacing older entries, when the queue is full and on
+	close(). The database runs in WAL mode, so several instances can use it
+	at the same time. The least recently used entries are removed when a
+	table grows beyond max_entries."""
+
+	format_version = 2
+	max_entries = 250000
+	flush_interval = 1000
+
+	# one connection per thread, shared by the open instances and closed
+	# with the last of them
+	_local = threading.local()
+
 	def __init__(self, table):
-		self.table = table
-		self.conn = sqlite3.connect(util.get_persistant_path('cache'))
+		self.table = '{0}_v{1}'.format(table, self.format_version)
+		self.conn = self.connect()
+		self._local.users += 1
 		self.cur = self.conn.cursor()
-		self.cur.execute('CREATE TABLE IF NOT EXISTS {0} (key BLOB PRIMARY KEY, value BLOB)'.format(self.table))
+		self.cur.execute('CREATE TABLE IF NOT EXISTS {0} (key TEXT PRIMARY KEY, size INTEGER, mtime REAL, value BLOB, atime REAL)'.format(self.table))
+		self.cur.execute('CREATE INDEX IF NOT EXISTS {0}_atime ON {0} (atime)'.format(self.table))
 		self.pending = []
+		self.touched = []
+
+	@classmethod
+	def connect(cls):
+		local = cls._local
+		# a connection must not be used after fork(), e.g. in the
+		# ParallelMovieRenderer workers: they get a new one
+		if getattr(local, 'conn', None) is None or local.pid != os.getpid():
+			conn = sqlite3.connect(util.get_persistant_path('cache'), timeout=30)
+			conn.text_factory = str # paths are byte strings
+			conn.execute('PRAGMA journal_mode=WAL')
+			conn.execute('PRAGMA synchronous=NORMAL')
+			local.conn = conn
+			local.pid = os.getpid()
+			local.users = 0
+		return local.conn
+
+	@classmethod
+	def release(cls, conn):
+		local = cls._local
+		if getattr(local, 'conn', None) is not conn:
+			return # from before a fork
+		local.users -= 1
+		if local.users <= 0:
+			local.conn = None
+			conn.close()
+
+	@staticmethod
+	def stat(path):
+		try:
+			st = os.stat(path)
+		except OSError:
+			return -1, -1.
+		return st.st_size, st.st_mtime
 
 	def close(self):
-		self.commit_pending()
-		self.conn.close()
+		if self.conn is None:
+			return
+		try:
+			self.flush()
+			self.evict()
+		finally:
+			self.release(self.conn)
+			self.conn = self.cur = None
 
-	def commit_pending(self):
-		self.cur.executemany('INSERT INTO {0} (key, value) VALUES (?, ?)'.format(self.table), self.pending)
+	def flush(self):
+		if self.pending:
+			self.cur.executemany('INSERT OR REPLACE INTO {0} (key, size, mtime, value, atime) VALUES (?, ?, ?, ?, ?)'.format(self.table), self.pending)
+			self.pending = []
+		if self.touched:
+			now = time.time()
+			self.cur.executemany('UPDATE {0} SET atime = ? WHERE key = ?'.format(self.table), ((now, key) for key in self.touched))
+			self.touched = []
 		self.conn.commit()
 
+	def evict(self):
+		count, = self.cur.execute('SELECT COUNT(*) FROM {0}'.format(self.table)).fetchone()
+		if count > self.max_entries:
+			self.cur.execute('DELETE FROM {0} WHERE key IN (SELECT key FROM {0} ORDER BY atime LIMIT ?)'.format(self.table), (count - self.max_entries,))
+			self.conn.commit()
+
 	def lookup(self, key):
-		self.cur.execute('SELECT * FROM {0} WHERE key = ?'.format(self.table), (key,))
-		data = self.cur.fetchone()
-		if data:
-			key, value = data
-			return blob2obj(value)
+		return self.lookup_many([key]).get(key)
+
+	def lookup_many(self, keys):
+		# returns {key: value} for all keys with a valid entry, in a single query
+		self.flush()
+		self.cur.execute('CREATE TEMP TABLE IF NOT EXISTS cache_lookup (key TEXT, size INTEGER, mtime REAL)')
+		self.cur.execute('DELETE FROM cache_lookup')
+		self.cur.executemany('INSERT INTO cache_lookup (key, size, mtime) VALUES (?, ?, ?)', ((key,) + self.stat(key) for key in keys))
+		self.cur.execute('SELECT c.key, c.value FROM {0} c JOIN cache_lookup l ON c.key = l.key AND c.size = l.size AND c.mtime = l.mtime'.format(self.table))
+		ret = dict((key, blob2obj(value)) for (key, value) in self.cur.fetchall())
+		self.touched.extend(ret)
+		return ret
 
 	def put(self, key, value):
-		self.pending.append((key, obj2blob(value)))
+		self.pending.append((key,) + self.stat(key) + (obj2blob(value), time.time()))
+		if len(self.pending) >= self.flush_interval:
+			self.flush()
 
 	def clear(self):
+		self.pending = []
+		self.touched = []
 		self.cur.execute('DELETE FROM {0}'.format(self.table))
+		self.conn.commit()
 
 	def __enter__(self):
 		return self
@@ -74,19 +163,146 @@ class Cache(object):
 		self.close()
 
 
+class DataCache(object):
+	"""Persistent cache of parsed datasources.
+
+	Entries are keyed on the path, size and modification time of the data file
+	and on the class and configuration of the parser. Every entry is a
+	directory holding the pickled datasource, with its large arrays stored as
+	separate .npy files that are memory mapped when the entry is loaded."""
+
+	format_version = 1
+	min_array_bytes = 1 << 16
+	max_bytes = 4 << 30
+
+	def __init__(self, path=None):
+		self.path = path or util.get_persistant_path('datacache')
+
+	@staticmethod
+	def describe_factory(factory):
+		if isinstance(factory, type):
+			return util.class_fqn(factory)
+		return '{0}{1!r}'.format(util.instance_fqcn(factory), sorted(vars(factory).items()))
+
+	def key(self, filename, factory, config=None):
+		filename = os.path.realpath(filename)
+		stat = os.stat(filename)
+		desc = (self.format_version, version.version, filename, stat.st_size, stat.st_mtime, self.describe_factory(factory), sorted((config or {}).items()))
+		return hashlib.sha1(repr(desc)).hexdigest()
+
+	def get(self, filename, factory, config=None, load=None):
+		"""Return the datasource for filename, from the cache if possible.
+
+		On a cache miss the file is parsed by calling load(), which defaults to
+		factory(filename), and the result is stored for the next time."""
+
+		if load is None:
+			load = lambda: factory(filename)
+		if not os.path.isfile(filename):
+			return load()
+
+		try:
+			key = self.key(filename, factory, config)
+			obj = self.lookup(key)
+		except Exception:
+			logger.exception('data cache lookup failed for {0}'.format(filename))
+			key, obj = None, None
+		if obj is not None:
+			logger.info('loaded {0} from the data cache'.format(filename))
+			return obj
+
+		obj = load()
+		if key is not None:
+			try:
+				self.put(key, obj)
+			except Exception:
+				logger.exception('could not store {0} in the data cache'.format(filename))
+			else:
+				self.prune()
+		return obj
+
+	def contains(self, filename, factory, config=None):
+		try:
+			return os.path.isdir(os.path.join(self.path, self.key(filename, factory, config)))
+		except Exception:
+			return False
+
+	def lookup(self, key):
+		entry = os.path.join(self.path, key)
+		if not os.path.isdir(entry):
+			return None
+
+		arrays = {}
+		def persistent_load(name):
+			if name not in arrays:
+				arrays[name] = numpy.load(os.path.join(entry, name), mmap_mode='c')
+			return arrays[name]
+
+		with open(os.path.join(entry, 'datasource.pickle'), 'rb') as fp:
+			unpickler = pickle.Unpickler(fp)
+			unpickler.persistent_load = persistent_load
+			obj = unpickler.load()
+		os.utime(entry, None) # for pruning the least recently used entries
+		return obj
+
+	def put(self, key, obj):
+		entry = os.path.join(self.path, key)
+		tmp = '{0}.{1}.tmp'.format(entry, os.getpid())
+		if os.path.exists(tmp):
+			shutil.rmtree(tmp)
+		os.makedirs(tmp)
+
+		arrays = {}
+		def persistent_id(obj):
+			if isinstance(obj, numpy.ndarray) and not isinstance(obj, numpy.ma.MaskedArray) and not obj.dtype.hasobject and obj.nbytes >= self.min_array_bytes:
+				if id(obj) not in arrays:
+					name = 'array{0}.npy'.format(len(arrays))
+					numpy.save(os.path.join(tmp, name), obj)
+					arrays[id(obj)] = name, obj # keep obj alive so its id is not reused
+				return arrays[id(obj)][0]
+			return None
+
+		try:
+			with open(os.path.join(tmp, 'datasource.pickle'), 'wb') as fp:
+				pickler = pickle.Pickler(fp, pickle.HIGHEST_PROTOCOL)
+				pickler.persistent_id = persistent_id
+				pickler.dump(obj)
+			os.rename(tmp, entry)
+		except:
+			shutil.rmtree(tmp, ignore_errors=True)
+			if not os.path.isdir(entry): # somebody else might have beaten us to it
+				raise
+
+	def entries(self):
+		if not os.path.isdir(self.path):
+			return []
+		return [os.path.join(self.path, i) for i in os.listdir(self.path) if not i.endswith('.tmp')]
+
+	@staticmethod
+	def entry_size(entry):
+		return sum(os.path.getsize(os.path.join(entry, i)) for i in os.listdir(entry))
+
+	def prune(self):
+		entries = sorted(self.entries(), key=os.path.getmtime, reverse=True)
+		total = 0
+		for entry in entries:
+			total += self.entry_size(entry)
+			if total > self.max_bytes:
+				shutil.rmtree(entry, ignore_errors=True) # memory mapped files cannot be removed on Windows, never mind
+
+	def clear(self):
+		for entry in self.entries():
+			shutil.rmtree(entry, ignore_errors=True)
+
+
 def populate_image_cache(path):
 	path = os.path.realpath(path)
 	for dirpath, dirnames, filenames in os.walk(path):
 		with Cache('image_metadata') as c:
 			logger.info('{1} files in {0}'.format(dirpath, len(filenames)))
-			for filename in filenames:
-				_populate_image_cache_by_file(c, os.path.join(dirpath, filename))
-
-def _populate_image_cache_by_file(cache, fn):
-	if not cache.lookup(fn):
-		try:
-			timeinfo = RGBImage.autodetect_timeinfo(fn)
-		except:
-			pass
-		else:
-			cache.put(fn, timeinfo)
+			filenames = [os.path.join(dirpath, i) for i in filenames]
+			cached = c.lookup_many(filenames)
+			filenames = [fn for fn in filenames if fn not in cached]
+			for fn, (timeinfo, error) in itertools.izip(filenames, probe_timeinfo(filenames)):
+				if timeinfo:
+					c.put(fn, timeinfo)
@@ -0,0 +1,36 @@
+# This file is part of Spacetime.
+#
+# Copyright 2010-2014 Leiden University.
+# Written by Sander Roobol.
+#
+# Spacetime is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# Spacetime is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Entry point for python -m spacetime.gui. On Windows, multiprocessing starts
+# every worker by importing the main module of the parent again. That does
+# not work for spacetime.gui.main (relative imports) or the launcher scripts,
+# but it does for this module: it only uses absolute imports and does nothing
+# unless it is run as a script. See util.can_spawn_processes().
+
+import multiprocessing
+
+spawn_safe = True
+
+if __name__ == '__main__':
+	multiprocessing.freeze_support()
+
+	from spacetime.gui.main import App
+	app = App()
+	context = app.context
+	del app
+	context.app.run()
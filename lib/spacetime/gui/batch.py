@@ -0,0 +1,335 @@
+# This file is part of Spacetime.
+#
+# Copyright 2010-2014 Leiden University.
+# Written by Sander Roobol.
+#
+# Spacetime is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# Spacetime is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import division
+
+# keep this import at top to ensure proper matplotlib backend selection
+from .figure import DrawManager, blit_axes
+
+from .. import plot, modules, util
+from . import main
+
+import traits.api as traits
+import matplotlib.figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+import multiprocessing
+import Queue
+import traceback
+import os
+import shutil
+import itertools
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class BatchApp(traits.HasTraits):
+	# Restores a project without any user interface and draws it on an Agg
+	# canvas. Provides the parts of main.App the graphs depend on.
+	plot = traits.Instance(plot.Plot)
+	drawmgr = traits.Instance(DrawManager)
+	moduleloader = traits.Instance(modules.loader.Loader, args=())
+	context = traits.Instance(main.Context)
+	tabs = traits.List(traits.Instance(modules.generic.gui.Tab))
+
+	def __init__(self, figsize, dpi, **kwargs):
+		super(BatchApp, self).__init__(**kwargs)
+		self.figure = matplotlib.figure.Figure(figsize, dpi)
+		FigureCanvasAgg(self.figure)
+		self.plot = plot.Plot(self.figure)
+		self.drawmgr = DrawManager(self.rebuild_figure, self.figure.canvas.draw, lambda axes: blit_axes(self.figure.canvas, axes))
+		self.context = main.Context(app=self, canvas=self.drawmgr, plot=self.plot, headless=True)
+
+	def rebuild_figure(self):
+		self.plot.clear()
+		[self.plot.add_subplot(tab.plot) for tab in self.tabs if isinstance(tab, modules.generic.gui.SubplotGUI) and tab.visible]
+		self.plot.setup()
+		self.plot.draw()
+		with self.context.callbacks.general_blockade():
+			self.plot.autoscale()
+
+	def load_project(self, data):
+		# data as returned by main.App.get_project_data() or read from a project file
+		self.project = data
+		tabs = [(main.MainTab(context=self.context), data[0][1])]
+		for id, props in data[1:]:
+			try:
+				klass = self.moduleloader.get_class_by_id(id)
+			except KeyError:
+				logger.warning('ignoring unknown graph id "%s"', id)
+				continue
+			tabs.append((klass(context=self.context), props))
+
+		with self.drawmgr.hold():
+			self.tabs = [tab for (tab, props) in tabs]
+			for tab, props in tabs:
+				tab._delayed_from_serialized(dict(props))
+			self.drawmgr.rebuild()
+
+	def open_project(self, path):
+		self.load_project(main.App.read_project_file(path))
+
+	def get_animated_tabs(self):
+		return [tab for tab in self.tabs if hasattr(tab, 'animate')]
+
+	def export_image(self, path, format):
+		self.figure.savefig(path, dpi=self.figure.dpi, format=format)
+
+	def export_data(self, dest):
+		os.mkdir(dest)
+		for tab in self.tabs:
+			if hasattr(tab, 'export'):
+				tab.export(dest)
+
+	def export_movie(self, path, format, codec, framerate, ffmpeg_options=(), processes=1):
+		animated = self.get_animated_tabs()
+		if not animated:
+			raise RuntimeError('none of the graphs support animation')
+		for tab in animated:
+			tab.animation_full_range()
+
+		renderer = None
+		framesize = tuple(int(round(i)) for i in self.figure.get_size_inches() * self.figure.dpi)
+		movie = util.FFmpegEncode(path, format, codec, framerate, framesize, ffmpeg_options)
+		stdout_cb = movie.spawnstdoutthread()
+		try:
+			if processes > 1 and all(tab.animation_seekable for tab in animated):
+				settings = dict(
+					figsize=tuple(self.figure.get_size_inches()), dpi=self.figure.dpi,
+					animation=[(self.tabs.index(tab), tab.animation_firstframe, tab.animation_lastframe) for tab in animated],
+				)
+				renderer = ParallelMovieRenderer(self.project, settings, max(tab.animation_framecount for tab in animated), processes)
+				frames = renderer.iterframes()
+			else:
+				frames = main.MainWindowHandler.iterframes_serial(self.drawmgr, self.figure, [tab.animate for tab in animated])
+			for frameno, frame in frames:
+				movie.writeframe(frame)
+		except:
+			movie.abort()
+			raise
+		finally:
+			if renderer:
+				renderer.close()
+		ret = movie.close()
+		stdout = stdout_cb()
+		if ret != 0:
+			raise RuntimeError('ffmpeg returned {0}:\n{1}'.format(ret, stdout))
+
+
+class RenderError(Exception):
+	pass
+
+
+def render_worker(project, settings, tasks, results):
+	# Runs in a worker process. Renders the (start, stop) frame ranges from the
+	# tasks queue until it receives None, and puts (frameno, rgb) on the
+	# results queue, or (None, traceback) if something goes wrong.
+	try:
+		app = BatchApp(settings['figsize'], settings['dpi'])
+		app.load_project(project)
+		animated = []
+		for index, first, last in settings['animation']:
+			tab = app.tabs[index]
+			tab.animation_firstframe = first
+			tab.animation_lastframe = last
+			animated.append(tab)
+
+		while True:
+			task = tasks.get()
+			if task is None:
+				break
+			for frameno in xrange(*task):
+				with app.drawmgr.hold():
+					for tab in animated:
+						tab.animation_seek(frameno)
+				results.put((frameno, app.figure.canvas.tostring_rgb()))
+	except:
+		results.put((None, traceback.format_exc()))
+
+
+class ParallelMovieRenderer(object):
+	# Renders movie frames in worker processes, each with its own copy of the
+	# project. Frames are handed out in chunks, but never more than window
+	# frames ahead of the next frame to be returned, which keeps the buffer
+	# for reordering the results small.
+	chunksize = 4
+	poll_interval = 1.
+
+	def __init__(self, project, settings, framecount, processes):
+		self.framecount = framecount
+		self.window = 4 * processes * self.chunksize
+		self.tasks = multiprocessing.Queue()
+		self.results = multiprocessing.Queue()
+		self.processes = [multiprocessing.Process(target=render_worker, args=(project, settings, self.tasks, self.results)) for i in range(processes)]
+		for p in self.processes:
+			p.daemon = True
+			p.start()
+
+	def get_result(self):
+		while True:
+			try:
+				frameno, data = self.results.get(timeout=self.poll_interval)
+			except Queue.Empty:
+				if not all(p.is_alive() for p in self.processes):
+					raise RenderError('worker process died unexpectedly')
+			else:
+				if frameno is None:
+					raise RenderError('worker process failed:\n' + data)
+				return frameno, data
+
+	def iterframes(self):
+		pending = {}
+		dispatched = 0
+		for frameno in xrange(self.framecount):
+			while dispatched < min(frameno + self.window, self.framecount):
+				self.tasks.put((dispatched, min(dispatched + self.chunksize, self.framecount)))
+				dispatched += self.chunksize
+			while frameno not in pending:
+				i, data = self.get_result()
+				pending[i] = data
+			yield frameno, pending.pop(frameno)
+
+		for p in self.processes:
+			self.tasks.put(None)
+
+	def close(self):
+		for p in self.processes:
+			if p.is_alive():
+				p.terminate()
+			p.join()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.close()
+
+
+def process_project(path, options):
+	# exports everything requested in options for a single project file
+	width, height = options['size']
+	dpi = options['dpi']
+	app = BatchApp((width / dpi, height / dpi), dpi)
+	app.open_project(path)
+
+	name = os.path.splitext(os.path.basename(path))[0]
+	base = os.path.join(options['outdir'] or os.path.dirname(path), name)
+	for format in options['formats']:
+		app.export_image('{0}.{1}'.format(base, format), format)
+	if options['data']:
+		app.export_data(base + '-data')
+	if options['movie']:
+		temppath = '{0}.{1}.temp'.format(base, options['movie_format'])
+		app.export_movie(temppath, options['movie_format'], options['codec'], options['framerate'], options['ffmpeg_options'], options['processes'])
+		shutil.move(temppath, '{0}.{1}'.format(base, options['movie_format']))
+
+
+def process_project_safe(args):
+	# for use with multiprocessing.Pool, returns (path, traceback or None)
+	path, options = args
+	try:
+		process_project(path, options)
+	except:
+		return path, traceback.format_exc()
+	return path, None
+
+
+def parse_size(option, opt, value, parser):
+	try:
+		width, height = (int(i) for i in value.lower().split('x'))
+	except ValueError:
+		parser.error('option {0}: expected WIDTHxHEIGHT, got {1!r}'.format(opt, value))
+	setattr(parser.values, option.dest, (width, height))
+
+
+def parseargs(argv):
+	from optparse import OptionParser, OptionGroup
+	parser = OptionParser(usage="usage: %prog [options] project [project ...]", description="Exports images, movies and data from Spacetime projects without user interface.")
+	parser.add_option("--debug", dest="debug", action="store_true", help="print debugging statements")
+	parser.add_option("-o", "--output", dest="outdir", metavar="DIR", help="output directory (default: next to each project file)")
+	parser.add_option("-j", "--jobs", dest="jobs", type="int", default=1, help="number of projects to process in parallel (default: %default)")
+	parser.add_option("--size", dest="size", action="callback", type="string", callback=parse_size, default=(1024, 768), metavar="WIDTHxHEIGHT", help="size in pixels (default: 1024x768)")
+	parser.add_option("--dpi", dest="dpi", type="int", default=72, help="resolution (default: %default)")
+
+	group = OptionGroup(parser, "Images")
+	group.add_option("-f", "--format", dest="formats", action="append", default=[], metavar="FORMAT", help="export an image in this format, e.g. png, pdf, svg (can be repeated)")
+	parser.add_option_group(group)
+
+	group = OptionGroup(parser, "Data")
+	group.add_option("-d", "--data", dest="data", action="store_true", help="export data into a directory <name>-data")
+	parser.add_option_group(group)
+
+	group = OptionGroup(parser, "Movies")
+	group.add_option("-m", "--movie", dest="movie", action="store_true", help="export a movie of all animated graphs, using their full frame range")
+	group.add_option("--movie-format", dest="movie_format", default="mp4", help="container format (default: %default)")
+	group.add_option("--codec", dest="codec", default="libx264", help="video codec (default: %default)")
+	group.add_option("--framerate", dest="framerate", type="int", default=5, help="frames per second (default: %default)")
+	group.add_option("--ffmpeg-options", dest="ffmpeg_options", default="-x264opts crf=12 -preset medium -profile:v main -pix_fmt yuv420p -threads 0", help="extra options for ffmpeg (default: %default)")
+	group.add_option("--processes", dest="processes", type="int", default=multiprocessing.cpu_count(), help="number of processes rendering a movie, only when --jobs=1 (default: %default)")
+	parser.add_option_group(group)
+
+	options, args = parser.parse_args(argv)
+	if not args:
+		parser.error('no project files given')
+	if not (options.formats or options.data or options.movie):
+		parser.error('nothing to export, use --format, --data and/or --movie')
+	return options, args
+
+
+def main(argv=None):
+	options, paths = parseargs(argv)
+
+	logger = logging.getLogger()
+	if options.debug:
+		logger.setLevel(logging.DEBUG)
+	else:
+		logger.setLevel(logging.WARNING)
+
+	if not util.can_spawn_processes() and (options.jobs > 1 or options.processes > 1):
+		logger.warning('worker processes are not available, use spacetime-batch or python -m spacetime.gui.batchmain')
+		options.jobs = options.processes = 1
+
+	opts = dict(
+		outdir=options.outdir, size=options.size, dpi=options.dpi,
+		formats=options.formats, data=options.data,
+		movie=options.movie, movie_format=options.movie_format, codec=options.codec, framerate=options.framerate,
+		ffmpeg_options=options.ffmpeg_options.split(),
+		# worker processes of a Pool cannot have children of their own
+		processes=options.processes if options.jobs == 1 else 1,
+	)
+	jobs = [(path, opts) for path in paths]
+
+	if options.jobs > 1:
+		pool = multiprocessing.Pool(options.jobs)
+		results = pool.imap_unordered(process_project_safe, jobs)
+	else:
+		pool = None
+		results = itertools.imap(process_project_safe, jobs)
+
+	failed = 0
+	for path, error in results:
+		if error:
+			failed += 1
+			logger.error('{0}: failed\n{1}'.format(path, error))
+		else:
+			print '{0}: done'.format(path)
+
+	if pool:
+		pool.close()
+		pool.join()
+	return 1 if failed else 0
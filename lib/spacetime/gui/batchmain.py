@@ -0,0 +1,32 @@
+# This file is part of Spacetime.
+#
+# Copyright 2010-2014 Leiden University.
+# Written by Sander Roobol.
+#
+# Spacetime is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# Spacetime is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Entry point for python -m spacetime.gui.batchmain, the counterpart of
+# spacetime.gui.__main__ for batch.main(): worker processes can import it
+# again on Windows.
+
+import sys
+import multiprocessing
+
+spawn_safe = True
+
+if __name__ == '__main__':
+	multiprocessing.freeze_support()
+
+	from spacetime.gui import batch
+	sys.exit(batch.main())
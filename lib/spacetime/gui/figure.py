@@ -24,6 +24,7 @@ import matplotlib.figure, matplotlib.transforms, matplotlib.backends.backend_wx,
 from matplotlib.backend_bases import cursors
 import wx
 import functools
+import itertools
 
 from traits.api import Str
 from traitsui.wx.editor import Editor
@@ -160,14 +161,47 @@ class MPLFigureEditor(BasicEditorFactory):
 	status = Str
 
 
+def blit_axes(canvas, axes):
+	# Redraws only the given axes (and any twins) on top of the last full draw
+	# and blits them to the screen. Text outside the axes is hidden meanwhile,
+	# since drawing antialiased text twice makes it look bold.
+	figure = canvas.figure
+	renderer = getattr(canvas, 'renderer', None)
+	if renderer is None or (renderer.width, renderer.height) != (int(figure.bbox.width), int(figure.bbox.height)):
+		canvas.draw()
+		return
+
+	bounds = set(ax.bbox.bounds for ax in axes if ax in figure.axes)
+	redraw = [ax for ax in sorted(figure.axes, key=lambda ax: ax.get_zorder()) if ax.bbox.bounds in bounds]
+	for ax in redraw:
+		texts = [ax.title, ax.xaxis.label, ax.yaxis.label, ax.xaxis.offsetText, ax.yaxis.offsetText]
+		for tick in itertools.chain(ax.xaxis.get_major_ticks(), ax.xaxis.get_minor_ticks(), ax.yaxis.get_major_ticks(), ax.yaxis.get_minor_ticks()):
+			texts.extend((tick.label1, tick.label2))
+		visible = [t.get_visible() for t in texts]
+		for t in texts:
+			t.set_visible(False)
+		try:
+			ax.draw(renderer)
+		finally:
+			for t, v in zip(texts, visible):
+				t.set_visible(v)
+
+	if hasattr(canvas, 'blit'):
+		for ax in redraw:
+			canvas.blit(ax.bbox)
+
+
 class DrawManager(object):
 	_hold = 0
 	level = 0
 
-	def __init__(self, rebuild, redraw):
+	def __init__(self, rebuild, redraw, redraw_axes=None):
 		self._rebuild = rebuild
 		self._redraw = redraw
+		self._redraw_axes = redraw_axes or (lambda axes: redraw())
 		self.subgraphs = []
+		self.updates = []
+		self.axes = set()
 		self._callback_loops = set()
 
 	def hold(self):
@@ -183,17 +217,28 @@ class DrawManager(object):
 		if self._hold == 1:
 			if self.level & 5 == 5:
 				self._rebuild()
-				del self.subgraphs[:]
 				self._redraw()
-			elif self.level & 3 == 3:
+			else:
 				for cb in self.subgraphs:
 					cb()
-				self._redraw()
-			elif self.level & 1:
-				self._redraw()
+				for cb in self.updates:
+					self._add_updated_axes(cb())
+				if self.level & 1:
+					self._redraw()
+				elif self.level & 8:
+					self._redraw_axes(self.axes)
+			del self.subgraphs[:], self.updates[:]
+			self.axes = set()
 			self.level = 0
 		self._hold -= 1
 
+	def _add_updated_axes(self, axes):
+		if axes is None:
+			self.level |= 1
+		else:
+			self.level |= 8
+			self.axes.update(axes)
+
 	def rebuild(self):
 		if self._hold:
 			self.level |= 5
@@ -208,6 +253,18 @@ class DrawManager(object):
 		else:
 			cb()
 			self._redraw()
+
+	def update_subgraph(self, cb):
+		# cb() updates existing artists in place and returns the axes that
+		# have changed, or None if the entire figure needs redrawing
+		if self._hold:
+			self.updates.append(cb)
+		else:
+			axes = cb()
+			if axes is None:
+				self._redraw()
+			else:
+				self._redraw_axes(axes)
 	
 	def redraw(self):
 		if self._hold:
@@ -215,12 +272,20 @@ class DrawManager(object):
 		else:
 			self._redraw()
 
-	def relocate(self, rebuild=None, redraw=None):
+	def redraw_axes(self, axes):
+		if self._hold:
+			self._add_updated_axes(axes)
+		else:
+			self._redraw_axes(axes)
+
+	def relocate(self, rebuild=None, redraw=None, redraw_axes=None):
 		if rebuild is None:
 			rebuild = self.rebuild
 		if redraw is None:
 			redraw = self.redraw
-		return self.__class__(rebuild, redraw)
+			if redraw_axes is None:
+				redraw_axes = self.redraw_axes
+		return self.__class__(rebuild, redraw, redraw_axes)
 
 
 class CallbackLoopManager(object):
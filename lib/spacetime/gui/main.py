@@ -28,7 +28,7 @@ if platform.system() == 'Windows':
 		pass
 
 # keep this import at top to ensure proper matplotlib backend selection
-from .figure import MPLFigureEditor, DrawManager, CallbackLoopManager
+from .figure import MPLFigureEditor, DrawManager, CallbackLoopManager, blit_axes
 
 from .. import plot, modules, version, prefs, util, pypymanager, cache
 from . import support, windows
@@ -248,6 +248,10 @@ class MainWindowHandler(traitsui.Handler):
 			c.clear()
 		support.Message.show(title='Cache cleared', message='Image metadata cache has been cleared.')
 
+	def do_clear_data_cache(self, info):
+		cache.DataCache().clear()
+		support.Message.show(title='Cache cleared', message='Data file cache has been cleared.')
+
 	def do_about(self, info):
 		windows.AboutWindow.run_static(info.ui.context['object'].context)
 
@@ -341,12 +345,12 @@ class MainWindowHandler(traitsui.Handler):
 		context.prefs.set_path('export_movie', dlg.GetDirectory())
 
 		# preparations, no harm is done if something goes wrong here
-		movie = stdout_cb = stdout = None
+		movie = stdout_cb = stdout = renderer = None
 		oldfig = context.plot.figure
 		progress = ProgressDialog(title="Movie", message="Building movie", max=moviedialog.get_framecount()+2, can_cancel=True, show_time=True, parent=context.uiparent)
 		newfig = matplotlib.figure.Figure((moviedialog.frame_width / moviedialog.dpi, moviedialog.frame_height / moviedialog.dpi), moviedialog.dpi)
 		canvas = FigureCanvasAgg(newfig)
-		drawmgr = context.canvas.relocate(redraw=newfig.canvas.draw)
+		drawmgr = context.canvas.relocate(redraw=newfig.canvas.draw, redraw_axes=lambda axes: blit_axes(newfig.canvas, axes))
 
 		finalpath = dlg.GetPath()
 		if '%' in finalpath: # to support stuff like -f image2 -c:v png file_%02.png
@@ -360,7 +364,15 @@ class MainWindowHandler(traitsui.Handler):
 		# now the real thing starts. we have to clean up properly
 		try:
 			progress.open()
-			context.plot.relocate(newfig)
+			if moviedialog.processes > 1 and moviedialog.is_seekable() and util.can_spawn_processes():
+				from . import batch
+				project = json.loads(json.dumps(context.app.get_project_data())) # plain python objects for pickling
+				settings = dict(figsize=tuple(newfig.get_size_inches()), dpi=moviedialog.dpi, animation=moviedialog.get_animation_ranges())
+				renderer = batch.ParallelMovieRenderer(project, settings, moviedialog.get_framecount(), moviedialog.processes)
+				frames = renderer.iterframes()
+			else:
+				context.plot.relocate(newfig)
+				frames = self.iterframes_serial(drawmgr, newfig, moviedialog.get_animate_functions())
 			movie = util.FFmpegEncode(
 				temppath or finalpath,
 				moviedialog.format,
@@ -370,22 +382,14 @@ class MainWindowHandler(traitsui.Handler):
 				moviedialog.ffmpeg_options.split(),
 			)
 			stdout_cb = movie.spawnstdoutthread()
-			drawmgr.rebuild()
 			progress.update(1)
 
-			iters = tuple(i() for i in moviedialog.get_animate_functions())
-			frameiter = enumerate(itertools.izip_longest(*iters))
-			while True:
-				with drawmgr.hold():
-					try:
-						frameno, void = frameiter.next()
-					except StopIteration:
-						progress.update(progress.max-1)
-						break
-				movie.writeframe(newfig.canvas.tostring_rgb())
+			for frameno, frame in frames:
+				movie.writeframe(frame)
 				(cont, skip) = progress.update(frameno+2)
 				if not cont or skip:
 					raise UserCanceled()
+			progress.update(progress.max-1)
 			
 			ret = movie.close()	
 			if ret != 0:
@@ -417,6 +421,8 @@ class MainWindowHandler(traitsui.Handler):
 			)
 			return
 		finally:
+			if renderer:
+				renderer.close()
 			if stdout_cb:
 				stdout = stdout_cb()
 			progress.close()
@@ -434,6 +440,18 @@ class MainWindowHandler(traitsui.Handler):
 			bt=stdout
 		)
 
+	@staticmethod
+	def iterframes_serial(drawmgr, figure, animate_functions):
+		drawmgr.rebuild()
+		iters = tuple(i() for i in animate_functions)
+		frameiter = enumerate(itertools.izip_longest(*iters))
+		while True:
+			with drawmgr.hold():
+				try:
+					frameno, void = frameiter.next()
+				except StopIteration:
+					return
+			yield frameno, figure.canvas.tostring_rgb()
 
 	def do_fit(self, info):
 		mainwindow = info.ui.context['object']
@@ -467,12 +485,19 @@ class MainWindowHandler(traitsui.Handler):
 		app = info.ui.context['object']
 		progress = ProgressDialog(title="Reload", message="Reloading data", max=len(app.tabs)+1, can_cancel=True, parent=app.context.uiparent)
 		progress.open()
-		with app.drawmgr.hold():
-			for i, tab in enumerate(app.tabs):
-				tab.reload = True
-				cont, skip = progress.update(i+1)
-				if not cont or skip:
-					break
+		# parse the files of all graphs at the same time
+		for tab in app.tabs:
+			if hasattr(tab, 'prefetch_file'):
+				tab.prefetch_file()
+		try:
+			with app.drawmgr.hold():
+				for i, tab in enumerate(app.tabs):
+					tab.reload = True
+					cont, skip = progress.update(i+1)
+					if not cont or skip:
+						break
+		finally:
+			pypymanager.clear_prefetched()
 		progress.update(progress.max)
 		progress.close()
 
@@ -522,6 +547,7 @@ class Context(traits.HasTraits):
 	callbacks = traits.Instance(CallbackLoopManager, args=())
 	prefs = traits.Instance(prefs.Storage)
 	uiparent = traits.Any
+	headless = traits.Bool(False) # no user interface, see batch.BatchApp
 
 	def fork(self, **kwargs):
 		clone = copy.copy(self)
@@ -565,6 +591,9 @@ class App(traits.HasTraits):
 		# make a closure on self so figure.canvas can be changed in the meantime
 		wx.CallAfter(lambda: self.context.plot.figure.canvas.draw())
 
+	def redraw_canvas_axes(self, axes):
+		wx.CallAfter(lambda: blit_axes(self.context.plot.figure.canvas, axes))
+
 	def get_new_tab(self, klass):
 		return klass(context=self.context)
 
@@ -575,7 +604,7 @@ class App(traits.HasTraits):
 		return MainTab(context=self.context)
 
 	def _drawmgr_default(self):
-		return DrawManager(self.rebuild_figure, self.redraw_canvas)
+		return DrawManager(self.rebuild_figure, self.redraw_canvas, self.redraw_canvas_axes)
 
 	def _export_image_dialog_default(self):
 		return windows.ExportDialog(context=self.context)
@@ -583,7 +612,11 @@ class App(traits.HasTraits):
 	def _export_movie_dialog_default(self):
 		return windows.MovieDialog(context=self.context)
 
-	def _tabs_changed(self):
+	def _tabs_changed(self, old, new):
+		if isinstance(old, list): # not when the default is set
+			for tab in old:
+				if tab not in new:
+					tab.close()
 		self._tabs_modified = True
 		self.context.canvas.rebuild()
 
@@ -593,6 +626,7 @@ class App(traits.HasTraits):
 				if isinstance(removed, MainTab):
 					self.tabs.insert(0, removed)
 				else:
+					removed.close()
 					self._tabs_modified = True
 					self.context.canvas.rebuild()
 			if event.added:
@@ -624,11 +658,15 @@ class App(traits.HasTraits):
 		self.project_path = ''
 		self.clear_project_modified()
 
-	def open_project(self, path):
+	@staticmethod
+	def read_project_file(path):
 		with open(path, 'rb') as fp:
 			if fp.read(15) != 'Spacetime\nJSON\n':
 				raise ValueError('not a valid Spacetime project file')
-			data = json.load(fp)
+			return json.load(fp)
+
+	def open_project(self, path):
+		data = self.read_project_file(path)
 
 		progress = ProgressDialog(title="Open", message="Loading project", max=len(data)+1, can_cancel=False, parent=self.context.uiparent)
 		progress.open()
@@ -640,6 +678,8 @@ class App(traits.HasTraits):
 			for p, (id, props) in enumerate(data):
 				try:
 					tab = self.get_new_tab(self.moduleloader.get_class_by_id(id))
+					if hasattr(tab, 'prefetch_file') and props.get('filename'):
+						tab.prefetch_file(props['filename'])
 					tab.from_serialized(props)
 					tabs.append(tab)
 				except KeyError:
@@ -648,13 +688,18 @@ class App(traits.HasTraits):
 			self.tabs = tabs
 			self.project_path = path
 			wx.CallAfter(self.clear_project_modified)
+			wx.CallAfter(pypymanager.clear_prefetched) # after the graphs have been restored
 			wx.CallAfter(lambda: (progress.update(progress.max), progress.close()))
 
-	def save_project(self, path):
+	def get_project_data(self):
 		data = [('general', self.tabs[0].get_serialized())]
 		for tab in self.tabs:
 			if isinstance(tab, modules.generic.gui.SubplotGUI):
 				data.append((self.moduleloader.get_id_by_instance(tab), tab.get_serialized()))
+		return data
+
+	def save_project(self, path):
+		data = self.get_project_data()
 		with open(path, 'wb') as fp:
 			fp.write('Spacetime\nJSON\n')
 			json.dump(data, fp)
@@ -839,6 +884,7 @@ class App(traits.HasTraits):
 			'advanced',
 				traitsui.Action(name='&Python console...', action='do_python', image=support.GetIcon('python')),
 				traitsui.Action(name='Clear image metadata cache', action='do_clear_image_cache'),
+				traitsui.Action(name='Clear data file cache', action='do_clear_data_cache'),
 			name='&Tools',
 		),
 		traitsui.Menu(
@@ -21,6 +21,7 @@ import traitsui.api as traitsui
 
 import matplotlib.figure
 import wx
+import multiprocessing
 
 from . import support
 from .figure import MPLFigureEditor
@@ -376,6 +377,7 @@ class MovieDialogMainTab(traits.HasTraits):
 	frame_height = traits.Int(768)
 	dpi = traits.Range(low=1, high=10000000, value=72)
 	frame_rate = traits.Int(5)
+	processes = traits.Range(low=1, high=256, value=multiprocessing.cpu_count())
 
 	animation_view = traitsui.View(traitsui.Group(
 		traitsui.Group(
@@ -393,6 +395,11 @@ class MovieDialogMainTab(traits.HasTraits):
 			label='Movie options',
 			show_border=True,
 		),
+		traitsui.Group(
+			traitsui.Item('processes', tooltip='Number of processes rendering frames in parallel'),
+			label='Performance',
+			show_border=True,
+		),
 	))
 
 
@@ -407,10 +414,19 @@ class MovieDialog(support.UtilityWindow):
 	frame_height = traits.DelegatesTo('maintab')
 	dpi = traits.DelegatesTo('maintab')
 	frame_rate = traits.DelegatesTo('maintab')
+	processes = traits.DelegatesTo('maintab')
 
 	def get_animate_functions(self):
 		return tuple(getattr(tab, 'animate') for tab in self.tabs[1:])
 
+	def is_seekable(self):
+		return all(tab.animation_seekable for tab in self.tabs[1:])
+
+	def get_animation_ranges(self):
+		# (position in App.get_project_data(), first frame, last frame) for every animated graph
+		graphs = [None] + [tab for tab in self.context.app.tabs if isinstance(tab, modules.generic.gui.SubplotGUI)]
+		return [(graphs.index(tab), tab.animation_firstframe, tab.animation_lastframe) for tab in self.tabs[1:]]
+
 	def get_framecount(self):
 		return max(getattr(tab, 'animation_framecount') for tab in self.tabs[1:])
 
@@ -23,6 +23,8 @@ import PIL.Image
 import struct
 import ctypes
 import pyglet
+import multiprocessing
+import traceback
 
 from ... import util
 from . import dm3lib
@@ -82,6 +84,12 @@ class DataSource(object):
 
 class MultiTrend(DataSource):
 	channels = None
+	follow_supported = False
+
+	def follow(self):
+		# read data that has been appended to the file since loading,
+		# returns True if there is new data
+		raise NotImplementedError
 
 	def selectchannels(self, condition):
 		return SelectedMultiTrend(self, condition)
@@ -154,6 +162,11 @@ class CSV(MultiTrend):
 	time_strptime = '%Y-%m-%d %H:%M:%S'
 	time_channel_headers = set(['Time'])
 
+	follow_supported = True
+	follow_offset = 0
+	follow_pending = 0
+	follow_buffer = None
+
 	def iterchannelnames(self):
 		time_columns = self.get_time_columns()
 		return (lbl for (i, lbl) in enumerate(self.channel_labels) if i not in time_columns)
@@ -173,7 +186,7 @@ class CSV(MultiTrend):
 		if self.time_type == 'matplotlib':
 			return data
 		elif self.time_type == 'unix':
-			return numpy.fromiter((util.mpldtfromtimestamp(i) for i in data), dtype=float)
+			return util.mpldtfromtimestamp_array(data)
 		elif self.time_type == 'labview':
 			# Labview uses the number of seconds since 1-1-1904 00:00:00 UTC.
 			# mpldtfromdatetime(datetime.datetime(1904, 1, 1, 0, 0, 0, tzinfo=pytz.utc)) = 695056
@@ -231,24 +244,76 @@ class CSV(MultiTrend):
 			return []
 
 	def load(self, probe=False):
-		with util.LineCounter(self.filename) as fp:
+		# binary mode: follow_offset has to be a byte offset for follow(),
+		# also for CRLF files on Windows
+		with util.LineCounter(self.filename, 'rb') as fp:
 			self.read_header(fp)
 
-			time_columns = self.get_time_columns()
-
 			if probe:
-				fp = itertools.islice(fp, 10)
-
-			if self.time_type == 'strptime':
-				time_columns = set(time_columns)
-				self.data = numpy.array([tuple(util.mpldtstrptime(v.strip(), self.time_strptime) if i in time_columns else float(v) for (i, v) in enumerate(line.split(self.delimiter))) for line in fp])
+				self.data = self.parse(itertools.islice(fp, 10))
 			else:
-				self.data = util.loadtxt(fp, delimiter=self.delimiter)
-
-				for i in time_columns:
-					self.data[:, i] = self.convert_time(self.data[:, i])
+				self.load_following(fp)
 		self.verify_data()
 
+	def parse(self, lines):
+		time_columns = self.get_time_columns()
+		if self.time_type == 'strptime':
+			convert = lambda column: util.mpldtstrptime_array((v.strip() for v in column), self.time_strptime)
+			return util.loadtxt(lines, delimiter=self.delimiter, converters=dict((i, convert) for i in time_columns))
+		else:
+			data = util.loadtxt(lines, delimiter=self.delimiter)
+			for i in time_columns:
+				data[:, i] = self.convert_time(data[:, i])
+			return data
+
+	def load_following(self, fp):
+		# The last line might still be incomplete if the file is being written
+		# to. It is included if it can be parsed, but read again when following.
+		start = fp.tell()
+		fp.seek(0, 2)
+		self.follow_offset = util.find_line_start(fp, fp.tell())
+		fp.seek(start)
+		self.data = self.parse(util.FileHead(fp, self.follow_offset))
+		self.follow_pending = 0
+		self.follow_buffer = None
+
+		tail = fp.read()
+		if tail.strip():
+			try:
+				row = self.parse([tail])
+			except ValueError:
+				return
+			if row.shape[1] != len(self.channel_labels):
+				return
+			self.data = numpy.vstack((self.data.reshape(-1, row.shape[1]), row))
+			self.follow_pending = 1
+
+	def follow(self):
+		with open(self.filename, 'rb') as fp:
+			fp.seek(0, 2)
+			size = fp.tell()
+			if size < self.follow_offset: # the file has been replaced
+				self.load()
+				return True
+			fp.seek(self.follow_offset)
+			text = fp.read(size - self.follow_offset)
+
+		end = text.rfind('\n') + 1 # only complete lines
+		if not end:
+			return False
+		data = self.parse(text[:end].splitlines())
+
+		if self.follow_buffer is None:
+			self.follow_buffer = util.GrowableArray(self.data.shape[1:], capacity=int(1.5 * len(self.data)) + 1024)
+			self.follow_buffer.append(self.data)
+		self.follow_buffer.truncate(len(self.follow_buffer) - self.follow_pending)
+		if len(data):
+			self.follow_buffer.append(data)
+		self.data = self.follow_buffer.array
+		self.follow_offset += end
+		self.follow_pending = 0
+		return True
+
 
 class CustomCSV(CSV):
 	def __init__(self, filename):
@@ -293,6 +358,33 @@ class RGBImage(DataSource):
 		raise NotImplementedError
 
 
+def _probe_timeinfo(filename):
+	# for use with multiprocessing.Pool, returns (timeinfo, None) or (None, traceback)
+	try:
+		return RGBImage.autodetect_timeinfo(filename), None
+	except:
+		return None, traceback.format_exc()
+
+
+def probe_timeinfo(filenames, processes=None, chunksize=16, min_parallel=64):
+	# RGBImage.autodetect_timeinfo() for many files, in worker processes if
+	# there are enough of them and they can be started (see
+	# util.can_spawn_processes). Yields (timeinfo, traceback) in the order of
+	# filenames, as soon as the results are in.
+	if len(filenames) < min_parallel or multiprocessing.current_process().daemon or not util.can_spawn_processes(): # daemonic processes cannot have children
+		for result in itertools.imap(_probe_timeinfo, filenames):
+			yield result
+		return
+
+	pool = multiprocessing.Pool(processes)
+	try:
+		for result in pool.imap(_probe_timeinfo, filenames, chunksize):
+			yield result
+	finally:
+		pool.terminate()
+		pool.join()
+
+
 # utility functions for TVIPS TemData header parsing
 def _read_long(fp):
 	return struct.unpack('<l', fp.read(4))[0]
@@ -359,26 +451,42 @@ class DM3Image(DM3Scaling, RGBImage):
 		self.dm3 = dm3lib.DM3(self.filename)
 		return self.dm3.getImageData() 
 
-	@staticmethod
-	def get_timeinfo(filename):
-		dm3 = dm3lib.DM3(filename)
-		date = dm3.tags['root.ImageList.1.ImageTags.DataBar.Acquisition Date']
-		time = dm3.tags['root.ImageList.1.ImageTags.DataBar.Acquisition Time']
+	timeinfo_tags = (
+		'root.ImageList.1.ImageTags.DataBar.Acquisition Date',
+		'root.ImageList.1.ImageTags.DataBar.Acquisition Time',
+		'root.ImageList.1.ImageTags.Acquisition.Parameters.High Level.Exposure (s)',
+	)
+
+	@classmethod
+	def get_timeinfo(cls, filename):
+		# stops parsing as soon as the timing tags are found
+		dm3 = dm3lib.DM3(filename, tags=cls.timeinfo_tags)
+		date, time, exposure = (dm3.tags[tag] for tag in cls.timeinfo_tags)
 		timestamp = util.mpldtstrptime('{0} {1}'.format(date, time), '%m/%d/%Y %I:%M:%S %p')
-		exposure = float(dm3.tags['root.ImageList.1.ImageTags.Acquisition.Parameters.High Level.Exposure (s)']) * 1e3
-		return timestamp, exposure
+		return timestamp, float(exposure) * 1e3
 
 	def is_greyscale(self):
 		return True
 
 
+def bin2d(image, factor):
+	# averages blocks of factor x factor pixels, incomplete blocks at the edges are dropped
+	height, width = image.shape[0] // factor * factor, image.shape[1] // factor * factor
+	return image[:height, :width].reshape(height // factor, factor, width // factor, factor).mean(axis=(1, 3), dtype=numpy.float32)
+
+
 class DM3Stack(DataSource, DM3Scaling):
 	frameno = 0
+	binning = 1 # average blocks of binning x binning pixels, for previewing
+	frame_cache_bytes = 256 * 1024 * 1024
 
 	def __init__(self, *args, **kwargs):
 		super(DM3Stack, self).__init__(*args, **kwargs)
 		self.dm3 = dm3lib.DM3(self.filename)
-		self.framecount = int(self.dm3.tags['root.ImageList.1.ImageData.Dimensions.2'])
+		# all frames as a single view of the memory mapped file, frames are only read when used
+		self.stack = self.dm3.getStackView()
+		self.framecount = self.stack.shape[0]
+		self.framecache = util.LRUCache(self.frame_cache_bytes)
 
 	def set_settings(self, frameno, tstart, exposure, delay):
 		# unfortunately, there is no timing info embedded in these files...
@@ -387,10 +495,38 @@ class DM3Stack(DataSource, DM3Scaling):
 		self.exposure = exposure
 		self.delay = delay
 
-	def iterframes(self):
-		tstart = self.tstart + self.frameno * (self.exposure + self.delay)
+	def get_scale(self):
+		scale = super(DM3Stack, self).get_scale()
+		scale['pixelsize'] *= self.binning
+		return scale
+
+	def getimage(self, frameno, binning=None):
+		# thread-safe, for reading ahead in the background
+		if binning is None:
+			binning = self.binning
+		return self.framecache.get((frameno, binning), lambda: self.readimage(frameno, binning))
+
+	def readimage(self, frameno, binning):
+		image = self.stack[frameno]
+		if binning > 1:
+			image = bin2d(image, binning)
+		else:
+			# always a copy: a view of the memory map would leave the actual
+			# reading to whoever draws the frame, also when read ahead
+			image = numpy.array(image, dtype=numpy.float32)
+		image.flags.writeable = False # shared by everyone who gets it from the cache
+		return image
+
+	def getframe(self, frameno):
+		tstart = self.tstart + frameno * (self.exposure + self.delay)
 		tend = tstart + self.exposure
-		yield ImageFrame(image=self.dm3.getImageData(self.frameno), tstart=tstart, tend=tend, **self.get_scale())
+		return ImageFrame(image=self.getimage(frameno), tstart=tstart, tend=tend, **self.get_scale())
+
+	def iterframes(self):
+		yield self.getframe(self.frameno)
+
+	def iterframerange(self, first, last, step=1):
+		return (self.getframe(i) for i in xrange(max(0, first), min(last + 1, self.framecount), step))
 
 
 class AveragedImage(DataSource):
@@ -423,6 +559,128 @@ class AveragedImage(DataSource):
 		yield self.imageframe
 
 
+class SingleFrame(DataSource):
+	def __init__(self, imageframe):
+		self.imageframe = imageframe
+
+	def iterframes(self):
+		yield self.imageframe
+
+
+class RunningAverage(object):
+	# Average of a window of greyscale frames that can be moved around
+	# cheaply. Frames are identified by arbitrary keys, loader(key) returns
+	# the ImageFrame. In 'mean' mode a float64 sum is kept, so moving the
+	# window by one frame costs adding one frame and subtracting another
+	# (reloaded through loader, which is expected to cache). The 'median' and
+	# 'sigma clipped' modes need all frames at once and keep them in a ring
+	# buffer of at most max_bytes.
+	modes = 'mean', 'median', 'sigma clipped'
+	sigma = 3.
+	sigma_iterations = 3
+	max_bytes = 1024 * 1024 * 1024
+	resync_interval = 100 # recompute the sum from scratch every so many updates, against rounding errors
+
+	def __init__(self, loader):
+		self.loader = loader
+		self.reset()
+
+	def reset(self):
+		self.mode = None
+		self.keys = []
+		self.meta = {}
+		self.shape = None
+		self.sum = None
+		self.ring = None
+		self.slots = {}
+		self.updates = 0
+		self.result = None
+
+	def load(self, key):
+		frame = self.loader(key)
+		if frame.image.ndim != 2:
+			raise ValueError('cannot average: not all images are greyscale')
+		if self.shape is None:
+			self.shape = frame.image.shape
+		elif frame.image.shape != self.shape:
+			raise ValueError('cannot average: not all images have the same shape')
+		self.meta[key] = frame.tstart, frame.tend, frame.pixelsize, frame.pixelunit
+		return frame.image
+
+	def get(self, keys, mode='mean'):
+		# returns a DataSource with the average of the frames identified by keys
+		if mode not in self.modes:
+			raise ValueError('unknown averaging mode {0!r}'.format(mode))
+		keys = list(keys)
+		if mode == self.mode and keys == self.keys and self.result:
+			return self.result
+
+		try:
+			if mode != self.mode or len(keys) != len(self.keys) or self.updates >= self.resync_interval:
+				self.reset()
+			self.mode = mode
+			if mode == 'mean':
+				image = self.update_sum(keys)
+			else:
+				image = self.update_ring(keys)
+		except:
+			self.reset()
+			raise
+		self.keys = keys
+		self.updates += 1
+
+		meta = [self.meta[key] for key in keys]
+		self.meta = dict(zip(keys, meta))
+		tstart = min(m[0] for m in meta)
+		tend = max(m[1] for m in meta)
+		pixelsize, pixelunit = (set(i) for i in zip(*meta)[2:])
+		self.result = SingleFrame(ImageFrame(
+			image=image, tstart=tstart, tend=tend,
+			pixelsize=pixelsize.pop() if len(pixelsize) == 1 else None,
+			pixelunit=pixelunit.pop() if len(pixelunit) == 1 else None,
+		))
+		return self.result
+
+	def update_sum(self, keys):
+		removed = set(self.keys).difference(keys)
+		added = [key for key in keys if key not in self.keys]
+		if self.sum is None or len(removed) + len(added) >= len(keys):
+			self.updates = 0
+			self.sum = numpy.array(self.load(keys[0]), dtype=numpy.float64)
+			added = keys[1:]
+		else:
+			for key in removed:
+				self.sum -= self.load(key)
+		for key in added:
+			self.sum += self.load(key)
+		return self.sum / len(keys)
+
+	def update_ring(self, keys):
+		if self.ring is None:
+			shape = self.load(keys[0]).shape
+			if len(keys) * shape[0] * shape[1] * 8 > self.max_bytes:
+				raise ValueError('cannot average: too many frames for {0}'.format(self.mode))
+			self.ring = numpy.empty((len(keys),) + shape)
+			free = range(len(keys))
+		else:
+			free = [self.slots.pop(key) for key in set(self.keys).difference(keys)]
+		for key in keys:
+			if key not in self.slots:
+				slot = self.slots[key] = free.pop()
+				self.ring[slot] = self.load(key)
+
+		if self.mode == 'median':
+			return numpy.median(self.ring, axis=0)
+		data = numpy.ma.array(self.ring)
+		for i in range(self.sigma_iterations):
+			mean, std = data.mean(axis=0), data.std(axis=0)
+			outliers = abs(data - mean) > self.sigma * std
+			if not outliers.any():
+				break
+			data = numpy.ma.array(data, mask=outliers.filled(False) | numpy.ma.getmaskarray(data))
+		return data.mean(axis=0).filled(numpy.nan)
+
+
 class Video(DataSource):
 	frameno = 0
 
@@ -12,96 +12,30 @@
 ## --
 ## for Spacetime: based on version 0.99 obtained November 2012 from
 ## http://imagejdocu.tudor.lu/doku.php?id=plugin:utilities:python_dm3_reader:start
+## --
+## rewritten for Spacetime: single pass over a memory mapped file, large
+## arrays are only recorded by offset and size, image data is returned as
+## numpy arrays that refer directly into the file
 ################################################################################
 
 import os, time
+import mmap
 import struct
 from PIL import Image
 import numpy
 
 __all__ = ["DM3","version"]
 
-version='0.99beta'
-
-debugLevel = 0   # 0=none, 1-3=basic, 4-5=simple, 6-10 verbose
+version='0.99beta-spacetime'
 
 
 class DM3Exception(Exception):
 	pass
 
 
-### utility fuctions ###
-# Image to Array
-def im2ar( im ):
-	if im.mode in ('L','I','F'):
-		# Warning: only works with PIL.Image.Image whose mode is 'L', 'I' or 'F'
-		#          => error if mode == 'I;16' for instance
-		return numpy.array(im)
-	raise DM3Exception('invalid mode for conversion of PIL Image to array')
-
-
-### binary data reading functions ###
-
-def readLong(f):
-	'''Read 4 bytes as integer in file f'''
-	read_bytes = f.read(4)
-	return struct.unpack('>l', read_bytes)[0]
-
-def readShort(f):
-	'''Read 2 bytes as integer in file f'''
-	read_bytes = f.read(2)
-	return struct.unpack('>h', read_bytes)[0]
-
-def readByte(f):
-	'''Read 1 byte as integer in file f'''
-	read_bytes = f.read(1)
-	return struct.unpack('>b', read_bytes)[0]
-
-def readBool(f):
-	'''Read 1 byte as boolean in file f'''
-	read_val = readByte(f)
-	return (read_val!=0)
-
-def readChar(f):
-	'''Read 1 byte as char in file f'''
-	read_bytes = f.read(1)
-	return struct.unpack('c', read_bytes)[0]
-
-def readString(f, len=1):
-	'''Read len bytes as a string in file f'''
-	read_bytes = f.read(len)
-	str_fmt = '>'+str(len)+'s'
-	return struct.unpack( str_fmt, read_bytes )[0]
-
-def readLEShort(f):
-	'''Read 2 bytes as *little endian* integer in file f'''
-	read_bytes = f.read(2)
-	return struct.unpack('<h', read_bytes)[0]
-
-def readLELong(f):
-	'''Read 4 bytes as *little endian* integer in file f'''
-	read_bytes = f.read(4)
-	return struct.unpack('<l', read_bytes)[0]
-
-def readLEUShort(f):
-	'''Read 2 bytes as *little endian* unsigned integer in file f'''
-	read_bytes = f.read(2)
-	return struct.unpack('<H', read_bytes)[0]
-
-def readLEULong(f):
-	'''Read 4 bytes as *little endian* unsigned integer in file f'''
-	read_bytes = f.read(4)
-	return struct.unpack('<L', read_bytes)[0]
-
-def readLEFloat(f):
-	'''Read 4 bytes as *little endian* float in file f'''
-	read_bytes = f.read(4)
-	return struct.unpack('<f', read_bytes)[0]
-
-def readLEDouble(f):
-	'''Read 8 bytes as *little endian* double in file f'''
-	read_bytes = f.read(8)
-	return struct.unpack('<d', read_bytes)[0]
+class _Done(Exception):
+	# raised internally when all requested tags have been found
+	pass
 
 
 ## constants for encoded data types ##
@@ -118,265 +52,164 @@ STRUCT = 15
 STRING = 18
 ARRAY = 20
 
-# - association data type <--> reading function
-readFunc = {
-	SHORT: readLEShort,
-	LONG: readLELong,
-	USHORT: readLEUShort,
-	ULONG: readLEULong,
-	FLOAT: readLEFloat,
-	DOUBLE: readLEDouble,
-	BOOLEAN: readBool,
-	CHAR: readChar,
-	OCTET: readChar,    # difference with char???
+# - little endian decoders and sizes for the native data types
+nativeTypes = {
+	SHORT: struct.Struct('<h'),
+	LONG: struct.Struct('<l'),
+	USHORT: struct.Struct('<H'),
+	ULONG: struct.Struct('<L'),
+	FLOAT: struct.Struct('<f'),
+	DOUBLE: struct.Struct('<d'),
+	BOOLEAN: struct.Struct('<b'),
+	CHAR: struct.Struct('c'),
+	OCTET: struct.Struct('c'),
+}
+
+# - the tag structure itself is big endian
+beLong = struct.Struct('>l')
+beShort = struct.Struct('>h')
+
+# - image DataType <--> numpy dtype
+# NOTE: see Gwyddion's dm3file.c for the complete list of data types
+imageTypes = {
+	1: '<i2',  # 16-bit signed integer
+	2: '<f4',  # 32-bit float
+	6: 'u1',   # 8-bit unsigned integer
+	7: '<i4',  # 32-bit signed integer
+	9: 'i1',   # 8-bit signed integer
+	10: '<u2', # 16-bit unsigned integer
+	11: '<u4', # 32-bit unsigned integer
+	12: '<f8', # 64-bit float
 }
 
 ## other constants ##
 IMGLIST = "root.ImageList."
 OBJLIST = "root.DocumentObjectList."
-MAXDEPTH = 64
 
 ## END constants ##
 
 
-class DM3(object):
-	## utility functions
-	def __makeGroupString(self):
-		tString = self.__curGroupAtLevelX[0]
-		for i in range( 1, self.__curGroupLevel+1 ):
-			tString += '.' + self.__curGroupAtLevelX[i]
-		return tString
-
-	def __makeGroupNameString(self):
-		tString = self.__curGroupNameAtLevelX[0]
-		for i in range( 1, self.__curGroupLevel+1 ):
-			tString += '.' + str( self.__curGroupNameAtLevelX[i] )
-		return tString
-
-	def __readTagGroup(self):
-		# go down a level
-		self.__curGroupLevel += 1
-		# increment group counter
-		self.__curGroupAtLevelX[self.__curGroupLevel] += 1
-		# set number of current tag to -1 --- readTagEntry() pre-increments => first gets 0
-		self.__curTagAtLevelX[self.__curGroupLevel] = -1
-		if ( debugLevel > 5):
-			print "rTG: Current Group Level:", self.__curGroupLevel
-		# is the group sorted?
-		sorted = readByte(self.__f)
-		isSorted = (sorted == 1)
-		# is the group open?
-		opened = readByte(self.__f)
-		isOpen = (opened == 1)
-		# number of Tags
-		nTags = readLong(self.__f)
-		if ( debugLevel > 5):
-			print "rTG: Iterating over the", nTags, "tag entries in this group"
-		# read Tags
-		for i in range( nTags ):
-			self.__readTagEntry()
-		# go back up one level as reading group is finished
-		self.__curGroupLevel += -1
-		return 1
+def encodedTypeSize(eT):
+	# returns the size in bytes of the data type, 0 for type 0 and -1 for unrecognised types
+	if eT == 0:
+		return 0
+	elif eT in nativeTypes:
+		return nativeTypes[eT].size
+	return -1
 
-	def	__readTagEntry(self):
-		# is data or a new group?
-		data = readByte(self.__f)
-		isData = (data == 21)
-		self.__curTagAtLevelX[self.__curGroupLevel] += 1
-		# get tag label if exists
-		lenTagLabel = readShort(self.__f)
-		if ( lenTagLabel != 0 ):
-			tagLabel = readString(self.__f, lenTagLabel)
-		else:
-			tagLabel = str( self.__curTagAtLevelX[self.__curGroupLevel] )
-		if ( debugLevel > 5):
-			print str(self.__curGroupLevel)+"|"+__makeGroupString()+": Tag label = "+tagLabel
-		elif ( debugLevel > 0 ):
-			print str(self.__curGroupLevel)+": Tag label = "+tagLabel
-		if isData:
-			# give it a name
-			self.__curTagName = self.__makeGroupNameString()+"."+tagLabel
-			# read it
-			self.__readTagType()
-		else:
-			# it is a tag group
-			self.__curGroupNameAtLevelX[self.__curGroupLevel+1] = tagLabel
-			self.__readTagGroup()  # increments curGroupLevel
-		return 1
 
-	def __readTagType(self):
-		delim = readString(self.__f, 4)
-		if ( delim != "%%%%" ):
-			raise DM3Exception(hex( self.__f.tell() )+": Tag Type delimiter not %%%%")
-		nInTag = readLong(self.__f)
-		self.__readAnyData()
-		return 1
+class DM3(object):
+	## parser, every method takes the position in the buffer and returns the position after what it has read
+
+	def __readLong(self, pos):
+		return beLong.unpack_from(self.__buf, pos)[0]
+
+	def __readTagGroup(self, pos, groupName):
+		# skip the sorted and open flags
+		nTags = self.__readLong(pos + 2)
+		pos += 6
+		for i in xrange(nTags):
+			pos = self.__readTagEntry(pos, groupName, i)
+		return pos
+
+	def __readTagEntry(self, pos, groupName, index):
+		isData = (self.__buf[pos] == '\x15') # 21, else it is a tag group
+		lenTagLabel = beShort.unpack_from(self.__buf, pos + 1)[0]
+		pos += 3
+		if lenTagLabel != 0:
+			tagLabel = self.__buf[pos:pos+lenTagLabel]
+			pos += lenTagLabel
+		else:
+			tagLabel = str(index)
 
-	def __encodedTypeSize(self, eT):
-		# returns the size in bytes of the data type
-		if eT == 0:
-			width = 0
-		elif eT in (BOOLEAN, CHAR, OCTET):
-			width = 1
-		elif eT in (SHORT, USHORT):
-			width = 2
-		elif eT in (LONG, ULONG, FLOAT):
-			width = 4
-		elif eT == DOUBLE:
-			width = 8
+		if isData:
+			return self.__readTagType(pos, groupName + '.' + tagLabel)
 		else:
-			# returns -1 for unrecognised types
-			width=-1
-		return width
-
-	def __readAnyData(self):
-		## higher level function dispatching to handling data types to other functions
-		# - get Type category (short, long, array...)
-		encodedType = readLong(self.__f)
-		# - calc size of encodedType
-		etSize = self.__encodedTypeSize(encodedType)
-		if ( debugLevel > 5):
-			print "rAnD, " + hex( f.tell() ) + ": Tag Type = " + str(encodedType) +  ", Tag Size = " + str(etSize)
-		if ( etSize > 0 ):
-			self.__storeTag( self.__curTagName, self.__readNativeData(encodedType, etSize) )
-		elif ( encodedType == STRING ):
-			stringSize = readLong(self.__f)
-			self.__readStringData(stringSize)
-		elif ( encodedType == STRUCT ):
+			return self.__readTagGroup(pos, groupName + '.' + tagLabel)
+
+	def __readTagType(self, pos, tagName):
+		if self.__buf[pos:pos+4] != "%%%%":
+			raise DM3Exception(hex(pos) + ": Tag Type delimiter not %%%%")
+		# skip the number of type descriptors
+		return self.__readAnyData(pos + 8, tagName)
+
+	def __readAnyData(self, pos, tagName):
+		encodedType = self.__readLong(pos)
+		pos += 4
+		etSize = encodedTypeSize(encodedType)
+		if etSize > 0:
+			self.__storeTag(tagName, self.__readNativeData(pos, encodedType))
+			return pos + etSize
+		elif encodedType == STRING:
+			stringSize = self.__readLong(pos)
+			pos += 4
+			self.__storeTag(tagName, self.__readStringData(pos, stringSize))
+			return pos + max(stringSize, 0)
+		elif encodedType == STRUCT:
 			# does not store tags yet
-			structTypes = self.__readStructTypes()
-			self.__readStructData(structTypes)
-		elif ( encodedType == ARRAY ):
-			# does not store tags yet
-			# indicates size of skipped data blocks
-			arrayTypes = self.__readArrayTypes()
-			self.__readArrayData(arrayTypes)
-		else:
-			raise DM3Exception("rAnD, " + hex(self.__f.tell()) + ": Can't understand encoded type")
-		return 1
-	
-	def __readNativeData(self, encodedType, etSize):
-		# reads ordinary data types
-		if encodedType in readFunc.keys():
-			val = readFunc[encodedType](self.__f)
+			structTypes, pos = self.__readStructTypes(pos)
+			for encodedType in structTypes:
+				etSize = encodedTypeSize(encodedType)
+				if etSize <= 0:
+					raise DM3Exception(hex(pos) + ": Unknown data type " + str(encodedType))
+				pos += etSize
+			return pos
+		elif encodedType == ARRAY:
+			arrayTypes, pos = self.__readArrayTypes(pos)
+			return self.__readArrayData(pos, tagName, arrayTypes)
 		else:
-			raise DM3Exception("rND, " + hex(self.__f.tell()) + ": Unknown data type " + str(encodedType))
-		if ( debugLevel > 3 ):
-			print "rND, " + hex(self.__f.tell()) + ": " + str(val)
-		elif ( debugLevel > 0 ):
-			print val
+			raise DM3Exception(hex(pos) + ": Can't understand encoded type")
+
+	def __readNativeData(self, pos, encodedType):
+		val = nativeTypes[encodedType].unpack_from(self.__buf, pos)[0]
+		if encodedType == BOOLEAN:
+			return val != 0
 		return val
 
-	def __readStringData(self, stringSize):
-		# reads string data
-		if ( stringSize <= 0 ):
-			rString = ""
-		else:
-			if ( debugLevel > 3 ):
-				print "rSD @ " + str(f.tell()) + "/" + hex(f.tell()) +" :",
-			## !!! *Unicode* string (UTF-16)... convert to Python unicode str
-			rString = readString(self.__f, stringSize)
-			rString = unicode(rString, "utf_16_le")
-			if ( debugLevel > 3 ):
-				print rString + "   <"  + repr( rString ) + ">"
-		if ( debugLevel > 0 ):
-			print "StringVal:", rString
-		self.__storeTag( self.__curTagName, rString )
-		return rString
-	
-	def __readArrayTypes(self):
+	def __readStringData(self, pos, stringSize):
+		## !!! *Unicode* string (UTF-16)... convert to Python unicode str
+		if stringSize <= 0:
+			return ""
+		return unicode(self.__buf[pos:pos+stringSize], "utf_16_le")
+
+	def __readArrayTypes(self, pos):
 		# determines the data types in an array data type
-		arrayType = readLong(self.__f)
-		itemTypes=[]
-		if ( arrayType == STRUCT ):
-			itemTypes = self.__readStructTypes()
-		elif ( arrayType == ARRAY ):
-			itemTypes = self.__readArrayTypes()
+		arrayType = self.__readLong(pos)
+		pos += 4
+		if arrayType == STRUCT:
+			return self.__readStructTypes(pos)
+		elif arrayType == ARRAY:
+			return self.__readArrayTypes(pos)
 		else:
-			itemTypes.append( arrayType )
-		return itemTypes
-
-	def __readArrayData(self, arrayTypes):
-		# reads array data
-		
-		arraySize = readLong(self.__f)
-		
-		if ( debugLevel > 3 ):
-			print "rArD, " + hex( f.tell() ) + ": Reading array of size = " + str(arraySize)
-		
-		itemSize = 0
-		encodedType = 0
-		
-		for i in range( len(arrayTypes) ):
-			encodedType = int( arrayTypes[i] )
-			etSize = self.__encodedTypeSize(encodedType)
-			itemSize += etSize
-			if ( debugLevel > 5 ):
-				print "rArD: Tag Type = " + str(encodedType) + ", Tag Size = " + str(etSize)
-			##! readNativeData( encodedType, etSize ) !##
-		
-		if ( debugLevel > 5 ):
-			print "rArD: Array Item Size = " + str(itemSize)
-	
+			return [arrayType], pos
+
+	def __readArrayData(self, pos, tagName, arrayTypes):
+		arraySize = self.__readLong(pos)
+		pos += 4
+		itemSize = sum(encodedTypeSize(int(eT)) for eT in arrayTypes)
 		bufSize = arraySize * itemSize
-		
-		if ( (not self.__curTagName.endswith("ImageData.Data"))
-				and  ( len(arrayTypes) == 1 )
-				and  ( encodedType == USHORT )
-				and  ( arraySize < 256 ) ):
+
+		if (not tagName.endswith("ImageData.Data")
+				and len(arrayTypes) == 1
+				and arrayTypes[0] == USHORT
+				and arraySize < 256):
 			# treat as string
-			val = self.__readStringData( bufSize )
+			self.__storeTag(tagName, self.__readStringData(pos, bufSize))
 		else:
-			# treat as binary data
-			# - store data size and offset as tags
-			self.__storeTag( self.__curTagName + ".Size", bufSize )
-			self.__storeTag( self.__curTagName + ".Offset", self.__f.tell() )
-			# - skip data w/o reading
-			self.__f.seek( self.__f.tell() + bufSize )
-		
-		return 1
+			# treat as binary data: store data size and offset as tags, skip data w/o reading
+			self.__storeTag(tagName + ".Size", bufSize)
+			self.__storeTag(tagName + ".Offset", pos)
+		return pos + bufSize
+
+	def __readStructTypes(self, pos):
+		# analyses data types in a struct: name length, number of fields, and (name length, type) per field
+		nFields = self.__readLong(pos + 4)
+		if nFields > 100:
+			raise DM3Exception(hex(pos)+": Too many fields")
+		pos += 8
+		fieldTypes = [self.__readLong(pos + 8*i + 4) for i in xrange(nFields)]
+		return fieldTypes, pos + 8 * nFields
 
-	def __readStructTypes(self):
-		# analyses data types in a struct
-		
-		if ( debugLevel > 3 ):
-			print "Reading Struct Types at Pos = " + hex(self.__f.tell())
-	
-		structNameLength = readLong(self.__f)
-		nFields = readLong(self.__f)
-	
-		if ( debugLevel > 5 ):
-			print "nFields = ", nFields
-	
-		if ( nFields > 100 ):
-			raise DM3Exception(hex(self.__f.tell())+": Too many fields")
-		
-		fieldTypes = []
-		nameLength = 0
-		for i in range( nFields ):
-			nameLength = readLong(self.__f)
-			if ( debugLevel > 9 ):
-				print i + "th namelength = " + nameLength
-			fieldType = readLong(self.__f)
-			fieldTypes.append( fieldType )
-	
-		return fieldTypes
-
-	def __readStructData(self, structTypes):
-		# reads struct data based on type info in structType
-		for i in range( len(structTypes) ):
-			encodedType = structTypes[i]
-			etSize = self.__encodedTypeSize(encodedType)
-	
-			if ( debugLevel > 5 ):
-				print "Tag Type = " + str(encodedType) + ", Tag Size = " + str(etSize)
-	
-			# get data
-			self.__readNativeData(encodedType, etSize)
-		
-		return 1
-	
 	def __storeTag(self, tagName, tagValue):
 		# NB: all tag values (and names) stored as unicode objects;
 		#     => can then be easily converted to any encoding
@@ -384,70 +217,55 @@ class DM3(object):
 		tagName = unicode(tagName, 'latin-1')
 		# - convert tag value to unicode if not already unicode object (as for string data)
 		tagValue = unicode(tagValue)
-		# store Tags as list and dict
-		self.__storedTags.append( tagName + " = " + tagValue )
+		if self.__storedTags is not None:
+			self.__storedTags.append(tagName + " = " + tagValue)
 		self.__tagDict[tagName] = tagValue
-		
-	### END utility functions ###
-	
-	def __init__(self, filename, dump=False, dump_dir='/tmp', debug=0):
-		'''DM3 object: parses DM3 file and extracts Tags; dumps Tags in a txt file if dump==True.'''
-		
-		## initialize variables ##
+		if self.__wanted is not None:
+			self.__wanted.discard(tagName)
+			if not self.__wanted:
+				raise _Done
+
+	### END parser ###
+
+	def __init__(self, filename, dump=False, dump_dir='/tmp', debug=0, tags=None):
+		'''DM3 object: parses DM3 file and extracts Tags; dumps Tags in a txt file if dump==True.
+		If tags is given, parsing stops as soon as all of these tags have been found.'''
 		self.debug = debug
 		self.__filename = filename
-		self.__chosenImage = 1
-		# - track currently read group
-		self.__curGroupLevel = -1
-		self.__curGroupAtLevelX = [ 0 for x in range(MAXDEPTH) ]
-		self.__curGroupNameAtLevelX = [ '' for x in range(MAXDEPTH) ]
-		# - track current tag
-		self.__curTagAtLevelX = [ '' for x in range(MAXDEPTH) ]
-		self.__curTagName = ''
-		# - open file for reading
-		self.__f = open( self.__filename, 'rb' )
-		# - create Tags repositories
-		self.__storedTags = []
 		self.__tagDict = {}
-		
+		self.__storedTags = [] if dump else None
+		self.__wanted = set(tags) if tags is not None else None
+
+		with open(self.__filename, 'rb') as f:
+			try:
+				# the map stays open as long as this object or any array obtained from it exists
+				self.__buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+			except (ValueError, mmap.error): # empty file
+				raise DM3Exception("%s does not appear to be a DM3 file."%os.path.split(self.__filename)[1])
+
 		if self.debug>0:
 			t1 = time.time()
-		isDM3 = True
-		## read header (first 3 4-byte int)
-		# get version
-		fileVersion = readLong(self.__f)
-		if ( fileVersion != 3 ):
-			isDM3 = False
-		# get indicated file size
-		fileSize = readLong(self.__f)
-		# get byte-ordering
-		lE = readLong(self.__f)
-		littleEndian = (lE == 1)
-		if not littleEndian:
-			isDM3 = False
-		# check file header, raise Exception if not DM3
-		if not isDM3:
+
+		## read header (first 3 4-byte int): version, indicated file size, byte ordering
+		if len(self.__buf) < 16:
+			raise DM3Exception("%s does not appear to be a DM3 file."%os.path.split(self.__filename)[1])
+		fileVersion, fileSize, lE = struct.unpack_from('>lll', self.__buf, 0)
+		if fileVersion != 3 or lE != 1:
 			raise DM3Exception("%s does not appear to be a DM3 file."%os.path.split(self.__filename)[1])
-		elif self.debug > 0:
-			print "%s appears to be a DM3 file"%(self.__filename)
-		
-		if ( debugLevel > 5 or self.debug > 1):
-			print "Header info.:"
-			print "- file version:", fileVersion
-			print "- lE:", lE
-			print "- file size:", fileSize, "bytes"
-
-		# set name of root group (contains all data)...
-		self.__curGroupNameAtLevelX[0] = "root"
-		# ... then read it
-		self.__readTagGroup()
-		if self.debug > 0:
-			print "-- %s Tags read --"%len(self.__storedTags)
-		
+
+		# read root group (contains all data)
+		try:
+			self.__readTagGroup(12, "root")
+		except _Done:
+			pass
+		except struct.error:
+			raise DM3Exception("%s is truncated or corrupt."%os.path.split(self.__filename)[1])
+
 		if self.debug>0:
 			t2 = time.time()
+			print "-- %s Tags read --"%len(self.__tagDict)
 			print "| parse DM3 file: %.3g s"%(t2-t1)
-		
+
 		# dump Tags in txt file if requested
 		if dump:
 			dump_file = os.path.join(dump_dir, os.path.split(self.__filename)[1]+".tagdump.txt")
@@ -456,9 +274,9 @@ class DM3(object):
 			except:
 				print "Warning: cannot generate dump file."
 			else:
-				for tag in self.__storedTags:
-					dumpf.write( tag.encode('latin-1') + "\n" )
-				dumpf.close
+				with dumpf:
+					for tag in self.__storedTags:
+						dumpf.write( tag.encode('latin-1') + "\n" )
 
 	def getFilename(self):
 		return self.__filename
@@ -469,9 +287,8 @@ class DM3(object):
 	tags = property(getTags)
 
 	def getInfo(self, info_charset='latin1'):
-		'''Extracts useful experiment info from DM3 file and
-		exports thumbnail to a PNG file if 'make_tn' set to 'True'.'''
-		
+		'''Extracts useful experiment info from DM3 file.'''
+
 		# define useful information
 		info_keys = {
 			'descrip': 'root.ImageList.1.Description',
@@ -498,49 +315,43 @@ class DM3(object):
 		return infoDict
 
 	info = property(getInfo)
-	
-	def getThumbnail(self, asDict=False):
-		'''Returns thumbnail as Image or dict.'''
-		# get thumbnail
+
+	def __getArray(self, offset, dtype, count):
+		if offset < 0 or offset + numpy.dtype(dtype).itemsize * count > len(self.__buf):
+			raise DM3Exception("%s is truncated: image data beyond end of file."%os.path.split(self.__filename)[1])
+		# read-only, as the map is
+		return numpy.frombuffer(self.__buf, dtype=dtype, count=count, offset=offset)
+
+	def getThumbnailData(self):
+		'''Returns thumbnail data as numpy.array (uint8)'''
 		tn_size = int( self.tags['root.ImageList.0.ImageData.Data.Size'] )
 		tn_offset = int( self.tags['root.ImageList.0.ImageData.Data.Offset'] )
 		tn_width = int( self.tags['root.ImageList.0.ImageData.Dimensions.0'] )
 		tn_height = int( self.tags['root.ImageList.0.ImageData.Dimensions.1'] )
-			
-		if self.debug > 0:
-			print "Notice: tn data in %s starts at %s"%(os.path.split(self.__filename)[1], hex(tn_offset))
-			print "Notice: tn size: %sx%s px"%(tn_width,tn_height)
-			
-		sizeError = False
+
 		if (tn_width*tn_height*4) != tn_size:
 			raise DM3Exception("Cannot extract thumbnail from %s"%os.path.split(self.__filename)[1])
-		else:
-			self.__f.seek( tn_offset )
-			rawdata = self.__f.read(tn_size)
-			# - read as 16-bit LE unsigned integer
-			tn = Image.fromstring( 'F', (tn_width,tn_height), rawdata, 'raw', 'F;32' )
-			# - rescale and convert px data
-			tn = tn.point(lambda x: x * (1./65536) + 0)
-			tn = tn.convert('L')
-		
+		# - 32-bit LE unsigned integer, rescaled to 8 bits
+		tn = self.__getArray(tn_offset, '<u4', tn_width * tn_height).reshape(tn_height, tn_width)
+		return numpy.clip(tn * (1./65536), 0, 255).astype(numpy.uint8)
+
+	thumbnaildata = property(getThumbnailData)
+
+	def getThumbnail(self, asDict=False):
+		'''Returns thumbnail as Image or dict.'''
+		tn = Image.fromarray(self.getThumbnailData(), 'L')
 		if asDict:
 			# - fill tnDict
 			tnDict = {}
 			tnDict['size'] = tn.size
 			tnDict['mode'] = tn.mode
-			tnDict['rawdata'] = tn.tostring()
+			tnDict['rawdata'] = tn.tobytes()
 			return tnDict
 		else:
 			return tn
 
 	thumbnail = property(getThumbnail)
 
-	def getThumbnailData(self):
-		'''Returns thumbnail data as numpy.array'''
-		return im2ar(self.thumbnail)
-
-	thumbnaildata = property(getThumbnailData)
-	
 	def makePNGThumbnail(self, tn_file=''):
 		'''Save thumbnail as PNG file.'''
 		# - cleanup name
@@ -559,70 +370,56 @@ class DM3(object):
 		except:
 			print "Warning: could not save thumbnail."
 
-	def getImage(self, number=0):
-		'''Extracts image data as Image'''
-		
-		# DataTypes for image data <--> PIL decoders
-		# NOTE: see Gwyddion's dm3file.c for the complete list of data types
-		dataTypes = {
-			1: 'F;16S',    #16-bit LE signed integer
-			2: 'F;32F',
-			7: 'F;32S',    #32-bit LE signed integer
-			10: 'F;16',    #16-bit LE unsigned integer
-			}
-		dataSize = {1:2, 2:4, 7:4, 10:2} # bits per point for the four dataTypes
-		
-		# get relevant Tags
+	def getImageCount(self):
+		'''Returns the number of images in the stack'''
+		if 'root.ImageList.1.ImageData.Dimensions.2' in self.tags:
+			return int( self.tags['root.ImageList.1.ImageData.Dimensions.2'] )
+		return 1
+
+	imagecount = property(getImageCount)
+
+	def getStackView(self):
+		'''Returns all images as read-only numpy.array of shape (images, height, width)
+		in the stored data type, without copying: the array refers directly into the file'''
 		data_offset = int( self.tags['root.ImageList.1.ImageData.Data.Offset'] )
-		data_size = int( self.tags['root.ImageList.1.ImageData.Data.Size'] )
 		data_type = int( self.tags['root.ImageList.1.ImageData.DataType'] )
 		im_width = int( self.tags['root.ImageList.1.ImageData.Dimensions.0'] )
 		im_height = int( self.tags['root.ImageList.1.ImageData.Dimensions.1'] )
-		if 'root.ImageList.1.ImageData.Dimensions.2'  in self.tags:
-			im_stack = int( self.tags['root.ImageList.1.ImageData.Dimensions.2'] )
-		else:
-			im_stack = 1
+		im_stack = self.imagecount
 
+		if data_type not in imageTypes:
+			raise DM3Exception("Cannot extract image data from %s: unimplemented DataType."%os.path.split(self.__filename)[1])
+		return self.__getArray(data_offset, imageTypes[data_type], im_stack * im_height * im_width).reshape(im_stack, im_height, im_width)
+
+	def getImageView(self, number=0):
+		'''Returns image data as read-only numpy.array in the stored data type, without copying'''
+		im_stack = self.imagecount
 		if number >= im_stack:
 			raise DM3Exception('stack contains %d images, requested number %d' % (im_stack, number))
-
-		if self.debug>0:
-			print "Notice: image data in %s starts at %s"%(os.path.split(self.__filename)[1], hex(data_offset))
-			print "Notice: image size: %sx%s px"%(im_width,im_height)
-		
-		# check if DataType is implemented, then read
-		if data_type in dataTypes.keys():
-			decoder = dataTypes[data_type]
-			if self.debug>0:
-				print "Notice: image data read as %s"%decoder
-				t1 = time.time()
-			im_data_size = im_width * im_height * dataSize[data_type]
-			self.__f.seek( data_offset + number * im_data_size)
-			rawdata = self.__f.read(im_data_size)
-			im = Image.fromstring( 'F', (im_width,im_height), rawdata, 'raw', decoder )
-			if self.debug>0:
-				t2 = time.time()
-				print "| read image data: %.3g s"%(t2-t1)
-		else:
-			raise DM3Exception("Cannot extract image data from %s: unimplemented DataType."%os.path.split(self.__filename)[1])
-		
-		return im
-		
-	image = property(getImage)
+		return self.getStackView()[number]
 
 	def getImageData(self, number=0):
-		'''Extracts image data as numpy.array'''
-		return im2ar(self.getImage(number=number))
+		'''Returns image data as numpy.array (float32); read-only and without copying if stored as float32'''
+		data = self.getImageView(number)
+		if data.dtype == numpy.float32:
+			return data
+		return data.astype(numpy.float32)
 
 	imagedata = property(getImageData)
-	
+
+	def getImage(self, number=0):
+		'''Extracts image data as Image'''
+		return Image.fromarray(self.getImageData(number), 'F')
+
+	image = property(getImage)
+
 	def getDisplayCuts(self):
 		'''Returns display level limits.'''
 		display_min = int( float( self.tags['root.DocumentObjectList.0.ImageDisplayInfo.LowLimit'] ) )
 		display_max = int( float( self.tags['root.DocumentObjectList.0.ImageDisplayInfo.HighLimit'] ) )
 		cuts = (display_min, display_max)
 		return cuts
-	
+
 	cuts = property(getDisplayCuts)
 
 	def getPixelSize(self):
@@ -638,7 +435,6 @@ class DM3(object):
 		return (pixel_size,unit)
 
 	pxsize = property(getPixelSize)
-	
+
 if __name__ == '__main__':
 	print "DM3lib v.%s"%version
-
@@ -0,0 +1,140 @@
+# This file is part of Spacetime.
+#
+# Copyright 2010-2014 Leiden University.
+# Written by Sander Roobol.
+#
+# Spacetime is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# Spacetime is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Real-input FFTs for image data. pyFFTW is used when installed: it keeps a
+# plan (and its aligned work arrays) per shape and runs multithreaded. Else
+# numpy.fft, with batches of rows or images split over a pool of threads
+# (numpy.fft releases the GIL while transforming).
+
+from __future__ import division
+
+import numpy
+import os
+import threading
+import multiprocessing
+import multiprocessing.pool
+import collections
+
+try:
+	import pyfftw, pyfftw.builders
+except ImportError:
+	pyfftw = None
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class NumpyBackend(object):
+	# all transforms work on the last two axes, so a stack of images is
+	# transformed in a single call
+	name = 'numpy'
+	threads = multiprocessing.cpu_count()
+	min_rows = 8 # per thread, for rfft()
+
+	def __init__(self):
+		self.pool = None
+		self.pool_pid = None
+		self.pool_lock = threading.Lock()
+
+	def get_pool(self):
+		# started when first needed, and again in a forked process: the
+		# threads of the parent do not exist there
+		with self.pool_lock:
+			if self.pool is None or self.pool_pid != os.getpid():
+				self.pool = multiprocessing.pool.ThreadPool(self.threads)
+				self.pool_pid = os.getpid()
+			return self.pool
+
+	def map_split(self, func, data, minsize):
+		# func on parts of data along the first axis, in parallel
+		parts = min(self.threads, data.shape[0] // minsize)
+		if parts <= 1:
+			return func(data)
+		return numpy.concatenate(self.get_pool().map(func, numpy.array_split(data, parts)))
+
+	def rfft(self, data):
+		# along the last axis, each row of a 2D array separately
+		data = numpy.asarray(data)
+		if data.ndim < 2:
+			return numpy.fft.rfft(data)
+		return self.map_split(numpy.fft.rfft, data, self.min_rows)
+
+	def rfft2(self, data):
+		data = numpy.asarray(data)
+		if data.ndim < 3:
+			return numpy.fft.rfft2(data)
+		return self.map_split(numpy.fft.rfft2, data, 1)
+
+
+class FFTWBackend(NumpyBackend):
+	name = 'pyfftw'
+	threads = multiprocessing.cpu_count()
+	max_plans = 16
+
+	def __init__(self):
+		self.plans = collections.OrderedDict()
+		self.lock = threading.Lock()
+
+	def get_plan(self, builder, shape, dtype, *args):
+		key = builder.__name__, shape, numpy.dtype(dtype).str, args
+		plan = self.plans.pop(key, None)
+		if plan is None:
+			plan = builder(pyfftw.empty_aligned(shape, dtype), *args, threads=self.threads, planner_effort='FFTW_ESTIMATE')
+			if len(self.plans) >= self.max_plans:
+				self.plans.popitem(last=False)
+		self.plans[key] = plan
+		return plan
+
+	def rfft(self, data):
+		data = numpy.asarray(data, dtype=numpy.float64)
+		with self.lock:
+			return self.get_plan(pyfftw.builders.rfft, data.shape, data.dtype)(data).copy()
+
+	def rfft2(self, data):
+		data = numpy.asarray(data, dtype=numpy.float64)
+		with self.lock:
+			# the output array belongs to the plan and is reused by the next call
+			return self.get_plan(pyfftw.builders.rfft2, data.shape, data.dtype)(data).copy()
+
+
+if pyfftw:
+	backend = FFTWBackend()
+else:
+	backend = NumpyBackend()
+logger.debug('using %s FFT backend', backend.name)
+
+
+def log_power_spectrum(images):
+	# numpy.log(numpy.abs(numpy.fft.fftshift(numpy.fft.fft2(image))**2)) for
+	# a single image or a stack of images, computed from the real-input
+	# transform: the other half follows from |F(k, l)| = |F(-k, -l)|
+	images = numpy.asarray(images, dtype=numpy.float64)
+	height, width = images.shape[-2:]
+
+	half = backend.rfft2(images)
+	with numpy.errstate(divide='ignore'):
+		half = numpy.log(half.real**2 + half.imag**2)
+
+	full = numpy.empty(images.shape)
+	ncols = half.shape[-1]
+	full[..., :ncols] = half
+	if width > ncols:
+		rows = -numpy.arange(height) % height
+		cols = width - numpy.arange(ncols, width)
+		full[..., ncols:] = half[..., rows[:, numpy.newaxis], cols]
+	return numpy.fft.fftshift(full, axes=(-2, -1))
@@ -18,19 +18,63 @@
 
 from __future__ import division
 
-from . import datasources
+from . import datasources, fftbackend
+from ... import util
 import numpy
-import scipy.stats, scipy.signal, scipy.fftpack
-
-
-def bgs_line_by_line(data):
-	new = numpy.zeros(data.shape)
-	pixels = numpy.arange(data.shape[1])
-	#params = []
-	for i, line in enumerate(data):
-		slope, intercept, r_value, p_value, stderr = scipy.stats.linregress(pixels, line)
-		new[i, :] = line - (slope * pixels + intercept)
-		#params.append((slope, intercept))
+import scipy.signal, scipy.fftpack
+import time
+import weakref
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+def bgs_line_by_line(data, order=1, return_params=False):
+	# Subtracts a least squares polynomial fit from every line, for all lines
+	# at once. NaN and masked pixels are ignored in the fit and remain NaN or
+	# masked. The optional params are the coefficients per line in pixel
+	# units, highest power first like numpy.polyfit: (slope, intercept) for
+	# order 1. Lines with too few valid pixels become NaN.
+	image = numpy.ma.getdata(data).astype(float)
+	invalid = numpy.ma.getmaskarray(data) | ~numpy.isfinite(image)
+	weights = (~invalid).astype(float)
+	values = numpy.where(invalid, 0., image)
+	pixels = numpy.arange(data.shape[1], dtype=float)
+	count = weights.sum(axis=1)
+
+	if order == 1:
+		# same closed form as scipy.stats.linregress
+		with numpy.errstate(invalid='ignore', divide='ignore'):
+			xmean = numpy.dot(weights, pixels) / count
+			ymean = values.sum(axis=1) / count
+			dx = (pixels - xmean[:, numpy.newaxis]) * weights
+			slope = (dx * (values - ymean[:, numpy.newaxis])).sum(axis=1) / (dx**2).sum(axis=1)
+			intercept = ymean - slope * xmean
+		params = numpy.column_stack((slope, intercept))
+		background = slope[:, numpy.newaxis] * pixels + intercept[:, numpy.newaxis]
+	else:
+		# weighted normal equations for every line, in a coordinate scaled to
+		# [-1, 1] to keep them well conditioned
+		center = (data.shape[1] - 1) / 2.
+		scale = max(center, 1.)
+		vander = numpy.vander((pixels - center) / scale, order + 1)
+		lhs = numpy.dot(weights, (vander[:, :, numpy.newaxis] * vander[:, numpy.newaxis, :]).reshape(pixels.size, -1)).reshape(-1, order + 1, order + 1)
+		rhs = numpy.dot(values, vander)
+		underdetermined = count <= order
+		lhs[underdetermined] = numpy.identity(order + 1)
+		rhs[underdetermined] = numpy.nan
+		coeffs = numpy.linalg.solve(lhs, rhs[:, :, numpy.newaxis])[:, :, 0]
+		background = numpy.dot(coeffs, vander.T)
+
+		basis = numpy.poly1d([1. / scale, -center / scale])
+		conversion = numpy.array([numpy.polyadd(numpy.zeros(order + 1), (basis**(order - i)).coeffs) for i in range(order + 1)])
+		params = numpy.dot(coeffs, conversion)
+
+	new = image - background
+	if numpy.ma.isMaskedArray(data):
+		new = numpy.ma.array(new, mask=numpy.ma.getmaskarray(data))
+	if return_params:
+		return new, params
 	return new
 
 
@@ -64,29 +108,194 @@ def diff_line(data):
 	return out
 
 
-# for use with the bgs_* functions
-def array(func):
-	def filter(frame):
-		return frame.clone(image=func(frame.image))
-	return filter
+class ImageStatistics(object):
+	# Statistics of a single image, computed when first asked for and shared
+	# by all filters in a pipeline until the image changes.
+	def __init__(self, image):
+		self.image = image
+		self.cache = {}
 
+	def get(self, name):
+		try:
+			return self.cache[name]
+		except KeyError:
+			value = self.cache[name] = getattr(self, 'calc_' + name)()
+			return value
 
-def ClipStdDev(number):
-	def clip(frame):
-		avg, stddev = frame.image.mean(), frame.image.std()
-		image = numpy.clip(frame.image, avg - number * stddev, avg + number * stddev)
-		return frame.clone(image=image)
-	return clip
+	def calc_mean(self):
+		return self.image.mean()
+
+	def calc_std(self):
+		return numpy.sqrt(((self.image - self.get('mean'))**2).mean())
+
+
+class FrameFilter(object):
+	# Filter that only looks at frame.image. Subclasses implement
+	# apply_image(), which gets the statistics listed in stats and, for
+	# filters with inplace = True, an output buffer of the same shape and of
+	# result_dtype() (or None) to write the result into.
+	inplace = False
+	stats = ()
+
+	@property
+	def name(self):
+		return self.__class__.__name__
+
+	def apply_image(self, image, stats, out=None):
+		raise NotImplementedError
+
+	def result_dtype(self, image, stats):
+		return image.dtype
+
+	def __call__(self, frame):
+		return frame.clone(image=self.apply_image(frame.image, ImageStatistics(frame.image)))
+
+
+class ArrayFilter(FrameFilter):
+	# for use with the bgs_* functions
+	def __init__(self, func):
+		self.func = func
+
+	@property
+	def name(self):
+		return self.func.__name__
+
+	def apply_image(self, image, stats, out=None):
+		return self.func(image)
+
+array = ArrayFilter
+
+
+class ClipStdDev(FrameFilter):
+	inplace = True
+	stats = 'mean', 'std'
 
+	def __init__(self, number):
+		self.number = number
 
-def ClipFraction(fraction):
-	def clip(frame):
-		data = frame.image.flatten()
-		data.sort()
-		count = int(round(data.size * fraction / 2.))
-		image = numpy.clip(frame.image, data[count], data[-count])
+	def get_limits(self, stats):
+		avg, stddev = stats.get('mean'), stats.get('std')
+		return avg - self.number * stddev, avg + self.number * stddev
+
+	def result_dtype(self, image, stats):
+		# float limits turn integer images into floats, as numpy.clip does
+		return numpy.result_type(image, *self.get_limits(stats))
+
+	def apply_image(self, image, stats, out=None):
+		low, high = self.get_limits(stats)
+		return numpy.clip(image, low, high, out=out)
+
+
+class ClipFraction(FrameFilter):
+	# Clips the fraction/2 lowest and highest values. The limits are found by
+	# partial sorting, or from a histogram if tolerance is given, in which
+	# case they are accurate to within tolerance times the data range. Limits
+	# are cached per source image, to avoid recomputing them on every redraw.
+	inplace = True
+	limits_cache = util.LRUCache(256, lambda value: 1)
+
+	def __init__(self, fraction, tolerance=None):
+		self.fraction = fraction
+		self.tolerance = tolerance
+
+	def get_limits(self, image):
+		key = id(image), self.fraction, self.tolerance
+		cached = self.limits_cache.find(key)
+		if cached is not None and cached[0]() is image:
+			return cached[1]
+		limits = self.calc_limits(image)
+		try:
+			self.limits_cache.insert(key, (weakref.ref(image), limits))
+		except TypeError: # not weakly referenceable
+			pass
+		return limits
+
+	def calc_limits(self, image):
+		if numpy.ma.isMaskedArray(image):
+			data = image.compressed()
+		else:
+			data = image.ravel()
+		count = int(round(data.size * self.fraction / 2.))
+		low, high = count, data.size - max(count, 1) # same indices as indexing the sorted data with [count] and [-count]
+
+		if self.tolerance:
+			dmin, dmax = data.min(), data.max()
+			hist, edges = numpy.histogram(data, bins=int(numpy.ceil(1. / self.tolerance)), range=(dmin, dmax))
+			cumulative = numpy.cumsum(hist)
+			return (
+				edges[numpy.searchsorted(cumulative, low, 'right')],
+				edges[numpy.searchsorted(cumulative, high, 'right') + 1],
+			)
+
+		data = numpy.partition(data, (low, high))
+		return data[low], data[high]
+
+	def result_dtype(self, image, stats):
+		return numpy.result_type(image, *self.get_limits(image))
+
+	def apply_image(self, image, stats, out=None):
+		low, high = self.get_limits(image)
+		return numpy.clip(image, low, high, out=out)
+
+
+class FilterPipeline(object):
+	# Runs a chain of filters as a single filter. Consecutive FrameFilters
+	# work on the bare image, so the frame is cloned only once at the end
+	# (and for any ordinary frame filter in between). In-place filters write
+	# into an array owned by the pipeline, allocating at most one buffer per
+	# frame, and statistics are computed once for every version of the image.
+	# Buffers are never reused across frames, as the output may be cached.
+	def __init__(self, *filters):
+		self.filters = list(filters)
+		self.timing = [[self.get_name(f), 0., 0] for f in self.filters]
+
+	@staticmethod
+	def get_name(filter):
+		return getattr(filter, 'name', None) or getattr(filter, '__name__', None) or filter.__class__.__name__
+
+	def __call__(self, frame):
+		image = frame.image
+		owned = False # True if image is ours to overwrite
+		stats = ImageStatistics(image)
+		times = []
+
+		for f, timing in zip(self.filters, self.timing):
+			start = time.time()
+			if isinstance(f, FrameFilter):
+				for name in f.stats:
+					stats.get(name)
+				out = None
+				if f.inplace and type(image) is numpy.ndarray:
+					dtype = f.result_dtype(image, stats)
+					if owned and dtype == image.dtype:
+						out = image
+					else:
+						out = numpy.empty(image.shape, dtype)
+				new = f.apply_image(image, stats, out)
+				owned = type(new) is numpy.ndarray and new.flags.writeable and (new is out or not numpy.may_share_memory(new, image))
+			else:
+				if image is not frame.image:
+					frame = frame.clone(image=image)
+				frame = f(frame)
+				new = frame.image
+				owned = False
+			if new is not image or f.inplace:
+				stats = ImageStatistics(new)
+			image = new
+
+			elapsed = time.time() - start
+			timing[1] += elapsed
+			timing[2] += 1
+			times.append(elapsed)
+
+		logger.debug('filter pipeline: %s', ', '.join('{0} {1:.1f} ms'.format(name, 1000 * t) for ((name, total, calls), t) in zip(self.timing, times)))
+		if image is frame.image:
+			return frame
 		return frame.clone(image=image)
-	return clip
+
+	def report(self):
+		# cumulative (name, seconds, calls) for every stage
+		return [tuple(t) for t in self.timing]
 
 
 def average(npoints):
@@ -110,44 +319,172 @@ def split_directions(data):
 	rl = data[:, :(data.shape[1] // 2)-1:-1]
 	return lr, rl
 
+class TransferFunction(object):
+	# A filter expression in a single variable, compiled once. The
+	# pre-execution code runs once, in a namespace of its own. Evaluations
+	# on FFT frequency grids are kept in a cache shared by all instances, so
+	# identical filters in several graphs are evaluated only once.
+	grid_cache = util.LRUCache(64 * 1024 * 1024)
+
+	def __init__(self, expr, preexec='', variable='x'):
+		self.key = expr, preexec, variable
+		self.variable = variable
+		self.code = compile(expr, '<transfer function>', 'eval')
+		self.namespace = {}
+		exec compile(preexec, '<pre-execution code>', 'exec') in self.namespace
+
+	def __call__(self, x):
+		x = numpy.asarray(x)
+		env = dict(self.namespace)
+		env[self.variable] = x
+		ret = numpy.asarray(eval(self.code, env))
+		if ret.dtype.kind not in 'biufc':
+			raise ValueError('transfer function returns {0} values instead of numbers'.format(ret.dtype))
+		if ret.shape != x.shape:
+			if ret.ndim:
+				raise ValueError('transfer function returns shape {0} for input of shape {1}, it should operate on the whole array'.format(ret.shape, x.shape))
+			ret = numpy.full(x.shape, ret[()], dtype=ret.dtype) # constant
+		return ret
+
+	def grid(self, size, samplerate, real=False):
+		# evaluated on fftfreq(size), or rfftfreq(size) if real, read-only
+		def evaluate():
+			if real:
+				freq = numpy.fft.rfftfreq(size, 1/samplerate)
+			else:
+				freq = numpy.fft.fftfreq(size, 1/samplerate)
+			ret = self(freq)
+			ret.flags.writeable = False
+			return ret
+		return self.grid_cache.get((self.key, size, samplerate, real), evaluate)
+
+
 def code2func(expr, preexec, variable='x'):
-	def filter(x):
-		env = {variable: x}
-		exec preexec in env
-		return eval(expr, env)
-	return filter
+	return TransferFunction(expr, preexec, variable)
+
+
+def evaluate_transfer(filter, size, samplerate, real=False):
+	# filter is a TransferFunction or any function of frequency
+	if isinstance(filter, TransferFunction):
+		return filter.grid(size, samplerate, real)
+	if real:
+		return filter(numpy.fft.rfftfreq(size, 1/samplerate))
+	return filter(numpy.fft.fftfreq(size, 1/samplerate))
+
+def fourier_global(data, filter, samplerate, window=None):
+	# a single FFT over all data, the transfer function is applied exactly
+	if window:
+		data = data * scipy.signal.get_window(window, data.size)
+	z = scipy.fftpack.fft(data)
+	return scipy.fftpack.ifft(evaluate_transfer(filter, z.size, samplerate) * z).real
+
+
+def fourier_blocks(data, filter, samplerate, blocksize=8192, taps=512, window=None):
+	# Overlap-save filtering in blocks of blocksize samples. The transfer
+	# function is turned into an impulse response of 2*taps+1 samples, so
+	# this matches fourier_global() for filters whose impulse response fits
+	# within taps. As there, window is applied to the data as a whole, and
+	# the data wraps around at the ends.
+	if data.size <= blocksize:
+		return fourier_global(data, filter, samplerate, window)
+	step = blocksize - 2 * taps
+	if step <= 0:
+		raise ValueError('block size must be larger than twice the number of taps')
+	if window:
+		data = data * scipy.signal.get_window(window, data.size)
+
+	response = scipy.fftpack.ifft(evaluate_transfer(filter, blocksize, samplerate) * numpy.ones(blocksize))
+	lags = numpy.r_[0:taps+1, -taps:0]
+	kernel = numpy.zeros(blocksize, dtype=complex)
+	kernel[lags] = response[lags]
+	kernel = scipy.fftpack.fft(kernel)
+
+	padded = numpy.concatenate((data[-taps:], data, data[:taps]))
+	out = numpy.empty(data.size)
+	for start in xrange(0, data.size, step):
+		count = min(step, data.size - start)
+		block = scipy.fftpack.ifft(scipy.fftpack.fft(padded[start:start+blocksize], blocksize) * kernel)
+		out[start:start+count] = block[taps:taps+count].real
+	return out
+
 
-def fourier(filter, window=None):
+class WelchPSD(object):
+	# One-sided power spectral density by Welch's method, with the same
+	# scaling and constant detrending as scipy.signal.welch(). Data is fed
+	# piece by piece with add(), so a long signal never has to be in memory as
+	# a whole. Segments are transformed in batches, which the FFT backend
+	# spreads over all cores.
+	batchsize = 64
+
+	def __init__(self, samplerate, nperseg=4096, overlap=.5, window='hann'):
+		self.samplerate = samplerate
+		self.nperseg = nperseg
+		self.step = max(1, int(round(nperseg * (1 - overlap))))
+		self.windowspec = window
+		self.window = scipy.signal.get_window(window, nperseg)
+		self.buffer = numpy.empty(0)
+		self.total = numpy.zeros(nperseg // 2 + 1)
+		self.count = 0
+
+	def add(self, data):
+		buf = numpy.concatenate((self.buffer, numpy.asarray(data, dtype=numpy.float64).ravel()))
+		if buf.size < self.nperseg:
+			self.buffer = buf
+			return
+		nseg = (buf.size - self.nperseg) // self.step + 1
+		segments = numpy.lib.stride_tricks.as_strided(buf, shape=(nseg, self.nperseg), strides=(self.step * buf.itemsize, buf.itemsize))
+		for i in xrange(0, nseg, self.batchsize):
+			batch = segments[i:i+self.batchsize]
+			batch = (batch - batch.mean(axis=1)[:, numpy.newaxis]) * self.window
+			z = fftbackend.backend.rfft(batch)
+			self.total += (z.real**2 + z.imag**2).sum(axis=0)
+		self.count += nseg
+		self.buffer = buf[nseg*self.step:]
+
+	def result(self):
+		# returns (frequency, psd)
+		if not self.count:
+			if not self.buffer.size:
+				raise ValueError('no data')
+			# too little data for a single segment, use everything there is
+			short = WelchPSD(self.samplerate, self.buffer.size, 0., self.windowspec)
+			short.add(self.buffer)
+			return short.result()
+		psd = self.total / (self.count * self.samplerate * (self.window**2).sum())
+		if self.nperseg % 2:
+			psd[1:] *= 2
+		else:
+			psd[1:-1] *= 2
+		return numpy.fft.rfftfreq(self.nperseg, 1/self.samplerate), psd
+
+
+def fourier(filter, window=None, blocks=None):
+	# blocks: None for a single global FFT, or (blocksize, taps) for fourier_blocks()
 	def fourierfilter(frame):
 		if frame.direction == 'both':
 			data = frame.image
 		else:
 			data = merge_directions(frame.lrimage, frame.rlimage)
 
-		if window:
-			win = scipy.signal.get_window(window, data.size)
+		if blocks:
+			filtered_data = fourier_blocks(data.flatten(), filter, frame.pixelrate, *blocks, window=window)
 		else:
-			win = 1
-
-		z = scipy.fftpack.fft(data.flatten()*win)
-		freq = scipy.fftpack.fftfreq(z.size, 1/frame.pixelrate)
-		filtered_data = scipy.fftpack.ifft(filter(freq) * z).real.reshape(data.shape)
+			filtered_data = fourier_global(data.flatten(), filter, frame.pixelrate, window)
+		filtered_data = filtered_data.reshape(data.shape)
 
 		lrimage, rlimage = split_directions(filtered_data)
 		if frame.direction == 'both':
 			image = filtered_data
 		elif frame.direction == 'l2r':
-			image = frame.lrimage
+			image = lrimage
 		else:
-			image = frame.rlimage
+			image = rlimage
 	
 		return frame.clone(lrimage=lrimage, rlimage=rlimage, image=image)
 	return fourierfilter
 
 def fourier2d(frame):
-	fft = numpy.fft.fft2(frame.image)
-	fft = numpy.fft.fftshift(fft)
-	amp = numpy.log(numpy.abs(fft**2))
+	amp = fftbackend.log_power_spectrum(frame.image)
 
 	pixelsize = frame.pixelsize
 	if pixelsize:
@@ -30,6 +30,8 @@ import string
 import matplotlib.cm
 import math
 import time
+import functools
+import itertools
 
 import traceback
 import logging
@@ -46,7 +48,9 @@ else:
 
 
 class Tab(traits.HasTraits):
-	pass
+	def close(self):
+		# called when the tab is removed from the project
+		pass
 
 
 class TraitsSavedMeta(traits.HasTraits.__metaclass__):
@@ -186,14 +190,20 @@ class SerializableTab(SerializableBase, Tab):
 					try: 
 						self._setitem_serialized(id, src[id])
 					except:
-						gui.support.Message.exception(title='Warning', message='Warning: incompatible project file', desc='Could not restore property "{0}" for graph "{1}". This graph might not be completely functional.'.format(id, self.label))
+						if self.context.headless:
+							logger.exception('could not restore property "%s" for graph "%s"', id, self.label)
+						else:
+							gui.support.Message.exception(title='Warning', message='Warning: incompatible project file', desc='Could not restore property "{0}" for graph "{1}". This graph might not be completely functional.'.format(id, self.label))
 					del src[id]
 				# else: silently ignore
 			if src: # complain about unknown properties
-				gui.support.Message.show(
-					title='Warning', message='Warning: incompatible project file',
-					desc='Ignoring unknown properties "{0}" for graph "{1}". This graph might not be completely functional.'.format('", "'.join(src.keys()), self.label)
-				)
+				if self.context.headless:
+					logger.warning('ignoring unknown properties "%s" for graph "%s"', '", "'.join(src.keys()), self.label)
+				else:
+					gui.support.Message.show(
+						title='Warning', message='Warning: incompatible project file',
+						desc='Ignoring unknown properties "{0}" for graph "{1}". This graph might not be completely functional.'.format('", "'.join(src.keys()), self.label)
+					)
   
 
 	def from_serialized(self, src):
@@ -251,16 +261,34 @@ class SubplotGUI(SubplotBase):
 		if self.__class__.number != 1:
 			self.label = '{0} {1}'.format(self.label, self.__class__.number)
 
+	def prefetch_file(self, filename=None):
+		# start parsing in the background, for datasources that support it (see pypymanager.prefetch)
+		filename = filename or self.filename
+		factory = getattr(self, 'datafactory', None)
+		if filename and hasattr(factory, 'prefetch') and not cache.DataCache().contains(filename, factory):
+			factory.prefetch(filename)
+
 	def rebuild_figure(self):
 		self.context.canvas.rebuild()
 
+	def rebuild_plot(self):
+		self.plot.clear()
+		self.plot.draw()
+		with self.context.callbacks.general_blockade():
+			self.context.plot.autoscale(self.plot)
+
 	def rebuild(self):
+		self.context.canvas.rebuild_subgraph(self.rebuild_plot)
+
+	def update(self):
+		# cheaper than rebuild() when only the data has changed, if the subplot
+		# can update its existing artists
 		def callback():
-			self.plot.clear()
-			self.plot.draw()
-			with self.context.callbacks.general_blockade():
-				self.context.plot.autoscale(self.plot)
-		self.context.canvas.rebuild_subgraph(callback)
+			axes = self.plot.update_artists()
+			if axes is None:
+				self.rebuild_plot()
+			return axes
+		self.context.canvas.update_subgraph(callback)
 
 	def redraw(self):
 		self.context.canvas.redraw()
@@ -358,7 +386,12 @@ class TimeTrendGUI(SubplotGUI, YlimitsMixin):
 	selected_primary_channels = traits.Property(depends_on='channelobjs.checked')
 	data = traits.Instance(datasources.DataSource)
 
-	traits_saved = 'legend', 'selected_primary_channels'
+	follow = traits.Bool(False)
+	follow_interval = traits.Float(5.)
+	follow_supported = traits.Property(depends_on='data')
+	follow_timer = None
+
+	traits_saved = 'legend', 'selected_primary_channels', 'follow', 'follow_interval'
 
 	def _plot_default(self):
 		plot = self.plotfactory()
@@ -396,7 +429,7 @@ class TimeTrendGUI(SubplotGUI, YlimitsMixin):
 	def load_file(self):
 		if self.filename:
 			try:
-				self.data = self.datafactory(self.filename)
+				self.data = cache.DataCache().get(self.filename, self.datafactory)
 			except:
 				gui.support.Message.file_open_failed(self.filename, parent=self.context.uiparent)
 				self.filename = ''
@@ -413,6 +446,38 @@ class TimeTrendGUI(SubplotGUI, YlimitsMixin):
 		self.plot.set_data(self.data.selectchannels(lambda chan: chan.id in self.selected_primary_channels))
 		self.rebuild()
 
+	def _get_follow_supported(self):
+		return isinstance(self.data, datasources.MultiTrend) and self.data.follow_supported
+
+	@traits.on_trait_change('follow, follow_interval')
+	def schedule_follow(self):
+		if self.follow_timer:
+			self.follow_timer.Stop()
+			self.follow_timer = None
+		if self.follow and not self.context.headless:
+			self.follow_timer = wx.CallLater(max(100, int(1000 * self.follow_interval)), self.follow_file)
+
+	def follow_file(self):
+		self.follow_timer = None
+		if self not in self.context.app.tabs: # tab has been closed
+			return
+		if self.follow_supported:
+			try:
+				if self.data.follow():
+					self.follow_update()
+			except:
+				logger.exception('following {0} failed'.format(self.filename))
+		self.schedule_follow()
+
+	def follow_update(self):
+		def callback():
+			if not self.plot.update_data():
+				self.plot.clear()
+				self.plot.draw()
+			with self.context.callbacks.general_blockade():
+				self.context.plot.autoscale(self.plot)
+		self.context.canvas.rebuild_subgraph(callback)
+
 	def _legend_changed(self):
 		if self.legend == 'off':
 			legend = False
@@ -428,6 +493,8 @@ class TimeTrendGUI(SubplotGUI, YlimitsMixin):
 			traitsui.Item('visible'),
 			traitsui.Item('filename', editor=gui.support.FileEditor(filter=list(self.filter) + ['All files', '*'], entries=0)),
 			traitsui.Item('reload', show_label=False),
+			traitsui.Item('follow', label='Follow file', enabled_when='follow_supported'),
+			traitsui.Item('follow_interval', label='Interval (s)', enabled_when='follow', editor=gui.support.FloatEditor()),
 			traitsui.Item('legend'),
 			traitsui.Item('size'),
 			show_border=True,
@@ -601,10 +668,13 @@ class CSVConfiguration(ActivationComponent):
 	traits_saved = 'filename', 'delimiter', 'skip_lines', 'time_type', 'time_format', 'time_column', 'active'
 
 	def get_datasource(self):
-		data = self.parent.datafactory()
-		data.set_config(filename=self.filename, delimiter=self.delimiter, skip_lines=self.skip_lines, time_type=self.time_type, time_strptime=self.time_format.strip(), time_column=self.time_column)
-		data.load()
-		return data
+		config = dict(delimiter=self.delimiter, skip_lines=self.skip_lines, time_type=self.time_type, time_strptime=self.time_format.strip(), time_column=self.time_column)
+		def load():
+			data = self.parent.datafactory()
+			data.set_config(filename=self.filename, **config)
+			data.load()
+			return data
+		return cache.DataCache().get(self.filename, self.parent.datafactory, config, load)
 
 
 class CSVConfigurationEditor(CSVConfiguration, NonLiveComponentEditor):
@@ -687,6 +757,8 @@ class CSVGUI(DoubleTimeTrendGUI):
 				traitsui.Item('visible'),
 				traitsui.Item('edit_configuration', show_label=False, editor=traitsui.ButtonEditor(label='Select file...')),
 				traitsui.Item('reload', show_label=False),
+				traitsui.Item('follow', label='Follow file', enabled_when='follow_supported'),
+				traitsui.Item('follow_interval', label='Interval (s)', enabled_when='follow', editor=gui.support.FloatEditor()),
 				traitsui.Item('legend'),
 				traitsui.Item('size'),
 				label='General',
@@ -803,9 +875,25 @@ class SingleFrameAnimation(traits.HasTraits):
 		for i in range(self.animation_firstframe, self.animation_lastframe + 1):
 			if i > self._get_current_animation_framenumber_high(): # this allows VideoGUI to not know the number of frames in advance
 				break
+			if i < self.animation_lastframe:
+				self.animation_readahead(i + 1, self.animation_lastframe)
 			setattr(self, self.animation_framenumber_trait, i)
 			yield
 
+	def animation_readahead(self, first, last):
+		# called by animate() before showing a frame, frames first to last
+		# (inclusive) follow; override to prepare them in the background
+		pass
+
+	def animation_seek(self, frameno):
+		# show the same frame as the frameno'th step of animate(), also for
+		# steps beyond the end (those keep showing the last frame)
+		i = min(self.animation_firstframe + frameno, self.animation_lastframe, self._get_current_animation_framenumber_high())
+		setattr(self, self.animation_framenumber_trait, i)
+
+	# False if frames can only be reached efficiently by going through them in order
+	animation_seekable = True
+
 	animation_firstframe = traits.Int(0)
 	animation_lastframe = traits.Int(0)
 	animation_framecount = traits.Property(depends_on='animation_firstframe, animation_lastframe')
@@ -814,6 +902,13 @@ class SingleFrameAnimation(traits.HasTraits):
 	#animation_framenumber_low = 0                 # int or trait name
 	#animation_framenumber_high = 'some_trait'     # idem 
 
+	def animation_full_range(self):
+		if isinstance(self.animation_framenumber_low, basestring):
+			self.animation_firstframe = getattr(self, self.animation_framenumber_low)
+		else:
+			self.animation_firstframe = self.animation_framenumber_low
+		self.animation_lastframe = self._get_current_animation_framenumber_high()
+
 	def _get_current_animation_framenumber_high(self):
 		if isinstance(self.animation_framenumber_high, basestring):
 			return getattr(self, self.animation_framenumber_high)
@@ -929,8 +1024,8 @@ class ImageFile(traits.HasTraits):
 		return util.datetimefrommpldt(self.timestamp).strftime('%Y-%m-%d %H:%M:%S.%f')
 
 	@classmethod
-	def probefile(cls, parent, cache, id, path, probefunc):
-		timestamp, exposure = probefunc(cache, id, path)
+	def probefile(cls, parent, id, path, timeinfo):
+		timestamp, exposure = timeinfo
 		return cls(parent=parent, id=id, checked=(id == 0), path=path, timestamp=timestamp, exposure=exposure)
 
 	def _checked_changed(self):
@@ -971,23 +1066,48 @@ class RGBImageConfiguration(ActivationComponent):
 	def activate(self):
 		self.trait_setq(active=True)
 
-	def get_timestamp(self, cache, i, fn):
+	def get_timestamp(self, i, fn):
 		try:
 			if self.time_source == 'manual':
 				return self.time_start + i * (self.time_exposure + self.time_delay) / 864e5, self.time_exposure # 864e5 ms per day
 			elif self.time_source in ('ctime', 'mtime'):
 				return util.mpldtfromtimestamp(getattr(os.stat(fn), 'st_' + self.time_source)), 0
-			elif self.time_source == 'header':
-				timeinfo = cache.lookup(fn)
-				if not timeinfo:
-					timeinfo = datasources.RGBImage.autodetect_timeinfo(fn)
-					cache.put(fn, timeinfo)
-				return timeinfo
 		except:
 			if logger.isEnabledFor(logging.DEBUG): # don't prepare the traceback if we're not going to show it anyway
 				logger.debug("cannot determine timestamp of '{0}':\n{1}".format(fn, traceback.format_exc()))
 			return 0., 0.
 
+	def get_timestamps(self, filenames, progress):
+		# (timestamp, exposure) for every file, updates progress every
+		# probe_progress_chunksize files. File headers are read in parallel,
+		# results are kept in the metadata cache.
+		chunksize = self.parent.probe_progress_chunksize
+		if self.time_source != 'header':
+			ret = []
+			for i, fn in enumerate(filenames):
+				if i % chunksize == 0:
+					progress.update(i // chunksize)
+				ret.append(self.get_timestamp(i, fn))
+			return ret
+
+		with cache.Cache('image_metadata') as c:
+			cached = c.lookup_many(filenames)
+			timeinfo = [cached.get(fn) for fn in filenames]
+			missing = [i for (i, info) in enumerate(timeinfo) if not info]
+			done = len(filenames) - len(missing)
+			progress.update(done // chunksize)
+
+			for n, (i, (info, error)) in enumerate(itertools.izip(missing, datasources.probe_timeinfo([filenames[i] for i in missing], chunksize=chunksize)), done + 1):
+				if info:
+					timeinfo[i] = info
+					c.put(filenames[i], info)
+				else:
+					logger.debug("cannot determine timestamp of '{0}':\n{1}".format(filenames[i], error))
+					timeinfo[i] = 0., 0.
+				if n % chunksize == 0:
+					progress.update(n // chunksize)
+		return timeinfo
+
 	def sort_files(self, files):
 		if self.time_source != 'manual':
 			files = sorted(files, key=operator.attrgetter('timestamp'))
@@ -1001,20 +1121,17 @@ class RGBImageConfiguration(ActivationComponent):
 		if reload or not self.files:
 			filenames = glob.glob(os.path.join(self.directory, self.pattern))
 			chunkcount = int(math.ceil(float(len(filenames)) / chunksize))
-			if chunkcount > 1:
+			if chunkcount > 1 and not self.parent.context.headless:
 				progress = ProgressDialog(title="Images", message="Loading images", max=chunkcount, can_cancel=False, parent=self.parent.context.uiparent)
 			else:
 				progress = gui.support.DummyProgressDialog()
 
 			files = []
-			with cache.Cache('image_metadata') as c:
-				progress.open()
-				for i in range(chunkcount):
-					eiter = enumerate(filenames[chunksize*i:chunksize*(i+1)], chunksize*i)
-					files.extend(ImageFile.probefile(files, c, i, fn, self.get_timestamp) for (i, fn) in eiter)
-					progress.update(i)
-				progress.update(progress.max)
-				progress.close()
+			progress.open()
+			timeinfo = self.get_timestamps(filenames, progress)
+			files.extend(ImageFile.probefile(files, i, fn, info) for (i, (fn, info)) in enumerate(zip(filenames, timeinfo)))
+			progress.update(progress.max)
+			progress.close()
 		self.files = self.sort_files(files)
 
 
@@ -1044,12 +1161,10 @@ class RGBImageConfigurationEditor(RGBImageConfiguration, NonLiveComponentEditor)
 			progress = gui.support.DummyProgressDialog()
 
 		progress.open()
-		with cache.Cache('image_metadata') as c:
-			for i, f in enumerate(self.files):
-				if i % chunksize == 0:
-					progress.update(i / chunksize)
-				f.timestamp, f.exposure = self.get_timestamp(c, i, f.path)
-			
+		timeinfo = self.get_timestamps([f.path for f in self.files], progress)
+		for f, (timestamp, exposure) in zip(self.files, timeinfo):
+			f.timestamp, f.exposure = timestamp, exposure
+
 		self.files = self.sort_files(self.files)
 		progress.update(progress.max)
 		progress.close()
@@ -1109,10 +1224,11 @@ class RGBImageGUI(ImageGUI, SingleFrameAnimation):
 	clip_fraction = traits.Float(0.01)
 	fft = traits.Bool(False)
 	averaging = traits.Int(1)
+	averaging_mode = traits.Enum(*datasources.RunningAverage.modes)
 
 	is_greyscale = traits.Bool(True)
 
-	traits_saved = 'configuration.*', 'selected_index', 'clip_stddev', 'clip_fraction', 'fft', 'averaging'
+	traits_saved = 'configuration.*', 'selected_index', 'clip_stddev', 'clip_fraction', 'fft', 'averaging', 'averaging_mode'
 	traits_not_saved = 'filename',
 
 	plotfactory = subplots.Image
@@ -1124,10 +1240,24 @@ class RGBImageGUI(ImageGUI, SingleFrameAnimation):
 
 	probe_progress_chunksize = 25
 
+	# number of files to load in the background
+	prefetch_ahead = 5
+	prefetch_behind = 2
+
+	# loaded images of all image graphs together
+	datasource_budget = util.MemoryBudget(1024 * 1024 * 1024)
+
 	def __init__(self, *args, **kwargs):
-		self._datasource_cache = util.StackCache()
+		self._datasource_cache = util.LRUCache(self.datasource_budget.max_bytes, self._get_datasource_nbytes, self.datasource_budget)
+		self._pinned_id = None
+		self._prefetcher = util.Prefetcher()
+		self._averager = datasources.RunningAverage(self._get_averaging_frame)
 		super(RGBImageGUI, self).__init__(*args, **kwargs)
 
+	def close(self):
+		self._prefetcher.close()
+		super(RGBImageGUI, self).close()
+
 	def _configuration_default(self):
 		config = RGBImageConfiguration(id=self.id+'.configuration', parent=self)
 		config.on_trait_change(self.load_files, 'active')
@@ -1166,24 +1296,66 @@ class RGBImageGUI(ImageGUI, SingleFrameAnimation):
 		self.files[self.selected_index].checked = True
 		self.file_changed()
 
-	def _get_datasource_by_index(self, index):
-		f = self.files[index]
+	def _get_datasource_id(self, f):
 		if f.exposure:
 			tend = f.timestamp + f.exposure / 864e5
 		else:
 			tend = None
+		return f.path, f.timestamp, tend
+
+	@staticmethod
+	def _get_datasource_nbytes(data):
+		return sum(frame.image.nbytes for frame in data.iterframes())
+
+	def _get_datasource_by_index(self, index):
+		f = self.files[index]
+		id = self._get_datasource_id(f)
+		# keep the current image, whatever the other graphs load
+		if id != self._pinned_id:
+			self._datasource_cache.pin(id)
+			if self._pinned_id is not None:
+				self._datasource_cache.unpin(self._pinned_id)
+			self._pinned_id = id
 
-		self._datasource_cache.set_limit(max(10, int(math.ceil(self.averaging * 2.5))))
+		return f, self._get_datasource(id)
 
-		id = f.path, f.timestamp, tend
+	def _get_datasource(self, id):
 		data = self._datasource_cache.find(id)
 		if not data:
 			data = self.datafactory.autodetect(*id)
 			self._datasource_cache.insert(id, data)
+		return data
+
+	def _get_averaging_frame(self, id):
+		data = self._get_datasource(id)
+		if not data.is_greyscale():
+			raise ValueError('cannot average: not all images are greyscale')
+		return next(data.iterframes())
+
+	def _prefetch_datasource(self, id):
+		# runs in the prefetcher thread, the cache itself is only touched from the GUI thread
+		data = self.datafactory.autodetect(*id)
+		wx.CallAfter(self._prefetched_datasource, id, data)
 
-		return f, data
+	def _prefetched_datasource(self, id, data):
+		if not self._datasource_cache.find(id):
+			self._datasource_cache.insert(id, data)
 
-	@traits.on_trait_change('clip_fraction, clip_stddev, averaging, fft')
+	def prefetch(self):
+		if self.context.headless: # results are handed over through the GUI thread
+			return
+		first = self.selected_index + max(1, self.averaging)
+		indices = range(first, min(first + self.prefetch_ahead, self.file_number_max + 1))
+		indices.extend(range(self.selected_index - 1, max(-1, self.selected_index - 1 - self.prefetch_behind), -1))
+
+		jobs = []
+		for i in indices:
+			id = self._get_datasource_id(self.files[i])
+			if self._datasource_cache.find(id) is None:
+				jobs.append(functools.partial(self._prefetch_datasource, id))
+		self._prefetcher.submit(jobs)
+
+	@traits.on_trait_change('clip_fraction, clip_stddev, averaging, averaging_mode, fft')
 	def file_changed(self):
 		fobj, data = self._get_datasource_by_index(self.selected_index)
 		self.is_greyscale = data.is_greyscale()
@@ -1192,21 +1364,24 @@ class RGBImageGUI(ImageGUI, SingleFrameAnimation):
 
 		if self.is_greyscale:
 			if self.averaging > 1:
-				indices = [i for i in range(self.selected_index + 1, self.selected_index + self.averaging) if i <= self.file_number_max]
-				stack = [data] + list(self._get_datasource_by_index(i)[1] for i in indices)
+				indices = range(self.selected_index, min(self.selected_index + self.averaging, self.file_number_max + 1))
 				try:
-					data = datasources.AveragedImage(stack)
-					self.selected_filename = 'averaging {0} starting from {1}'.format(len(indices) + 1, fobj.shortpath)
+					data = self._averager.get((self._get_datasource_id(self.files[i]) for i in indices), self.averaging_mode)
+					self.selected_filename = 'averaging {0} starting from {1}'.format(len(indices), fobj.shortpath)
 				except:
 					self.selected_filename = 'averaging failed, non-uniform dataset; only showing {0}'.format(fobj.shortpath)
+			chain = []
 			if self.fft:
-				data = data.apply_filter(filters.fourier2d)
+				chain.append(filters.fourier2d)
 			if self.clip_fraction > 0:
-				data = data.apply_filter(filters.ClipFraction(self.clip_fraction))
+				chain.append(filters.ClipFraction(self.clip_fraction))
 			if self.clip_stddev > 0:
-				data = data.apply_filter(filters.ClipStdDev(self.clip_stddev))
+				chain.append(filters.ClipStdDev(self.clip_stddev))
+			if chain:
+				data = data.apply_filter(filters.FilterPipeline(*chain))
 		self.plot.set_data(data)
-		self.rebuild()
+		self.update()
+		self.prefetch()
 
 	def _select_files_fired(self):
 		RGBImageConfigurationEditor.edit_nonlive(self.configuration)
@@ -1232,6 +1407,7 @@ class RGBImageGUI(ImageGUI, SingleFrameAnimation):
 			),
 			traitsui.Group(
 				traitsui.Item('averaging', label='Averaging', tooltip='Average <number> frames, starting from selected frame.', editor=gui.support.RangeEditor(low=1, high=1000000), enabled_when='is_greyscale'),
+				traitsui.Item('averaging_mode', label='Averaging mode', enabled_when='is_greyscale and averaging > 1'),
 				traitsui.Item('fft', label='2D fourier transform', enabled_when='is_greyscale'),
 				show_border=True,
 				label='Tools (greyscale only)',
@@ -1254,13 +1430,17 @@ class DM3Stack(ImageGUI, SingleFrameAnimation):
 
 	animation_framenumber_trait = 'framenumber'
 	animation_framenumber_low = 0
-	animation_framenumber_high = 'framecount'
+	animation_framenumber_high = 'framemax'
 
 	datafactory = datasources.DM3Stack
 	plotfactory = subplots.Image
 
+	# number of frames to read in the background during animation
+	readahead_frames = 8
+
 	framemax = traits.Int(0)
 	framenumber = traits.Int(0)
+	binning = traits.Enum(1, 2, 4)
 
 	exposure = traits.Float(1000.)
 	delay = traits.Float(0.)
@@ -1268,29 +1448,53 @@ class DM3Stack(ImageGUI, SingleFrameAnimation):
 	tstart_mpldt = traits.DelegatesTo('tstart', 'mpldt')
 
 	clip = traits.Float(3.)
+	averaging = traits.Int(1)
+	averaging_mode = traits.Enum(*datasources.RunningAverage.modes)
 	
-	traits_saved = 'framenumber', 'exposure', 'delay', 'tstart_mpldt', 'clip'
+	traits_saved = 'framenumber', 'exposure', 'delay', 'tstart_mpldt', 'clip', 'averaging', 'averaging_mode', 'binning'
+
+	def __init__(self, *args, **kwargs):
+		self._prefetcher = util.Prefetcher()
+		super(DM3Stack, self).__init__(*args, **kwargs)
+
+	def close(self):
+		self._prefetcher.close()
+		super(DM3Stack, self).close()
 
 	@traits.on_trait_change('filename, reload')
 	def load_file(self):
+		self._prefetcher.cancel()
 		self.data = self.datafactory(self.filename)
+		self.averager = datasources.RunningAverage(lambda key: self.data.getframe(key[0]))
 		self.framemax = self.data.framecount - 1
 		if self.framenumber > self.framemax:
 			self.framenumber = self.framemax
 		else:
 			self.settings_changed()
 
-	@traits.on_trait_change('framenumber, exposure, delay, tstart_mpldt, clip')
+	def animation_readahead(self, first, last):
+		if not self.data:
+			return
+		# averaging needs the frames following the last one shown too
+		last = min(last + self.averaging - 1, first + self.readahead_frames - 1, self.framemax)
+		binning = self.binning
+		self._prefetcher.submit(functools.partial(self.data.getimage, i, binning) for i in range(first, last + 1))
+
+	@traits.on_trait_change('framenumber, exposure, delay, tstart_mpldt, clip, averaging, averaging_mode, binning')
 	def settings_changed(self):
 		if not self.data:
 			return
 		self.data.set_settings(self.framenumber, self.tstart_mpldt, self.exposure/864e5, self.delay/864e5)
+		self.data.binning = self.binning
+		data = self.data
+		if self.averaging > 1:
+			# the timing and binning are part of the key, frames have to be reloaded when they change
+			frames = range(self.framenumber, min(self.framenumber + self.averaging, self.framemax + 1))
+			data = self.averager.get(((i, self.tstart_mpldt, self.exposure, self.delay, self.binning) for i in frames), self.averaging_mode)
 		if self.clip > 0:
-			data = self.data.apply_filter(filters.ClipStdDev(self.clip))
-			self.plot.set_data(data)
-		else:
-			self.plot.set_data(self.data)
-		self.rebuild()
+			data = data.apply_filter(filters.ClipStdDev(self.clip))
+		self.plot.set_data(data)
+		self.update()
 
 	def traits_view(self):
 		return gui.support.PanelView(
@@ -1301,7 +1505,10 @@ class DM3Stack(ImageGUI, SingleFrameAnimation):
 				traitsui.Item('size'),
 				traitsui.Item('scalebar'),
 				traitsui.Item('framenumber', editor=gui.support.RangeEditor(low=0, high_name='framemax', mode='spinner')),
+				traitsui.Item('binning', label='Binning', tooltip='Average blocks of pixels, for a faster preview', editor=traitsui.EnumEditor(values=gui.support.EnumMapping([(1, 'none'), (2, '2x2'), (4, '4x4')]))),
 				traitsui.Item('clip', label='Color clipping', tooltip='Clip DM3 greyscale at <number> standard deviations away from the average (0 to disable)', editor=gui.support.FloatEditor()),
+				traitsui.Item('averaging', label='Averaging', tooltip='Average <number> frames, starting from selected frame.', editor=gui.support.RangeEditor(low=1, high=1000000)),
+				traitsui.Item('averaging_mode', label='Averaging mode', enabled_when='averaging > 1'),
 				show_border=True,
 				label='General',
 			),
@@ -1338,6 +1545,7 @@ class VideoGUI(ImageGUI, SingleFrameAnimation):
 	animation_framenumber_trait = 'framenumber'
 	animation_framenumber_low = 0
 	animation_framenumber_high = 'framemax'
+	animation_seekable = False
 
 	def _get_tsource_manual(self):
 		return self.tsource == 'manual'
@@ -1395,7 +1603,7 @@ class VideoGUI(ImageGUI, SingleFrameAnimation):
 			self.data.set_tzero(util.mpldtfromtimestamp(getattr(os.stat(self.filename), 'st_' + self.tsource)))
 		self.data.set_frameno(self.framenumber)
 		self.plot.set_data(self.data)
-		self.rebuild()
+		self.update()
 
 	def traits_view(self):
 		return gui.support.PanelView(
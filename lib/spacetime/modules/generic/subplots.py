@@ -62,6 +62,22 @@ class LogNorm(matplotlib.colors.LogNorm):
             result = result[0]
         return result
 
+def draw_axvmarker(ax, marker, **kwargs):
+	# vertical line or span that can be moved along with the marker
+	if marker.interval():
+		vspan = ax.axvspan(marker.left, marker.right, **kwargs)
+		def move():
+			vspan.set_xy([(marker.left, 0), (marker.left, 1), (marker.right, 1), (marker.right, 0), (marker.left, 0)])
+			return ax,
+		marker.add_callback(lambda: ax.patches.remove(vspan), move)
+	else:
+		line = ax.axvline(marker.left, **kwargs)
+		def move():
+			line.set_xdata([marker.left, marker.left])
+			return ax,
+		marker.add_callback(lambda: ax.lines.remove(line), move)
+
+
 class AxesRequirements(object):
 	independent_x = False
 	size = 1
@@ -96,6 +112,12 @@ class Subplot(object):
 	def draw(self):
 		raise NotImplementedError
 
+	def update_artists(self):
+		# Update the existing artists after set_data(), for subplots that
+		# support it. Returns the axes that have changed, or None if the
+		# subplot has to be cleared and drawn again.
+		return None
+
 	def clear(self, quick=False):
 		# The quick parameter is set when the entire figure is being cleared;
 		# in this case it is sufficient to only clear the internal state of the
@@ -313,8 +335,60 @@ class MultiTrendFormatter(object):
 		self.counter = -1
 
 
+class MinMaxPyramid(object):
+	# Minimum and maximum of a trend in buckets of increasing size, so that a
+	# decimated version of any x range can be produced in a time proportional
+	# to the number of pixels instead of the number of points, without losing
+	# any peaks. x has to be sorted.
+	factor = 4
+	min_buckets = 1024
+
+	def __init__(self, x, y):
+		self.x = x
+		self.y = y
+		isnan = numpy.isnan(y)
+		ymin = numpy.where(isnan, numpy.inf, y)
+		ymax = numpy.where(isnan, -numpy.inf, y)
+
+		self.levels = []
+		imin = imax = numpy.arange(y.size)
+		size = 1
+		while imin.size > self.min_buckets:
+			imin = self.reduce(imin, ymin, numpy.argmin)
+			imax = self.reduce(imax, ymax, numpy.argmax)
+			size *= self.factor
+			self.levels.append((size, imin, imax))
+
+		# always include the end points and extremes to keep the data limits intact
+		self.extremes = numpy.array([0, y.size - 1, imin[ymin[imin].argmin()], imax[ymax[imax].argmax()]])
+
+	def reduce(self, indices, values, func):
+		pad = -indices.size % self.factor
+		if pad:
+			indices = numpy.concatenate((indices, indices[-1:].repeat(pad)))
+		indices = indices.reshape(-1, self.factor)
+		return indices[numpy.arange(indices.shape[0]), func(values[indices], axis=1)]
+
+	def decimate(self, xmin, xmax, buckets):
+		start = max(self.x.searchsorted(xmin, 'left') - 1, 0)
+		stop = min(self.x.searchsorted(xmax, 'right') + 1, self.x.size)
+		for size, imin, imax in reversed(self.levels):
+			if stop - start >= size * buckets:
+				i0 = start // size
+				i1 = -(-stop // size)
+				indices = numpy.concatenate((imin[i0:i1], imax[i0:i1], self.extremes))
+				break
+		else:
+			indices = numpy.concatenate((numpy.arange(start, stop), self.extremes))
+		indices = numpy.unique(indices)
+		return self.x[indices], self.y[indices]
+
+
 class MultiTrend(YAxisHandling, Subplot):
 	legend = 'upper right'
+	channel_lines = ()
+	channel_pyramids = {}
+	decimate_threshold = 50000
 	legendprops = matplotlib.font_manager.FontProperties(size='medium')
 
 	def __init__(self, data=None, formatter=None):
@@ -329,6 +403,8 @@ class MultiTrend(YAxisHandling, Subplot):
 	def setup(self):
 		super(MultiTrend, self).setup()
 		self.axes.callbacks.connect('ylim_changed', self.ylim_callback)
+		for ax in self.axes._shared_x_axes.get_siblings(self.axes):
+			ax.callbacks.connect('xlim_changed', self.decimate_callback)
 
 	def get_xdata(self, chandata):
 		return self.correct_time(chandata.time)
@@ -337,19 +413,67 @@ class MultiTrend(YAxisHandling, Subplot):
 		return chandata.value
 
 	def draw(self):
+		self.channel_lines = []
+		self.channel_pyramids = {}
 		if self.data:
 			self.formatter.reset()
 			for d in self.data.iterchannels():
-				self.axes.plot(self.get_xdata(d), self.get_ydata(d), self.formatter(d), label=d.id)
+				self.plot_channel(self.axes, d)
 			self.draw_legend()
 		if self.ylog:
 			self.axes.set_yscale('log')
 
+	def plot_channel(self, axes, chandata):
+		xdata, ydata = self.get_xdata(chandata), self.get_ydata(chandata)
+		line, = axes.plot(xdata, ydata, self.formatter(chandata), label=chandata.id)
+		self.channel_lines.append(line)
+		self.set_line_data(line, xdata, ydata)
+
+	def set_line_data(self, line, xdata, ydata):
+		# Lines with many points are drawn decimated to about two points per
+		# pixel, and decimated again when the x limits change.
+		xdata, ydata = numpy.asarray(xdata), numpy.asarray(ydata)
+		if xdata.size > self.decimate_threshold and line.get_marker() in ('None', None, '', ' ') and numpy.all(numpy.diff(xdata) >= 0):
+			pyramid = self.channel_pyramids[line] = MinMaxPyramid(xdata, ydata)
+			line.set_data(*pyramid.decimate(xdata[0], xdata[-1], self.get_decimate_buckets(line.axes)))
+		else:
+			self.channel_pyramids.pop(line, None)
+			line.set_data(xdata, ydata)
+
+	@staticmethod
+	def get_decimate_buckets(axes):
+		return max(int(axes.bbox.width), 100)
+
+	def decimate_callback(self, ax):
+		xmin, xmax = sorted(ax.get_xlim())
+		for line, pyramid in self.channel_pyramids.iteritems():
+			line.set_data(*pyramid.decimate(xmin, xmax, self.get_decimate_buckets(line.axes)))
+
+	def iterplotchannels(self):
+		if self.data:
+			for d in self.data.iterchannels():
+				yield self.axes, d
+
+	def update_data(self):
+		# Cheap alternative to clear() and draw() when only the contents of the
+		# plotted channels have changed (e.g. when a file has grown). Returns
+		# False if the channels do not match the lines anymore.
+		channels = list(self.iterplotchannels())
+		if len(channels) != len(self.channel_lines) or any(line.get_label() != d.id for (line, (ax, d)) in zip(self.channel_lines, channels)):
+			return False
+		for line, (ax, d) in zip(self.channel_lines, channels):
+			self.set_line_data(line, self.get_xdata(d), self.get_ydata(d))
+		for ax in set(ax for (ax, d) in channels):
+			ax.relim()
+		return True
+
 	def clear(self, quick=False):
 		if not quick:
 			if self.axes:
 				del self.axes.lines[:]
 				self.axes.relim()
+		self.channel_lines = []
+		self.channel_pyramids = {}
 		super(MultiTrend, self).clear(quick)
 
 	def set_legend(self, legend):
@@ -375,13 +499,7 @@ class MultiTrend(YAxisHandling, Subplot):
 				self.get_legend_axes().legend_ = None
 
 	def draw_marker(self, marker):
-		ax = self.axes
-		if marker.interval():
-			vspan = ax.axvspan(marker.left, marker.right, color='silver', zorder=-1e9)
-			marker.add_callback(lambda: ax.patches.remove(vspan))
-		else:
-			line = ax.axvline(marker.left, color='silver', zorder=-1e9)
-			marker.add_callback(lambda: ax.lines.remove(line))
+		draw_axvmarker(self.axes, marker, color='silver', zorder=-1e9)
 
 
 class DoubleMultiTrend(MultiTrend, DoubleYAxisHandling):
@@ -402,11 +520,18 @@ class DoubleMultiTrend(MultiTrend, DoubleYAxisHandling):
 		super(DoubleMultiTrend, self).draw()
 		if self.secondarydata:
 			for d in self.secondarydata.iterchannels():
-				self.secondaryaxes.plot(self.get_xdata(d), self.get_ydata(d), self.formatter(d), label=d.id)
+				self.plot_channel(self.secondaryaxes, d)
 			self.draw_legend()
 		if self.ylog2:
 			self.secondaryaxes.set_yscale('log')
 
+	def iterplotchannels(self):
+		for i in super(DoubleMultiTrend, self).iterplotchannels():
+			yield i
+		if self.secondarydata:
+			for d in self.secondarydata.iterchannels():
+				yield self.secondaryaxes, d
+
 	def get_legend_items(self):
 		# manually join the legends for both y-axes
 		handles1, labels1 = self.axes.get_legend_handles_labels()
@@ -510,13 +635,7 @@ class Time2D(YAxisHandling, ImageBase):
 
 	def draw_marker(self, marker):
 		shinysilver = (.75, .75, .75, .5)
-		ax = self.axes
-		if marker.interval():
-			vspan = ax.axvspan(marker.left, marker.right, color=shinysilver, zorder=1e9)
-			marker.add_callback(lambda: ax.patches.remove(vspan))
-		else:
-			line = ax.axvline(marker.left, color=shinysilver, zorder=1e9)
-			marker.add_callback(lambda: ax.lines.remove(line))
+		draw_axvmarker(self.axes, marker, color=shinysilver, zorder=1e9)
 
 
 # based on the matplotlib anchored_artists example
@@ -562,6 +681,7 @@ class Image(ImageBase, XAxisHandling, InverseYAxisHandling):
 	marker = None
 	scalebar = True
 	frame = None
+	image = None
 
 	def __init__(self, *args, **kwargs):
 		self.vspans = []
@@ -605,7 +725,7 @@ class Image(ImageBase, XAxisHandling, InverseYAxisHandling):
 					image = d.image
 
 				extent = d.get_extent()
-				self.axes.imshow(image, origin='lower', aspect='equal', cmap=self.colormap, interpolation=self.interpolation, norm=self.get_clim_norm(), extent=extent)
+				self.image = self.axes.imshow(image, origin='lower', aspect='equal', cmap=self.colormap, interpolation=self.interpolation, norm=self.get_clim_norm(), extent=extent)
 
 				self.marker = self.parent.markers.add(tstart, tend)
 
@@ -616,6 +736,37 @@ class Image(ImageBase, XAxisHandling, InverseYAxisHandling):
 				self.axes.imshow(numpy.rot90(d.image), extent=(tstart, tendzoom, 0, 1), aspect='auto', cmap=self.colormap, interpolation=self.interpolation, norm=self.get_clim_norm())
 				self.axes.add_patch(matplotlib.patches.Rectangle((tstart, 0), tendzoom-tstart, 1, linewidth=1, edgecolor='black', fill=False))
 		
+	def update_artists(self):
+		# Fast path for showing another frame in single frame mode. Only
+		# possible when size and extent do not change, so the axis limits and
+		# the scalebar remain valid.
+		if self.mode != 'single frame' or not self.data or self.image is None or self.image not in self.axes.images:
+			return None
+		d = next(iter(self.data.iterframes()), None)
+		if d is None:
+			return None
+		if self.rotate:
+			image = numpy.rot90(d.image, 3)
+		else:
+			image = d.image
+		if image.shape != self.image.get_array().shape or d.get_extent() != self.frame.get_extent() \
+				or (d.pixelsize, d.pixelunit) != (self.frame.pixelsize, self.frame.pixelunit):
+			return None
+
+		self.frame = d
+		self.image.set_data(image)
+		self.image.norm = self.get_clim_norm()
+
+		axes = set([self.axes])
+		if self.marker:
+			tstart = self.correct_time(d.tstart)
+			tend = None if d.tend is None else self.correct_time(d.tend)
+			moved = self.marker.move(tstart, tend)
+			if moved is None:
+				return None
+			axes.update(moved)
+		return axes
+
 	def xlim_rescale(self):
 		if self.mode == 'single frame':
 			super(ImageBase, self).xlim_rescale()
@@ -628,6 +779,7 @@ class Image(ImageBase, XAxisHandling, InverseYAxisHandling):
 			if self.marker:
 				self.parent.markers.remove(self.marker)
 		self.marker = None
+		self.image = None
 		super(Image, self).clear(quick)
 
 	def set_rotate(self, rotate):
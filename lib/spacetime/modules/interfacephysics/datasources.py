@@ -36,18 +36,15 @@ class TPDirk(MultiTrend):
 			if len(data) == 2: # last line ends with "date;time"
 				continue
 			no, dt, pressure, temperature = data
-			yield numpy.array((
-				util.mpldtstrptime(dt, '%y/%m/%d %H:%M:%S'),
-				float(pressure),
-				float(temperature)
-			))
+			yield dt, float(pressure), float(temperature)
 
 	def __init__(self, *args, **kwargs):
 		super(TPDirk, self).__init__(*args, **kwargs)
-		data = numpy.array(list(self.readiter()))
+		dt, pressure, temperature = zip(*self.readiter())
+		time = util.mpldtstrptime_array(dt, '%y/%m/%d %H:%M:%S')
 		self.channels = [
-			DataChannel(id='pressure', time=data[:,0], value=data[:,1]),
-			DataChannel(id='temperature', time=data[:,0], value=data[:,2]),
+			DataChannel(id='pressure', time=time, value=numpy.array(pressure)),
+			DataChannel(id='temperature', time=time, value=numpy.array(temperature)),
 		]
 
 
@@ -23,6 +23,7 @@ from ..generic.gui import DoubleTimeTrendGUI
 from ..generic.datasources import CSVFactory
 from ..lpmgascabinet import subplots as lpmsubplots
 from ...gui import support
+from ... import cache
 
 from . import subplots
 from . import datasources
@@ -45,7 +46,7 @@ class TPDirkGUI(DoubleTimeTrendGUI):
 	def load_file(self):
 		if self.filename:
 			try:
-				self.data = self.datafactory(self.filename)
+				self.data = cache.DataCache().get(self.filename, self.datafactory)
 			except:
 				support.Message.file_open_failed(self.filename, parent=self.context.uiparent)
 				self.filename = ''
@@ -23,6 +23,7 @@ from ..generic.datasources import DataSource, MultiTrend, DataChannel, ImageFram
 
 import numpy
 import scipy.fftpack
+import threading
 
 from camera.formats import raw
 
@@ -33,15 +34,38 @@ class Camera(MultiTrend):
 	direction = raw.RawFileChannelInfo.LR
 	averaging = False # only for trend mode
 	fft = False
+	fourierblocks = None # (blocksize, taps) for block-wise filtering, see filters.fourier_blocks()
+	welch = None # (nperseg, overlap, window) for an averaged spectrum in FFT mode, see filters.WelchPSD
+	frame_cache_bytes = 256 * 1024 * 1024
 
 	def __init__(self, *args, **kwargs):
 		super(Camera, self).__init__(*args, **kwargs)
 		self.rawfile = raw.RawFileReader(self.filename)
+		self.rawlock = threading.Lock()
+		self.framecache = util.LRUCache(self.frame_cache_bytes, lambda images: images[0].nbytes + images[1].nbytes)
+
+	def getimages(self, channel, frame):
+		# both directions of a frame, every (frame, channel) is decoded only once
+		return self.framecache.get((frame, channel), lambda: self.readimages(channel, frame))
+
+	def readimages(self, channel, frame):
+		with self.rawlock:
+			image = self.rawfile.channelImage(frame, channel)
+			images = image.asArray(direction=raw.RawFileChannelInfo.LR), image.asArray(direction=raw.RawFileChannelInfo.RL)
+		for im in images:
+			im.flags.writeable = False # shared by everyone who gets them from the cache
+		return images
+
+	def getframeinfo(self, frame):
+		with self.rawlock:
+			return self.rawfile.frameInfo(frame)
+
+	def getcachestats(self):
+		return self.framecache.stats()
 
 	def getdata(self, channel, frame):
 		ret = ImageFrame()
-		ret.lrimage = self.rawfile.channelImage(frame, channel).asArray(direction=raw.RawFileChannelInfo.LR)
-		ret.rlimage = self.rawfile.channelImage(frame, channel).asArray(direction=raw.RawFileChannelInfo.RL)
+		ret.lrimage, ret.rlimage = self.getimages(channel, frame)
 		if self.direction == (raw.RawFileChannelInfo.LR | raw.RawFileChannelInfo.RL):
 			ret.direction = 'both'
 			ret.image = filters.merge_directions(ret.lrimage, ret.rlimage)
@@ -52,7 +76,7 @@ class Camera(MultiTrend):
 			ret.image = ret.rlimage
 			ret.direction = 'r2l'
 
-		frameinfo = self.rawfile.frameInfo(frame)
+		frameinfo = self.getframeinfo(frame)
 		ret.pixelrate = frameinfo.pixelclock_kHz * 1000 / frameinfo.samplesPerPoint
 		ret.tstart = util.mpldtfromtimestamp(frameinfo.acquisitionTime)
 		ret.tend = ret.tstart + ret.lrimage.size * 2 / ret.pixelrate / 86400
@@ -62,23 +86,26 @@ class Camera(MultiTrend):
 		return ret
 
 	def getchanneldata(self, channel, frameiter=None):
-		data = []
-		time = []
 		if frameiter is None:
 			frameiter = self.framenumberiter()
+		if self.fft and self.welch:
+			return self.getchannelpsd(channel, frameiter)
+
+		data = []
+		time = []
 		for frameno in frameiter:
-			frame = self.rawfile.channelImage(frameno, channel)
-			frameinfo = self.rawfile.frameInfo(frameno)
+			lrimage, rlimage = self.getimages(channel, frameno)
+			frameinfo = self.getframeinfo(frameno)
 			tstart = util.mpldtfromtimestamp(frameinfo.acquisitionTime)
 
 			# correct for software oversampling: convert from samplerate (incorrectly labeld as pixelclock_kHz) into pixelrate
 			pixelrate = frameinfo.pixelclock_kHz * 1000 / frameinfo.samplesPerPoint
 
 			if self.direction == (raw.RawFileChannelInfo.LR | raw.RawFileChannelInfo.RL):
-				image = filters.merge_directions(frame.asArray(direction=raw.RawFileChannelInfo.LR), frame.asArray(direction=raw.RawFileChannelInfo.RL))
+				image = filters.merge_directions(lrimage, rlimage)
 				tend = tstart + image.size / pixelrate / 86400
 			else:
-				image = frame.asArray(direction=self.direction)
+				image = lrimage if self.direction == raw.RawFileChannelInfo.LR else rlimage
 				tend = tstart + image.size * 2 / pixelrate / 86400
 
 			if not self.fft and self.averaging:
@@ -92,6 +119,11 @@ class Camera(MultiTrend):
 		time = numpy.hstack(time)
 
 		# NOTE: the FFT stuff silently assumes that all frames are taken with identical settings
+		if self.fourierfilter and self.fourierblocks and not self.fft:
+			# overlap-save, avoids one huge FFT over long trends
+			filtered_data = filters.fourier_blocks(data, self.fourierfilter, pixelrate, *self.fourierblocks, window=self.fourierwindow)
+			return DataChannel(id=str(channel), value=filtered_data, time=time)
+
 		if self.fourierfilter or self.fft:
 			if self.fourierwindow:
 				window = scipy.signal.get_window(self.fourierwindow, data.size)
@@ -102,7 +134,7 @@ class Camera(MultiTrend):
 			freq = scipy.fftpack.fftfreq(z.size, 1/pixelrate)
 
 			if self.fourierfilter:
-				z *= self.fourierfilter(freq)
+				z *= filters.evaluate_transfer(self.fourierfilter, z.size, pixelrate)
 
 			if self.fft:
 				power = abs(z / z.size)**2
@@ -114,6 +146,27 @@ class Camera(MultiTrend):
 
 		return DataChannel(id=str(channel), value=data, time=time)
 
+	def getchannelpsd(self, channel, frameiter):
+		# streams through the frames, only one frame is in memory at a time
+		psd = None
+		for frameno in frameiter:
+			lrimage, rlimage = self.getimages(channel, frameno)
+			if psd is None:
+				frameinfo = self.getframeinfo(frameno)
+				pixelrate = frameinfo.pixelclock_kHz * 1000 / frameinfo.samplesPerPoint
+				psd = filters.WelchPSD(pixelrate, *self.welch)
+			if self.direction == (raw.RawFileChannelInfo.LR | raw.RawFileChannelInfo.RL):
+				psd.add(filters.merge_directions(lrimage, rlimage))
+			else:
+				psd.add(lrimage if self.direction == raw.RawFileChannelInfo.LR else rlimage)
+
+		if psd is None:
+			return DataChannel(id=str(channel), value=numpy.empty(0), time=numpy.empty(0))
+		freq, power = psd.result()
+		if self.fourierfilter:
+			power *= abs(self.fourierfilter(freq))**2
+		return DataChannel(id=str(channel), value=power, time=freq)
+
 	def getframecount(self):
 		return self.rawfile.header.frameCount
 
@@ -177,6 +230,16 @@ class CameraChannel(DataSource):
 			yield self.cameradata.getdata(self.channel, i)
 
 
+# image mode only, a single frame that is only produced when it is needed
+class LazyFrame(DataSource):
+	def __init__(self, func, *args):
+		self.func = func
+		self.args = args
+
+	def iterframes(self):
+		yield self.func(*self.args)
+
+
 class ChainedImage(DataSource):
 	def __init__(self, *args):
 		self.args = args
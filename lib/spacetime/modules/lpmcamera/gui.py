@@ -19,11 +19,13 @@
 import traits.api as traits
 import traitsui.api as traitsui
 import numpy
+import functools
 
 from ..generic import filters
 from ..generic.gui import SerializableComponent, SubplotGUI, DoubleTimeTrendGUI, XlimitsMixin, FalseColorImageGUI, SingleFrameAnimation
 from ..generic.subplots import Image
 from ...gui import support
+from ... import util
 
 from . import datasources, subplots
 
@@ -63,7 +65,12 @@ class FourierFilter(SerializableComponent):
 	needs_p1 = traits.Property(depends_on='window')	
 	needs_p2 = traits.Property(depends_on='window')
 
-	traits_saved = 'preexec', 'transferfunc', 'window', 'window_p1', 'window_p2'
+	mode = traits.Enum('global', 'blocks')
+	blocksize = traits.Range(256, 2**24, 8192)
+	taps = traits.Range(1, 2**22, 512)
+	blocks = traits.Property(depends_on='mode')
+
+	traits_saved = 'preexec', 'transferfunc', 'window', 'window_p1', 'window_p2', 'mode', 'blocksize', 'taps'
 
 	def _get_needs_p1(self):
 		return len(self.window_mapping[self.window]) >= 1
@@ -78,6 +85,15 @@ class FourierFilter(SerializableComponent):
 			window = self.window, self.window_p1, self.window_p2
 			return window[:1+len(self.window_mapping[self.window])] # chop of unneeded parameters
 
+	def _get_blocks(self):
+		return self.mode == 'blocks'
+
+	def get_block_settings(self):
+		if self.mode == 'blocks':
+			return self.blocksize, self.taps
+		else:
+			return None
+
 	def get_callable(self, variable):
 		return filters.code2func(self.transferfunc, self.preexec, variable=variable)
 
@@ -118,10 +134,17 @@ class FourierFilter(SerializableComponent):
 					label='Windowing',
 
 				),
+				traitsui.Group(
+					traitsui.Item('mode', editor=traitsui.EnumEditor(values=support.EnumMapping([('global', 'Single FFT (exact)'), ('blocks', 'Overlap-save blocks')])), tooltip='Overlap-save filters long trends block by block. The transfer function is truncated to an impulse response of 2*taps+1 samples.'),
+					traitsui.Item('blocksize', label='Block size', editor=support.RangeEditor(low=256, high=2**24, mode='spinner'), enabled_when='blocks'),
+					traitsui.Item('taps', label='Taps', editor=support.RangeEditor(low=1, high=2**22, mode='spinner'), enabled_when='blocks'),
+					show_border=True,
+					label='Processing',
+				),
 		
 			),
 			kind='modal',
-			height=400,
+			height=500,
 			width=300,
 			buttons=traitsui.OKCancelButtons,
 			handler=FourierFilterHandler,
@@ -193,6 +216,20 @@ class CameraFrameGUI(FalseColorImageGUI, CameraGUI, SingleFrameAnimation):
 	animation_framenumber_low = 0
 	animation_framenumber_high = 'framecount'
 
+	# number of frames to prepare in the background in single frame mode
+	prefetch_ahead = 5
+	prefetch_behind = 2
+	frame_cache_bytes = 128 * 1024 * 1024
+
+	def __init__(self, *args, **kwargs):
+		self.framecache = util.LRUCache(self.frame_cache_bytes, lambda frame: frame.image.nbytes)
+		self.prefetcher = util.Prefetcher()
+		super(CameraFrameGUI, self).__init__(*args, **kwargs)
+
+	def close(self):
+		self.prefetcher.close()
+		super(CameraFrameGUI, self).close()
+
 	def _get_is_singleframe(self):
 		return self.mode == 'single frame'
 
@@ -210,6 +247,8 @@ class CameraFrameGUI(FalseColorImageGUI, CameraGUI, SingleFrameAnimation):
 		self.rebuild_figure()
 
 	def _filename_changed(self):
+		self.prefetcher.cancel()
+		self.framecache.clear()
 		self.data = datasources.Camera(self.filename)
 		self.channelcount = self.data.getchannelcount() - 1
 		self.framecount = self.data.getframecount() - 1
@@ -227,20 +266,54 @@ class CameraFrameGUI(FalseColorImageGUI, CameraGUI, SingleFrameAnimation):
 		else:
 			self.settings_changed()
 
+	def get_filters(self):
+		chain = []
+		if self.fourierfilter:
+			chain.append(filters.fourier(self.fourierfilter.get_callable('f'), self.fourierfilter.get_window_tuple(), self.fourierfilter.get_block_settings()))
+		if self.filter in self.filter_map:
+			chain.append(self.filter_map[self.filter])
+		if self.cauto and self.clip > 0:
+			chain.append(filters.ClipStdDev(self.clip))
+		return chain
+
+	def get_pipeline(self):
+		return filters.FilterPipeline(*self.get_filters())
+
+	def get_filters_key(self):
+		ff = self.fourierfilter
+		return (
+			self.data, self.channel, self.data.direction, self.filter, self.cauto and self.clip,
+			ff and (ff.transferfunc, ff.preexec, ff.get_window_tuple(), ff.get_block_settings()),
+		)
+
+	def get_frame(self, frameno):
+		# filtered frame, cached for single frame mode
+		key = frameno, self.get_filters_key()
+		frame = self.framecache.find(key)
+		if frame is None:
+			data = self.data.selectchannel(self.channel).selectframes(frameno, frameno, 1).apply_filter(self.get_pipeline())
+			frame = next(data.iterframes())
+			if key[1] == self.get_filters_key(): # settings did not change in the meantime
+				self.framecache.insert(key, frame)
+		return frame
+
+	def prefetch(self):
+		low = max(0, self.firstframe - self.prefetch_behind)
+		high = min(self.framecount, self.firstframe + self.prefetch_ahead)
+		frames = range(self.firstframe + 1, high + 1) + range(self.firstframe - 1, low - 1, -1)
+		self.prefetcher.submit(functools.partial(self.get_frame, i) for i in frames)
+
 	def select_data(self):
 		if not self.data:
 			return
 		if self.mode == 'single frame':
-			data = self.data.selectchannel(self.channel).selectframes(self.firstframe, self.firstframe, 1)
+			data = datasources.LazyFrame(self.get_frame, self.firstframe)
+			self.prefetch()
 		else:
 			# FIXME: implement a smarter first/last frame selection, don't redraw everything
+			self.prefetcher.cancel()
 			data = self.data.selectchannel(self.channel).selectframes(self.firstframe, self.lastframe, self.stepframe)
-		if self.fourierfilter:
-			data = data.apply_filter(filters.fourier(self.fourierfilter.get_callable('f'), self.fourierfilter.get_window_tuple()))
-		if self.filter in self.filter_map:
-			data = data.apply_filter(self.filter_map[self.filter])
-		if self.cauto and self.clip > 0:
-			data = data.apply_filter(filters.ClipStdDev(self.clip))
+			data = data.apply_filter(self.get_pipeline())
 		self.plot.set_data(data)
 		self.plot.tzoom = self.stepframe
 
@@ -264,7 +337,7 @@ class CameraFrameGUI(FalseColorImageGUI, CameraGUI, SingleFrameAnimation):
 	@traits.on_trait_change('clip, lastframe, stepframe')
 	def settings_changed(self):
 		self.select_data()
-		self.rebuild()
+		self.update()
 
 	traits_view = support.PanelView(
 		traitsui.Group(
@@ -316,7 +389,14 @@ class CameraTrendGUI(DoubleTimeTrendGUI, CameraGUI, XlimitsMixin):
 	not_fft = traits.Property(depends_on='fft')
 	independent_x = traits.Property(depends_on='xaxis_type')
 
-	traits_saved = 'averaging', 'xaxis_type'
+	fft_mode = traits.Enum('periodogram', 'welch')
+	welch_segment = traits.Range(16, 2**22, 4096)
+	welch_overlap = traits.Range(0., .95, .5)
+	welch_window = traits.Enum('hann', 'hamming', 'blackman', 'flattop', 'boxcar')
+	welch = traits.Property(depends_on='fft, fft_mode')
+	not_single_frame = traits.Property(depends_on='fft, fft_mode')
+
+	traits_saved = 'averaging', 'xaxis_type', 'fft_mode', 'welch_segment', 'welch_overlap', 'welch_window'
 
 	def _get_fft(self):
 		return self.xaxis_type == 'fft'
@@ -324,6 +404,13 @@ class CameraTrendGUI(DoubleTimeTrendGUI, CameraGUI, XlimitsMixin):
 	def _get_not_fft(self):
 		return not self.fft
 
+	def _get_welch(self):
+		return self.fft and self.fft_mode == 'welch'
+
+	def _get_not_single_frame(self):
+		# the periodogram is calculated from a single frame, Welch's method averages over the frame range
+		return not self.fft or self.welch
+
 	def _get_independent_x(self):
 		return self.xaxis_type != 'time'
 
@@ -360,21 +447,24 @@ class CameraTrendGUI(DoubleTimeTrendGUI, CameraGUI, XlimitsMixin):
 				self.rebuild_figure()
 			self.prev_xaxis_type = self.xaxis_type
 
+	def _fft_mode_changed(self):
+		self._firstframe_changed()
+
 	def _firstframe_changed(self):
-		if (self.fft and self.firstframe != self.lastframe) or self.firstframe > self.lastframe:
+		if (not self.not_single_frame and self.firstframe != self.lastframe) or self.firstframe > self.lastframe:
 			self.lastframe = self.firstframe
 			# settings_changed() will be triggered because lastframe changes
 		else:
 			self.settings_changed()
 
-	@traits.on_trait_change('averaging, lastframe, stepframe, selected_primary_channels, selected_secondary_channels')
+	@traits.on_trait_change('averaging, lastframe, stepframe, selected_primary_channels, selected_secondary_channels, welch_segment, welch_overlap, welch_window')
 	def settings_changed(self):
 		if not self.data:
 			self.plot.fft = self.fft
 			self.rebuild()
 			return
 		# FIXME: implement a smarter first/last frame selection, don't redraw everything
-		if self.fft:
+		if not self.not_single_frame:
 			data = self.data.selectframes(self.firstframe, self.firstframe, 1)
 		else:
 			data = self.data.selectframes(self.firstframe, self.lastframe, self.stepframe)
@@ -386,6 +476,11 @@ class CameraTrendGUI(DoubleTimeTrendGUI, CameraGUI, XlimitsMixin):
 		else:
 			self.data.fourierfilter = False
 		self.data.fourierwindow = self.fourierfilter.get_window_tuple()
+		self.data.fourierblocks = self.fourierfilter.get_block_settings()
+		if self.welch:
+			self.data.welch = self.welch_segment, self.welch_overlap, self.welch_window
+		else:
+			self.data.welch = None
 
 		y1 = data.selectchannels(lambda chan: chan.id in self.selected_primary_channels)
 		y2 = data.selectchannels(lambda chan: chan.id in self.selected_secondary_channels)
@@ -400,8 +495,8 @@ class CameraTrendGUI(DoubleTimeTrendGUI, CameraGUI, XlimitsMixin):
 			traitsui.Item('visible'),
 			traitsui.Item('filename', editor=support.FileEditor(filter=['Camera RAW files (*.raw)', '*.raw', 'All files', '*'], entries=0)),
 			traitsui.Item('firstframe', label='First frame', editor=support.RangeEditor(low=0, high_name='framecount', mode='spinner')),
-			traitsui.Item('lastframe', label='Last frame', editor=support.RangeEditor(low=0, high_name='framecount', mode='spinner'), enabled_when='not_fft'),
-			traitsui.Item('stepframe', label='Key frame mode', enabled_when='not_fft', editor=support.RangeEditor(low=1, high=1000000000, mode='spinner')),
+			traitsui.Item('lastframe', label='Last frame', editor=support.RangeEditor(low=0, high_name='framecount', mode='spinner'), enabled_when='not_single_frame'),
+			traitsui.Item('stepframe', label='Key frame mode', enabled_when='not_single_frame', editor=support.RangeEditor(low=1, high=1000000000, mode='spinner')),
 			traitsui.Item('direction', editor=traitsui.EnumEditor(values=support.EnumMapping([(1, 'L2R'), (2, 'R2L'), (3, 'both')]))),
 			traitsui.Item('averaging', tooltip='Per-line averaging', enabled_when='not_fft'),
 			traitsui.Item('edit_fourierfilter', show_label=False, editor=traitsui.ButtonEditor(label='1D fourier options...')),
@@ -413,6 +508,10 @@ class CameraTrendGUI(DoubleTimeTrendGUI, CameraGUI, XlimitsMixin):
 		traitsui.Group(
 			traitsui.Item('xaxis_type', label='Data', editor=traitsui.EnumEditor(name='xaxis_type_options')),
 			traitsui.Item('xlimits', style='custom', label='Limits', enabled_when='independent_x'),
+			traitsui.Item('fft_mode', label='Spectrum', enabled_when='fft', editor=traitsui.EnumEditor(values=support.EnumMapping([('periodogram', 'Periodogram (first frame)'), ('welch', 'Welch average (frame range)')]))),
+			traitsui.Item('welch_segment', label='Segment length', enabled_when='welch', editor=support.RangeEditor(low=16, high=2**22, mode='spinner')),
+			traitsui.Item('welch_overlap', label='Segment overlap', enabled_when='welch', editor=support.FloatEditor()),
+			traitsui.Item('welch_window', label='Segment window', enabled_when='welch'),
 			show_border=True,
 			label='X-axis',
 		),
@@ -61,25 +61,30 @@ class CameraTrend(XAxisHandling, DoubleMultiTrend):
 		if self.xdata or self.fft:
 			self.set_xlog()
 
+	def get_marker_index(self, value, side):
+		index = numpy.searchsorted(self.xdata.time, value, side)
+		if index == self.xdata.time.size:
+			index -= 1
+		return index
+
 	def draw_marker(self, marker):
 		if self.fft:
 			return
 		elif not self.xdata:
 			return super(CameraTrend, self).draw_marker(marker)
 
-		points = []
+		channels = list(itertools.chain(self.data.iterchannels(), self.secondarydata.iterchannels()))
+		def get_points():
+			indices = [(self.get_marker_index(marker.left, 'left'), 'go')]
+			if marker.interval():
+				indices.append((self.get_marker_index(marker.right, 'right'), 'ro'))
+			return [(self.xdata.value[index], ydata.value[index], style) for (index, style) in indices for ydata in channels]
 
-		index_left = numpy.searchsorted(self.xdata.time, marker.left, 'left')
-		if index_left == self.xdata.time.size:
-			index_left -= 1
-		for ydata in itertools.chain(self.data.iterchannels(), self.secondarydata.iterchannels()):
-			points.append(self.axes.plot([self.xdata.value[index_left]], [ydata.value[index_left]], 'go', zorder=1e9)[0])
+		points = [self.axes.plot([x], [y], style, zorder=1e9)[0] for (x, y, style) in get_points()]
 
-		if marker.interval():
-			index_right = numpy.searchsorted(self.xdata.time, marker.right, 'right')
-			if index_right == self.xdata.time.size:
-				index_right -= 1
-			for ydata in itertools.chain(self.data.iterchannels(), self.secondarydata.iterchannels()):
-				points.append(self.axes.plot([self.xdata.value[index_right]], [ydata.value[index_right]], 'ro', zorder=1e9)[0])
+		def move():
+			for point, (x, y, style) in zip(points, get_points()):
+				point.set_data([x], [y])
+			return self.axes,
 
-		marker.add_callback(lambda:	[self.axes.lines.remove(point) for point in points if point in self.axes.lines])
+		marker.add_callback(lambda:	[self.axes.lines.remove(point) for point in points if point in self.axes.lines], move)
@@ -18,7 +18,6 @@
 
 from __future__ import division
 
-import datetime
 import numpy
 import glob
 import os
@@ -34,6 +33,10 @@ class QuaderaScan(MultiTrend):
 		super(QuaderaScan, self).__init__(*args, **kwargs)
 		self.masses, self.time_data, self.ion_data, self.channels = pypy.loadscan(self.filename)
 
+	@staticmethod
+	def prefetch(filename):
+		pypy.loadscan.prefetch(filename)
+
 	def iterimages(self):
 		d = util.Struct()
 		d.data = self.ion_data.transpose()
@@ -47,10 +50,54 @@ class QuaderaScan(MultiTrend):
 class QuaderaMID(MultiTrend):
 	channels = None
 	masses = None
+	follow_supported = True
+	follow_buffers = None
 
 	def __init__(self, *args, **kwargs):
 		super(QuaderaMID, self).__init__(*args, **kwargs)
-		self.header, self.masses, self.channels = pypy.loadmid(self.filename)
+		self.header, self.masses, self.channels, self.follow_state = pypy.loadmid(self.filename)
+
+	@staticmethod
+	def prefetch(filename):
+		pypy.loadmid.prefetch(filename)
+
+	def follow(self):
+		state = self.follow_state
+		with open(self.filename, 'rb') as fp:
+			fp.seek(0, 2)
+			size = fp.tell()
+			if size < state.offset: # the file has been replaced
+				self.follow_buffers = None
+				self.__init__(self.filename)
+				return True
+			fp.seek(state.offset)
+			text = fp.read(size - state.offset)
+
+		end = text.rfind('\n') + 1 # only complete lines
+		if not end:
+			return False
+		rows = [pypy.parseLine(line)[:state.padlength] for line in text[:end].splitlines() if line.strip()]
+		rawdata = pypy.padLines(rows, state.padlength).reshape(-1, state.padlength)
+
+		if self.follow_buffers is None:
+			self.follow_buffers = []
+			for chan in self.channels:
+				buffers = util.GrowableArray(capacity=int(1.5 * chan.time.size) + 1024), util.GrowableArray(capacity=int(1.5 * chan.value.size) + 1024)
+				buffers[0].append(chan.time)
+				buffers[1].append(chan.value)
+				self.follow_buffers.append(buffers)
+
+		for i, (chan, (time, value)) in enumerate(zip(self.channels, self.follow_buffers)):
+			time.truncate(len(time) - state.pending)
+			value.truncate(len(value) - state.pending)
+			time.append(rawdata[:, 2*i] / 86400. + self.header.starttime)
+			value.append(rawdata[:, 2*i+1])
+			chan.time = time.array
+			chan.value = value.array
+
+		state.offset += end
+		state.pending = 0
+		return True
 
 
 class MKSPeakJump(MultiTrend):
@@ -61,12 +108,10 @@ class MKSPeakJump(MultiTrend):
 	# day N 12:59 (AM) -> day N 1:00 (AM) (correct 12:59 to 0:59)
 	# day N 12:59 (PM) -> day N 1:00 (PM) (correct 1:00 to 13:00)
 
-	def parsetime(self, s):
-		s = s.strip('"')
-		dt = datetime.datetime.strptime(s, '%Y-%m-%d %H:%M:%S')
-		if dt.hour == 12:
-			dt = dt.replace(hour = 0)
-		return util._to_ordinalf(dt), util.mpldtfromdatetime(util.localtz.localize(dt))
+	def parsetimes(self, strings):
+		fields = list(util.strptime_fields((s.strip('"') for s in strings), '%Y-%m-%d %H:%M:%S'))
+		fields[3][fields[3] == 12] = 0
+		return util.mpldtfromfields(*fields, tz=None), util.mpldtfromfields(*fields)
 
 	def __init__(self, *args, **kwargs):
 		super(MKSPeakJump, self).__init__(*args, **kwargs)
@@ -81,19 +126,16 @@ class MKSPeakJump(MultiTrend):
 			header = fp.readline().split(',')
 			self.masses = [h.strip('"') for h in header[2:-1]]
 			data = []
-			times = []
-			tztimes = []
+			timestrings = []
 			while 1:
 				line = fp.readline()
 				if line == '':
 					break
 				ld = line.split(',')
-				t, ttz = self.parsetime(ld[0])
-				times.append(t)
-				tztimes.append(ttz)
+				timestrings.append(ld[0])
 				data.append([float(i) for i in ld[2:-1]])
 
-		tztimes = numpy.array(tztimes)
+		times, tztimes = self.parsetimes(timestrings)
 		midnight = numpy.where(numpy.diff(numpy.floor(times)) == 1)[0] + 1
 		error = numpy.where(numpy.abs(numpy.diff(times)) > 0.4)[0] + 1
 		midday = numpy.array(list(e for e in error if not e in midnight))
@@ -173,7 +215,7 @@ class SRSAnalog(MultiTrend):
 						raise ValueError('invalid file')
 					header.append(line.strip())
 				timestamp = util.mpldtstrptime(header[0], '%b %d, %Y  %I:%M:%S %p') #  Jan 17, 2014  01:00:01 PM
-				masses, signal = numpy.loadtxt(fp, delimiter=',', usecols=(0,1)).T
+				masses, signal = util.loadtxt(fp, delimiter=',', usecols=(0,1)).T
 				if prevmasses is not None and (masses != prevmasses).any():
 					raise ValueError('file format not supported: mass range has changed during measurement')
 				prevmasses = masses
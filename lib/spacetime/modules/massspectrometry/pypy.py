@@ -44,6 +44,19 @@ def parseLine(line):
 	assert len(data) % 3 == 0
 	return [floatnan(d) for (i,d) in enumerate(data) if (i % 3) in (1, 2)]
 
+def parseIncompleteLine(line):
+	# returns None if the line is cut halfway a channel
+	try:
+		return parseLine(line)
+	except (AssertionError, ValueError):
+		return None
+
+def padLines(data, padlength):
+	nanlist = [numpy.nan]
+	for line in data:
+		line.extend(nanlist * (padlength - len(line)))
+	return numpy.array(data)
+
 @util.pypy
 def loadscan(filename):
 	with util.LineCounter(filename) as fp:
@@ -127,14 +140,33 @@ def loadmid(filename):
 		masses = fp.readline().strip().split('\t\t\t')
 		columntitles = fp.readline() # not used
 		
-		data = [parseLine(line) for line in fp if line.strip()]
+		data = []
+		previous = ''
+		for line in fp:
+			if previous.strip():
+				data.append(parseLine(previous))
+			previous = line
+		end = fp.tell()
+
+		# The file might still be written to: remember where to continue
+		# reading, and whether the last row has to be replaced then.
+		follow = util.Struct()
+		follow.offset = end
+		follow.pending = 0
+		if previous.endswith('\n'):
+			if previous.strip():
+				data.append(parseLine(previous))
+		else:
+			follow.offset = end - len(previous)
+			row = parseIncompleteLine(previous) if previous.strip() else None
+			if row is not None:
+				data.append(row)
+				follow.pending = 1
 
 		# the number of channels can be changed during measurement, and the last line is not guaranteed to be complete
 		padlength = len(data[0]) # we assume that the first line is always the longest, this seems to be valid even when adding channels halfway
-		nanlist = [numpy.nan]
-		for line in data:
-			line.extend(nanlist * (padlength - len(line)))
-		rawdata = numpy.array(data)
+		follow.padlength = padlength
+		rawdata = padLines(data, padlength)
 
 		channels = []
 		for i, mass in enumerate(masses):
@@ -145,4 +177,4 @@ def loadmid(filename):
 			d.value = rawdata[:,2*i+1]
 			channels.append(d)
 
-		return header, masses, channels
+		return header, masses, channels, follow
@@ -19,14 +19,18 @@
 from ..generic.subplots import MultiTrend, Time2D
 
 class Normalization(object):
-	normalization_factor = normalization_channel = 1
+	normalization_factor = 1
+	normalization_channel = None
 
 	def set_normalization(self, factor, channel=None):
 		self.normalization_factor = factor
-		if channel:
-			self.normalization_channel = next(channel.iterchannels()).value
-		else:
-			self.normalization_channel = 1
+		self.normalization_channel = channel
+
+	def get_normalization_channel(self):
+		# evaluated on every draw, the channel data may have grown in the meantime
+		if self.normalization_channel:
+			return next(self.normalization_channel.iterchannels()).value
+		return 1
 
 
 class MSTrend(MultiTrend, Normalization):
@@ -35,7 +39,7 @@ class MSTrend(MultiTrend, Normalization):
 		self.axes.set_ylabel('Ion current (A)')
 
 	def get_ydata(self, chandata):
-		return chandata.value * self.normalization_factor / self.normalization_channel
+		return chandata.value * self.normalization_factor / self.get_normalization_channel()
 
 
 class MS2D(Time2D, Normalization):
@@ -44,4 +48,4 @@ class MS2D(Time2D, Normalization):
 		self.axes.set_ylabel('Mass (a.m.u.)')
 
 	def get_imdata(self, imdata):
-		return imdata.data * self.normalization_factor / self.normalization_channel
+		return imdata.data * self.normalization_factor / self.get_normalization_channel()
@@ -77,14 +77,25 @@ class AbsoluteGridSpec(matplotlib.gridspec.GridSpecBase):
 class Marker(object):
 	def __init__(self, left, right=None):
 		self.callbacks = []
+		self.movers = []
+		self.movable = True
 		self._set_params(left, right)
 
-	def add_callback(self, callback):
+	def add_callback(self, callback, mover=None):
+		# callback removes the artists drawn for this marker, mover (optional)
+		# moves them to the current position and returns the affected axes
 		self.callbacks.append(callback)
+		if mover:
+			self.movers.append(mover)
+		else:
+			self.movable = False
 
 	def clear(self):
 		for callback in self.callbacks:
 			callback()
+		self.callbacks = []
+		self.movers = []
+		self.movable = True
 
 	def draw(self):
 		for s in self.plot.subplots:
@@ -96,6 +107,15 @@ class Marker(object):
 		self.right = right
 
 	def move(self, left, right=None):
+		# returns the axes that have changed if the existing artists could be
+		# moved, or None if the marker had to be redrawn
+		if self.movable and (right is None) == (self.right is None):
+			self.left = left
+			self.right = right
+			axes = set()
+			for mover in self.movers:
+				axes.update(mover())
+			return axes
 		self._set_params(left, right)
 		self.draw()
 
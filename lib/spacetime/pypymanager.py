@@ -20,15 +20,28 @@ import os
 import traceback
 import subprocess
 import threading
+import Queue
+import tempfile
+import mmap
+import glob
+import errno
 if __name__ != '__main__': # otherwise the relative import will fail
 	from . import upickle
 
 # this module behaves as a singleton object when imported, and also serves as
-# the entry point for the delegate (pypy) process
+# the entry point for the delegate (pypy) processes
 
-delegate = None
-stderrthread = None
+delegates = []
+jobs = None
 _executable = None
+_prefetched = {}
+_prefetched_lock = threading.Lock()
+
+# arrays of at least this many bytes in results are passed through a shared
+# temporary file instead of the pipe
+shm_threshold = 64 * 1024
+_shm_dir = None
+_shm_owner = os.getpid() # the GUI process, delegates get it on the command line
 
 class PyPyException(Exception):
 	def __init__(self, exception, tb):
@@ -40,80 +53,363 @@ class PyPyException(Exception):
 		self.exception = exception
 		self.traceback = tb
 
-def set_executable(executable):
-	global _executable
-	_executable = executable
 
-def shutdown_delegate():
-	global delegate, stderrthread
+class Future(object):
+	# result of a job submitted with submit()
+	def __init__(self):
+		self.event = threading.Event()
+		self.value = None
+		self.error = None
 
-	if delegate:
-		if delegate.poll() is None:
-			delegate.terminate()
-			delegate.wait()
-		# FIXME: do something with delegate.returncode?
-		delegate = None
+	def set_result(self, value):
+		self.value = value
+		self.event.set()
 
-	if stderrthread:
-		stderrthread.join()
-		stderrthread = None
+	def set_exception(self, error):
+		self.error = error
+		self.event.set()
 
-def launch_delegate():
-	global delegate, stderrthread
-	shutdown_delegate() # cleanup any old delegates first
+	def done(self):
+		return self.event.is_set()
+
+	def exception(self, timeout=None):
+		self.wait(timeout)
+		return self.error
+
+	def result(self, timeout=None):
+		self.wait(timeout)
+		if self.error is not None:
+			raise self.error
+		return self.value
+
+	def wait(self, timeout=None):
+		# Event.wait() without timeout cannot be interrupted by Ctrl+C
+		if not self.event.wait(timeout if timeout is not None else 1e9):
+			raise RuntimeError('timeout waiting for delegate')
+
+
+class Delegate(object):
+	# a single pypy process, with a thread that feeds it jobs from the queue
+	def __init__(self, jobs):
+		self.jobs = jobs
+		self.process = None
+		self.stderrthread = None
+		self.closed = False
+		self.launch()
+		self.thread = threading.Thread(target=self.run, name='pypy delegate')
+		self.thread.daemon = True
+		self.thread.start()
+
+	def launch(self):
+		self.shutdown_process()
+		self.process = subprocess.Popen(
+				[_executable, _get_script(), str(os.getpid())],
+				stdin=subprocess.PIPE,
+				stdout=subprocess.PIPE,
+				stderr=subprocess.PIPE,
+				close_fds=(not subprocess.mswindows),
+			)
+
+		def readstderr(stderr):
+			# a simple "for line in stderr" does not work here since it uses a large buffer,
+			# this approach uses stderr.readline() which is slower but more responsive
+			for line in iter(stderr.readline, ""):
+				print "PyPy:", line,
+			stderr.close()
+		self.stderrthread = threading.Thread(target=readstderr, args=(self.process.stderr,))
+		self.stderrthread.daemon = True
+		self.stderrthread.start()
+
+	def check(self):
+		if self.process and self.process.poll() is None:
+			return True
+		if self.closed:
+			return False
+		# FIXME: do something with process.returncode?
+		try:
+			self.launch()
+		except OSError:
+			return False
+		return self.process.poll() is None
+
+	def run(self):
+		while 1:
+			job = self.jobs.get()
+			if job is None:
+				break
+			future, func, args, kwargs = job
+			try:
+				if self.check():
+					put(self.process.stdin, (func.__module__, func.__name__, args, kwargs))
+					exception, tb, result = get(self.process.stdout)
+					if exception:
+						future.set_exception(PyPyException(exception, tb))
+					else:
+						future.set_result(result)
+				else:
+					# FIXME: show warning, delegate could not be restarted
+					future.set_result(func(*args, **kwargs))
+			except Exception as e:
+				future.set_exception(e)
+
+	def close(self):
+		self.closed = True
+		self.shutdown_process()
+
+	def shutdown_process(self):
+		if self.process:
+			if self.process.poll() is None:
+				self.process.terminate()
+				self.process.wait()
+			self.process = None
+		if self.stderrthread:
+			self.stderrthread.join()
+			self.stderrthread = None
 
+
+def _get_script():
 	self = os.path.realpath(__file__)
 	if self.endswith('.pyc'):
 		# refer to the .py because PyPy/CPython cannot read each other's .pyc files
 		self = self[:-1]
-	delegate = subprocess.Popen(
-			[_executable, self],
-			stdin=subprocess.PIPE,
-			stdout=subprocess.PIPE,
-			stderr=subprocess.PIPE,
-			close_fds=(not subprocess.mswindows),
-		)
-
-	def readstderr(stderr):
-		# a simple "for line in stderr" does not work here since it uses a large buffer,
-		# this approach uses stderr.readline() which is slower but more responsive
-		for line in iter(stderr.readline, ""):
-			print "PyPy:", line,
-		stderr.close()
-	stderrthread = threading.Thread(target=readstderr, args=(delegate.stderr,))
-	stderrthread.start()
-
-def check_delegate():
-	if delegate.poll() is None:
-		return True
-	# FIXME: do something with delegate.returncode?
-	launch_delegate()
-	if delegate.poll() is None:
-		return True
+	return self
+
+def set_executable(executable):
+	global _executable
+	_executable = executable
+
+def shutdown_delegate():
+	global delegates, jobs
+	if jobs:
+		# cancel the jobs that did not start yet, and stop the threads
+		while 1:
+			try:
+				job = jobs.get_nowait()
+			except Queue.Empty:
+				break
+			if job:
+				job[0].set_exception(RuntimeError('delegate has been shut down'))
+		for d in delegates:
+			jobs.put(None)
+	for d in delegates:
+		d.close()
+	for d in delegates:
+		d.thread.join()
+	delegates = []
+	jobs = None
+	clear_prefetched()
+	cleanup_shared_files()
+
+def launch_delegate(processes=None):
+	# starts a pool of delegate processes, by default one per core
+	global delegates, jobs
+	shutdown_delegate() # cleanup any old delegates first
+	if processes is None:
+		import multiprocessing
+		processes = multiprocessing.cpu_count()
+	jobs = Queue.Queue()
+	delegates = [Delegate(jobs) for i in range(processes)]
+
+def submit(func, *args, **kwargs):
+	# runs func in one of the delegates, returns a Future; without
+	# delegates, func runs right away in this process
+	future = Future()
+	if delegates:
+		jobs.put((future, func, args, kwargs))
 	else:
-		# FIXME: show warning, delegate could not be restarted
-		return False
+		# fall back to good old-fashioned DIY
+		try:
+			future.set_result(func(*args, **kwargs))
+		except Exception as e:
+			future.set_exception(e)
+	return future
+
+def prefetch(func, *args, **kwargs):
+	# Starts a job whose result will be asked for with run() shortly, e.g.
+	# to parse the files of all graphs at the same time. Results that are
+	# not picked up are dropped by clear_prefetched().
+	if not delegates:
+		return
+	key = _get_key(func, args, kwargs)
+	with _prefetched_lock:
+		if key not in _prefetched:
+			_prefetched[key] = submit(func, *args, **kwargs)
+
+def clear_prefetched():
+	with _prefetched_lock:
+		_prefetched.clear()
+
+def _get_key(func, args, kwargs):
+	try:
+		key = func.__module__, func.__name__, args, tuple(sorted(kwargs.items()))
+		hash(key)
+	except TypeError:
+		return None
+	return key
 
 def run(func, *args, **kwargs):
-	if delegate and check_delegate():
-		put(delegate.stdin, (func.__module__, func.__name__, args, kwargs))
-		exception, traceback, result = get(delegate.stdout)
-		if exception:
-			raise PyPyException(exception, traceback)
-		return result
-		
-	# fall back to good old-fashioned DIY
-	return func(*args, **kwargs)
-
-def put(pipe, obj):
-	upickle.dump(obj, pipe, upickle.HIGHEST_PROTOCOL)
+	if not delegates:
+		# fall back to good old-fashioned DIY
+		return func(*args, **kwargs)
+	if _prefetched:
+		with _prefetched_lock:
+			future = _prefetched.pop(_get_key(func, args, kwargs), None)
+		if future:
+			return future.result()
+	return submit(func, *args, **kwargs).result()
+
+def _get_shm_dir():
+	# /dev/shm is backed by memory, otherwise use the default temp dir
+	global _shm_dir
+	if _shm_dir is None:
+		if os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK):
+			_shm_dir = '/dev/shm'
+		else:
+			_shm_dir = tempfile.gettempdir()
+	return _shm_dir
+
+def _process_exists(pid):
+	if os.name == 'nt':
+		return True # os.kill() would terminate it
+	try:
+		os.kill(pid, 0)
+	except OSError as e:
+		return e.errno == errno.EPERM
+	return True
+
+def cleanup_shared_files():
+	# Removes the files of results that were never read, e.g. from a delegate
+	# that was terminated in between: our own (no delegates should be running)
+	# and those of Spacetime processes that no longer exist.
+	for path in glob.glob(os.path.join(_get_shm_dir(), 'spacetime-*-*.shm')):
+		try:
+			owner = int(os.path.basename(path).split('-')[1])
+		except ValueError:
+			continue
+		if owner == os.getpid() or not _process_exists(owner):
+			try:
+				os.remove(path)
+			except OSError:
+				pass
+
+
+class SharedArrayWriter(object):
+	# Pickler.persistent_id hook: writes the data of large arrays into a single
+	# temporary file and replaces them with a (dtype, shape, offset)
+	# descriptor. Anything else, or anything that goes wrong, is pickled as
+	# usual.
+	alignment = 64
+
+	def __init__(self):
+		self.file = None
+		self.path = None
+		self.offset = 0
+		self.shared = 0
+		self.failed = False
+		try:
+			from numpy import ndarray
+		except ImportError:
+			ndarray = None
+		self.ndarray = ndarray
+
+	def __call__(self, obj):
+		# no subclasses: a MaskedArray would lose its mask
+		if self.failed or self.ndarray is None or type(obj) is not self.ndarray:
+			return None
+		if obj.dtype.kind not in 'biufc' or obj.nbytes < shm_threshold:
+			return None
+		try:
+			if self.file is None:
+				fd, self.path = tempfile.mkstemp(prefix='spacetime-{0}-'.format(_shm_owner), suffix='.shm', dir=_get_shm_dir())
+				self.file = os.fdopen(fd, 'wb')
+			pad = -self.offset % self.alignment
+			self.file.write('\0' * pad)
+			self.offset += pad
+			offset = self.offset
+			data = obj.tostring() # C order, also for non-contiguous arrays
+			self.file.write(data)
+			self.offset += len(data)
+		except (IOError, OSError, MemoryError):
+			# the arrays shared so far are still valid
+			self.failed = True
+			self.close()
+			return None
+		self.shared += 1
+		return ('shm', self.path, obj.dtype.str, tuple(obj.shape), offset)
+
+	def close(self, discard=False):
+		if self.file:
+			self.file.close()
+			self.file = None
+		if (discard or not self.shared) and self.path:
+			try:
+				os.remove(self.path)
+			except OSError:
+				pass
+			self.path = None
+
+
+class SharedArrayReader(object):
+	# Unpickler.persistent_load hook, counterpart of SharedArrayWriter. The
+	# file is mapped copy-on-write and removed afterwards: the arrays keep the
+	# mapping alive. Windows cannot remove a mapped file, so there the data is
+	# read instead.
+	def __init__(self):
+		self.maps = {}
+		self.paths = set()
+
+	def __call__(self, pid):
+		tag, path, dtype, shape, offset = pid
+		if tag != 'shm':
+			raise upickle.UnpicklingError('unsupported persistent id {0!r}'.format(tag))
+		import numpy
+		self.paths.add(path)
+		dtype = numpy.dtype(dtype)
+		count = int(numpy.prod(shape))
+		if os.name == 'nt':
+			with open(path, 'rb') as fp:
+				fp.seek(offset)
+				return numpy.fromfile(fp, dtype, count).reshape(shape)
+		if path not in self.maps:
+			with open(path, 'rb') as fp:
+				self.maps[path] = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_COPY)
+		return numpy.frombuffer(self.maps[path], dtype, count, offset).reshape(shape)
+
+	def close(self):
+		self.maps = {}
+		for path in self.paths:
+			try:
+				os.remove(path)
+			except OSError:
+				pass
+		self.paths = set()
+
+
+def put(pipe, obj, share_arrays=False):
+	if share_arrays:
+		# pickle to a string first, the file has to be complete before the
+		# descriptors are sent
+		writer = SharedArrayWriter()
+		try:
+			data = upickle.dumps(obj, upickle.HIGHEST_PROTOCOL, persistent_id=writer)
+		except:
+			writer.close(discard=True)
+			raise
+		writer.close()
+		pipe.write(data)
+	else:
+		upickle.dump(obj, pipe, upickle.HIGHEST_PROTOCOL)
 	pipe.flush()
 
 def get(pipe):
-	return upickle.load(pipe)
+	reader = SharedArrayReader()
+	try:
+		return upickle.load(pipe, persistent_load=reader)
+	finally:
+		reader.close()
 
 
-# this is where the delegate process (pypy!) enters
+# this is where the delegate processes (pypy!) enter
 if __name__ == '__main__':
 	def debug(s):
 		sys.stderr.write(s)
@@ -136,6 +432,10 @@ if __name__ == '__main__':
 	except ImportError: # we're probably not running in PyPy, who cares
 		pass
 	
+	# shared files are named after the GUI process, see cleanup_shared_files()
+	if len(sys.argv) > 1:
+		_shm_owner = int(sys.argv[1])
+
 	# to allow print statements for debugging
 	pipe = sys.stdout
 	sys.stdout = sys.stderr
@@ -162,4 +462,4 @@ if __name__ == '__main__':
 		finally:
 			# by now, result is guaranteed to be defined as a 3-tuple
 			# there's no exception handling: we want to abort if something goes wrong
-			put(pipe, result)
+			put(pipe, result, share_arrays=True)
@@ -15,12 +15,25 @@ import sys
 import platform
 import inspect
 
-__all__ = ['dump', 'dumps', 'load', 'loads', 'HIGHEST_PROTOCOL', 'PickleError']
+__all__ = ['dump', 'dumps', 'load', 'loads', 'HIGHEST_PROTOCOL', 'PickleError', 'UnpicklingError']
 
-dump = pickle.dump
-dumps = pickle.dumps
 HIGHEST_PROTOCOL = pickle.HIGHEST_PROTOCOL
 PickleError = pickle.PickleError
+UnpicklingError = pickle.UnpicklingError
+
+# persistent_id and persistent_load work as in the pickle module, they are
+# set as attributes since real cPickle's (Un)Pickler cannot be subclassed
+
+def dump(obj, fileobj, protocol=0, persistent_id=None):
+	pickler = pickle.Pickler(fileobj, protocol)
+	if persistent_id:
+		pickler.persistent_id = persistent_id
+	pickler.dump(obj)
+
+def dumps(obj, protocol=0, persistent_id=None):
+	fileobj = StringIO()
+	dump(obj, fileobj, protocol, persistent_id)
+	return fileobj.getvalue()
 
 if platform.python_implementation() == 'PyPy':
 	# numpy -> numpypy
@@ -52,9 +65,11 @@ if inspect.isbuiltin(pickle.Unpickler):
 		__import__(module)
 		return getattr(sys.modules[module], name)
 
-	def load(fileobj):
+	def load(fileobj, persistent_load=None):
 		unpickler = pickle.Unpickler(fileobj)
 		unpickler.find_global = _find_global
+		if persistent_load:
+			unpickler.persistent_load = persistent_load
 		return unpickler.load()
 
 else:
@@ -64,10 +79,12 @@ else:
 			module, name = _translate(module, name)
 			return pickle.Unpickler.find_class(self, module, name)
 
-	def load(fileobj):
+	def load(fileobj, persistent_load=None):
 		unpickler = _Unpickler(fileobj)
+		if persistent_load:
+			unpickler.persistent_load = persistent_load
 		return unpickler.load()
 
 
-def loads(str):
-	return load(StringIO(str))
+def loads(str, persistent_load=None):
+	return load(StringIO(str), persistent_load)
@@ -20,9 +20,12 @@ import datetime, pytz
 import numpy
 import subprocess
 import threading, Queue
-import os, platform
-import functools
+import os, sys, platform
+import functools, itertools
+import collections
+import weakref
 import traceback
+import warnings
 
 from .superstruct import Struct
 from .detect_timezone import detect_timezone
@@ -126,6 +129,264 @@ def mpldtstrptime(str, format, tz=localtz):
 	return mpldtfromdatetime(tz.localize(datetime.datetime.strptime(str, format)))
 
 
+# Array versions of the conversions above. These give the same floats as
+# their scalar counterparts, but do the timezone lookup on a precomputed table
+# of UTC offset transitions instead of calling tz.localize() for every value.
+
+_EPOCH = datetime.datetime(1970, 1, 1)
+_EPOCH_ORDINAL = _EPOCH.toordinal()
+
+class TimezoneTable(object):
+	_cache = {}
+
+	def __init__(self, tz):
+		# transition times are in UTC, seconds since the epoch
+		if hasattr(tz, '_utc_transition_times'):
+			self.times = numpy.array([self._seconds(t - _EPOCH) for t in tz._utc_transition_times], dtype=numpy.int64)
+			self.offsets = numpy.array([self._seconds(i[0]) for i in tz._transition_info], dtype=numpy.int64)
+			self.dst = numpy.array([bool(i[1]) for i in tz._transition_info])
+		else: # UTC and other fixed offset zones
+			self.times = numpy.zeros(1, dtype=numpy.int64)
+			self.offsets = numpy.array([self._seconds(tz.localize(_EPOCH).utcoffset())], dtype=numpy.int64)
+			self.dst = numpy.zeros(1, dtype=bool)
+
+	@staticmethod
+	def _seconds(td):
+		return td.days * 86400 + td.seconds
+
+	@classmethod
+	def get(cls, tz):
+		if tz.zone not in cls._cache:
+			cls._cache[tz.zone] = cls(tz)
+		return cls._cache[tz.zone]
+
+	def index(self, seconds):
+		return numpy.maximum(self.times.searchsorted(seconds, side='right') - 1, 0)
+
+	def utcoffset(self, utcseconds):
+		return self.offsets[self.index(utcseconds)]
+
+	def localize(self, localseconds):
+		# mimics pytz's tz.localize(dt, is_dst=False), returns UTC offsets in seconds
+		localseconds = numpy.asarray(localseconds, dtype=numpy.int64)
+
+		# pytz considers the zones in effect one day before and after the naive time
+		valid = []
+		candidates = []
+		for delta in (-86400, 86400):
+			offset = self.offsets[self.index(localseconds + delta)]
+			i = self.index(localseconds - offset)
+			valid.append(self.offsets[i] == offset)
+			candidates.append(i)
+		(valida, validb), (ia, ib) = valid, candidates
+
+		offsets = numpy.where(valida, self.offsets[ia], self.offsets[ib])
+
+		# ambiguous times (end of DST): prefer standard time, otherwise the latest UTC time
+		ambiguous = valida & validb & (self.offsets[ia] != self.offsets[ib])
+		if ambiguous.any():
+			dsta, dstb = self.dst[ia[ambiguous]], self.dst[ib[ambiguous]]
+			offa, offb = self.offsets[ia[ambiguous]], self.offsets[ib[ambiguous]]
+			offsets[ambiguous] = numpy.where(dsta == dstb, numpy.minimum(offa, offb), numpy.where(dsta, offb, offa))
+
+		# non-existent times (start of DST): pytz uses the zone from six hours earlier
+		nonexistent = ~(valida | validb)
+		if nonexistent.any():
+			offsets[nonexistent] = self.localize(localseconds[nonexistent] - 6 * 3600)
+		return offsets
+
+
+def _days_from_civil(year, month, day):
+	# proleptic Gregorian date to days since 1970-1-1, vectorized
+	year = year - (month <= 2)
+	era = numpy.floor_divide(year, 400)
+	yoe = year - era * 400
+	doy = (153 * (month + numpy.where(month > 2, -3, 9)) + 2) // 5 + day - 1
+	doe = yoe * 365 + yoe // 4 - yoe // 100 + doy
+	return era * 146097 + doe - 719468
+
+
+def _mpldtfromseconds(seconds, microsecond):
+	# seconds since the epoch (UTC) to float days, summed exactly like _to_ordinalf
+	days = seconds // 86400
+	secs = seconds - days * 86400
+	hour, minute, second = secs // 3600, secs % 3600 // 60, secs % 60
+	base = (days + _EPOCH_ORDINAL).astype(float)
+	return base + (hour/HOURS_PER_DAY + minute/MINUTES_PER_DAY + second/SECONDS_PER_DAY + microsecond/MUSECONDS_PER_DAY)
+
+
+def mpldtfromfields(year, month, day, hour=0, minute=0, second=0, microsecond=0, tz=localtz):
+	# array equivalent of mpldtlikedatetime(), use tz=None for naive times
+	year, month, day, hour, minute, second, microsecond = (numpy.asarray(i, dtype=numpy.int64) for i in (year, month, day, hour, minute, second, microsecond))
+	seconds = _days_from_civil(year, month, day) * 86400 + hour * 3600 + minute * 60 + second
+	if tz is not None:
+		seconds = seconds - TimezoneTable.get(tz).localize(seconds)
+	return _mpldtfromseconds(seconds, microsecond)
+
+
+def mpldtfromtimestamp_array(ts, tz=localtz):
+	# array equivalent of mpldtfromtimestamp(), non-finite timestamps give NaN
+	ts = numpy.asarray(ts, dtype=float)
+	finite = numpy.isfinite(ts)
+	ts = numpy.where(finite, ts, 0)
+
+	# the same rounding as datetime.fromtimestamp()
+	seconds = numpy.trunc(ts)
+	us = (ts - seconds) * 1e6
+	us = numpy.sign(us) * numpy.floor(numpy.abs(us) + 0.5)
+	seconds = seconds.astype(numpy.int64) - (us < 0) + (us == 1000000)
+	us = numpy.where(us < 0, us + 1000000, us)
+	us = numpy.where(us == 1000000, 0, us).astype(numpy.int64)
+
+	# fromtimestamp() gives the local time, which is then interpreted in tz
+	local = seconds + TimezoneTable.get(localtz).utcoffset(seconds)
+	seconds = local - TimezoneTable.get(tz).localize(local)
+
+	ret = _mpldtfromseconds(seconds, us)
+	ret[~finite] = numpy.nan
+	return ret
+
+
+_strptime_fields = {
+	# directive: (width, field)
+	'Y': (4, 'year'),
+	'y': (2, 'year'),
+	'm': (2, 'month'),
+	'd': (2, 'day'),
+	'H': (2, 'hour'),
+	'I': (2, 'hour'),
+	'M': (2, 'minute'),
+	'S': (2, 'second'),
+	'f': (None, 'microsecond'),
+	'p': (2, None),
+	'b': (3, 'month'),
+}
+_strptime_months = [datetime.date(2000, i, 1).strftime('%b').lower() for i in range(1, 13)]
+_strptime_order = ('year', 'month', 'day', 'hour', 'minute', 'second', 'microsecond')
+
+def _strptime_layout(format, length):
+	# split a strptime format in fixed width fields, returns None if that is not possible
+	tokens = []
+	i = 0
+	while i < len(format):
+		if format[i] != '%':
+			tokens.append((format[i], None))
+			i += 1
+			continue
+		directive = format[i+1:i+2]
+		if directive == '%':
+			tokens.append(('%', None))
+		elif directive in _strptime_fields:
+			tokens.append((directive, _strptime_fields[directive][0]))
+		else:
+			return None
+		i += 2
+
+	# %f takes 1 to 6 digits, deduce the width from the string length
+	fixed = sum(1 if width is None else width for (directive, width) in tokens if directive != 'f')
+	nf = sum(1 for (directive, width) in tokens if directive == 'f')
+	if nf > 1 or (nf and not 1 <= length - fixed <= 6):
+		return None
+
+	layout = []
+	pos = 0
+	for (directive, width) in tokens:
+		if directive == 'f':
+			width = length - fixed
+		layout.append((pos, directive, width))
+		pos += 1 if width is None else width
+	return layout, pos
+
+
+def _strptime_slow(strings, format, fields):
+	for i, s in strings:
+		dt = datetime.datetime.strptime(s, format)
+		for f in _strptime_order:
+			fields[f][i] = getattr(dt, f)
+
+
+def strptime_fields(strings, format):
+	"""Parse a sequence of strings with datetime.strptime() semantics.
+
+	Common fixed width formats are parsed as arrays, anything else falls back
+	to datetime.strptime() for the strings concerned. Returns a tuple of arrays
+	(year, month, day, hour, minute, second, microsecond)."""
+
+	strings = list(strings)
+	n = len(strings)
+	fields = dict((f, numpy.zeros(n, dtype=numpy.int64)) for f in _strptime_order)
+	fields['year'][:] = 1900
+	fields['month'][:] = 1
+	fields['day'][:] = 1
+	if not n:
+		return tuple(fields[f] for f in _strptime_order)
+
+	layout = None
+	try:
+		data = numpy.array(strings, dtype=str)
+	except (UnicodeEncodeError, ValueError):
+		pass
+	else:
+		layout = _strptime_layout(format, len(strings[0]))
+
+	if layout is None:
+		_strptime_slow(enumerate(strings), format, fields)
+		return tuple(fields[f] for f in _strptime_order)
+
+	layout, length = layout
+	ok = numpy.char.str_len(data) == length
+	chars = numpy.zeros((n, length), dtype=numpy.uint8)
+	width = min(length, data.dtype.itemsize)
+	chars[:, :width] = data.view(numpy.uint8).reshape(n, data.dtype.itemsize)[:, :width]
+	lower = chars | 0x20 # only meaningful for letters
+
+	pm = None
+	hour12 = False
+	for (pos, directive, width) in layout:
+		if width is None: # literal
+			ok &= chars[:, pos] == ord(directive)
+		elif directive == 'p':
+			pm = lower[:, pos] == ord('p')
+			ok &= (pm | (lower[:, pos] == ord('a'))) & (lower[:, pos+1] == ord('m'))
+		elif directive == 'b':
+			month = numpy.zeros(n, dtype=numpy.int64)
+			for i, name in enumerate(_strptime_months):
+				month[(lower[:, pos:pos+3] == numpy.fromstring(name, dtype=numpy.uint8)).all(axis=1)] = i + 1
+			ok &= month > 0
+			fields['month'] = month
+		else:
+			digits = chars[:, pos:pos+width].astype(numpy.int64) - ord('0')
+			ok &= ((digits >= 0) & (digits <= 9)).all(axis=1)
+			value = (digits * 10 ** numpy.arange(width-1, -1, -1)).sum(axis=1)
+			if directive == 'y':
+				value = value + numpy.where(value < 69, 2000, 1900)
+			elif directive == 'f':
+				value = value * 10 ** (6 - width)
+			elif directive == 'I':
+				hour12 = True
+			fields[_strptime_fields[directive][1]] = value
+
+	if hour12:
+		fields['hour'] = fields['hour'] % 12
+		if pm is not None:
+			fields['hour'] = fields['hour'] + 12 * pm
+
+	# leave invalid dates to strptime, which will complain properly
+	year, month, day = fields['year'], fields['month'], fields['day']
+	ok &= (year >= 1) & (month >= 1) & (month <= 12) & (day >= 1)
+	monthlength = _days_from_civil(year + (month == 12), month % 12 + 1, 1) - _days_from_civil(year, month, 1)
+	ok &= (day <= monthlength) & (fields['hour'] <= 23) & (fields['minute'] <= 59) & (fields['second'] <= 59)
+
+	if not ok.all():
+		_strptime_slow(((i, strings[i]) for i in numpy.flatnonzero(~ok)), format, fields)
+	return tuple(fields[f] for f in _strptime_order)
+
+
+def mpldtstrptime_array(strings, format, tz=localtz):
+	# array equivalent of mpldtstrptime()
+	return mpldtfromfields(*strptime_fields(strings, format), tz=tz)
+
+
 class ContextManager(object):
 	def __init__(self, enter, exit):
 		self.enter = enter
@@ -209,6 +470,9 @@ def pypy(func):
 	@functools.wraps(func)
 	def wrapper(*args, **kwargs):
 		return pypymanager.run(func, *args, **kwargs)
+	# non-blocking variants, see pypymanager.submit() and pypymanager.prefetch()
+	wrapper.submit = functools.partial(pypymanager.submit, func)
+	wrapper.prefetch = functools.partial(pypymanager.prefetch, func)
 	return wrapper
 
 def class_fqn(cls):
@@ -218,16 +482,253 @@ def instance_fqcn(obj):
 	return class_fqn(obj.__class__)
 
 
-def loadtxt(file, delimiter=None, skip_lines=0):
-	# simplified & faster version of numpy.loadtxt
+class MemoryLimitError(MemoryError):
+	pass
+
+
+class GrowableArray(object):
+	# array that can be extended along its first axis at amortized constant cost per row
+	growth = 1.5
+
+	def __init__(self, shape=(), dtype=float, capacity=1024, max_bytes=None):
+		self.buffer = numpy.empty((capacity,) + tuple(shape), dtype=dtype)
+		self.size = 0
+		self.max_bytes = max_bytes
+
+	def __len__(self):
+		return self.size
+
+	@property
+	def array(self):
+		return self.buffer[:self.size]
+
+	def reserve(self, capacity):
+		if capacity <= self.buffer.shape[0]:
+			return
+		rowbytes = self.buffer[:1].nbytes
+		if self.max_bytes is not None and capacity * rowbytes > self.max_bytes:
+			raise MemoryLimitError('array would exceed the limit of {0} bytes'.format(self.max_bytes))
+		capacity = max(capacity, int(self.buffer.shape[0] * self.growth))
+		if self.max_bytes is not None:
+			capacity = min(capacity, self.max_bytes // rowbytes)
+		buffer = numpy.empty((capacity,) + self.buffer.shape[1:], dtype=self.buffer.dtype)
+		buffer[:self.size] = self.buffer[:self.size]
+		self.buffer = buffer
+
+	def append(self, rows):
+		self.reserve(self.size + len(rows))
+		self.buffer[self.size:self.size+len(rows)] = rows
+		self.size += len(rows)
+
+	def truncate(self, size):
+		self.size = min(size, self.size)
+
+	def trim(self):
+		# give back the unused capacity and return the array
+		if self.size < self.buffer.shape[0]:
+			try:
+				self.buffer.resize((self.size,) + self.buffer.shape[1:])
+			except ValueError: # the buffer is referenced elsewhere
+				self.buffer = self.buffer[:self.size].copy()
+		return self.buffer
+
+
+class LoadtxtError(ValueError):
+	def __init__(self, lineno, message):
+		super(LoadtxtError, self).__init__('line {0}: {1}'.format(lineno, message))
+		self.lineno = lineno
+
+
+def _loadtxt_chunks(file, blocksize):
+	# yields (text, number of lines, bytes done, bytes total), blank lines are
+	# kept so line numbers can be reported
+	if hasattr(file, 'read'):
+		try:
+			total = os.fstat(file.fileno()).st_size
+		except (AttributeError, EnvironmentError, ValueError):
+			total = None
+		remainder = ''
+		while 1:
+			block = file.read(blocksize)
+			if not block:
+				break
+			block = remainder + block
+			end = block.rfind('\n') + 1
+			remainder = block[end:]
+			if end:
+				yield block[:end], block.count('\n', 0, end), file.tell(), total
+		if remainder.strip():
+			yield remainder, 1, file.tell(), total
+	else:
+		file = iter(file)
+		done = 0
+		batch = blocksize // 64
+		while 1:
+			lines = list(itertools.islice(file, batch))
+			if not lines:
+				break
+			done += len(lines)
+			yield '\n'.join(line.strip() for line in lines), len(lines), done, None
+
+
+def _loadtxt_fieldcount(text, nlines):
+	# number of whitespace separated fields on each line of text
+	if isinstance(text, unicode):
+		text = text.encode('utf-8')
+	buf = numpy.frombuffer(text, dtype=numpy.uint8)
+	space = (buf == 32) | ((buf >= 9) & (buf <= 13))
+	start = ~space
+	start[1:] &= space[:-1]
+	line = numpy.searchsorted(numpy.flatnonzero(buf == 10), numpy.flatnonzero(start))
+	return numpy.bincount(line, minlength=nlines)
+
+
+def _loadtxt_parse(text, nlines, ncols, delimiter, converters, firstline):
+	if not converters:
+		spaced = text
+		if delimiter is not None and not delimiter.isspace():
+			spaced = text.replace(delimiter, ' ')
+		with warnings.catch_warnings():
+			warnings.simplefilter('ignore', DeprecationWarning)
+			data = numpy.fromstring(spaced, dtype=float, sep=' ')
+		# fromstring stops silently at anything it cannot parse and does not
+		# care about line endings, so check the number of fields on every line
+		counts = _loadtxt_fieldcount(spaced, nlines)
+		counts = counts[counts != 0]
+		if data.size == counts.size * ncols and (counts == ncols).all():
+			return data.reshape(counts.size, ncols)
+		# something unexpected, take the slow road below for a proper error
+
+	rows = []
+	linenos = []
+	for i, line in enumerate(text.split('\n')):
+		line = line.strip()
+		if not line:
+			continue
+		row = line.split(delimiter)
+		if len(row) != ncols:
+			raise LoadtxtError(firstline + i, 'expected {0} columns, found {1}: {2!r}'.format(ncols, len(row), line))
+		rows.append(row)
+		linenos.append(firstline + i)
+	data = numpy.empty((len(rows), ncols))
+	for i, column in enumerate(itertools.izip(*rows)):
+		if i in converters:
+			data[:, i] = converters[i](column)
+			continue
+		try:
+			data[:, i] = numpy.fromiter(itertools.imap(float, column), dtype=float, count=len(column))
+		except ValueError:
+			for lineno, value in itertools.izip(linenos, column):
+				try:
+					float(value)
+				except ValueError:
+					raise LoadtxtError(lineno, 'cannot convert {0!r} in column {1} to a number'.format(value, i))
+			raise
+	return data
+
+
+def loadtxt(file, delimiter=None, skip_lines=0, usecols=None, converters=None, progress=None, max_bytes=None, blocksize=1<<20):
+	"""Simplified & faster version of numpy.loadtxt.
+
+	file can be a filename, a file object, which is read in blocks, or any
+	iterable of lines. The text is parsed chunk by chunk into a growing float
+	array. converters maps column numbers to functions that convert a sequence
+	of strings to an array, progress is called as progress(done, total) after
+	every chunk (total is None if unknown) and max_bytes limits the size of the
+	resulting array (MemoryLimitError is raised when exceeded). Malformed lines
+	raise LoadtxtError, which has the line number."""
+
 	if isinstance(file, basestring):
-		file = open(file)
-	
+		with open(file) as fp:
+			return loadtxt(fp, delimiter, skip_lines, usecols, converters, progress, max_bytes, blocksize)
+
+	if not hasattr(file, 'readline'):
+		file = iter(file) # e.g. a list of lines
 	for i in range(skip_lines):
-		next(file)
+		if hasattr(file, 'readline'):
+			file.readline()
+		else:
+			next(file)
+
+	converters = converters or {}
+	result = None
+	# line numbers as counted by LineCounter (which has seen the skipped
+	# lines), or from the first line we got
+	lineno = getattr(file, '_linecount', skip_lines)
+	for text, nlines, done, total in _loadtxt_chunks(file, blocksize):
+		if result is None:
+			ncols = len(text.lstrip().split('\n', 1)[0].strip().split(delimiter))
+			if usecols is not None:
+				usecols = list(usecols)
+			cols = ncols if usecols is None else len(usecols)
+			# estimate the number of rows from the first chunk to avoid regrowing
+			capacity = 1024
+			if total:
+				capacity = max(capacity, int(1.05 * nlines * total / len(text)))
+			if max_bytes is not None:
+				capacity = min(capacity, max_bytes // (8 * max(cols, 1)))
+			result = GrowableArray((cols,), capacity=capacity, max_bytes=max_bytes)
 
-	lines = (line.strip() for line in file)
-	return numpy.array([line.split(delimiter) for line in lines if line], dtype=float)
+		try:
+			data = _loadtxt_parse(text, nlines, ncols, delimiter, converters, lineno + 1)
+		except LoadtxtError as e:
+			if hasattr(file, '_linecount'):
+				file._linecount = e.lineno
+			raise
+		lineno += nlines
+		if hasattr(file, 'read') and hasattr(file, '_linecount'):
+			# blocks are read with read(), which LineCounter does not see
+			file._linecount = lineno
+		if usecols is not None:
+			data = data[:, usecols]
+		result.append(data)
+
+		if progress:
+			progress(done, total)
+
+	if result is None:
+		return numpy.empty((0, 0 if usecols is None else len(usecols)))
+	return result.trim()
+
+
+def find_line_start(fp, end, blocksize=4096):
+	# offset of the line that contains position end in fp (opened in binary mode)
+	pos = end
+	while pos > 0:
+		start = max(0, pos - blocksize)
+		fp.seek(start)
+		i = fp.read(pos - start).rfind('\n')
+		if i >= 0:
+			return start + i + 1
+		pos = start
+	return 0
+
+
+class FileHead(object):
+	# file-like wrapper that stops reading at offset end
+	def __init__(self, fp, end):
+		self.fp = fp
+		self.end = end
+
+	def read(self, size=-1):
+		left = self.end - self.fp.tell()
+		if size < 0 or size > left:
+			size = left
+		if size <= 0:
+			return ''
+		return self.fp.read(size)
+
+	def __getattr__(self, name):
+		return getattr(self.fp, name)
+
+	# LineCounter support for loadtxt()
+	@property
+	def _linecount(self):
+		return self.fp._linecount
+
+	@_linecount.setter
+	def _linecount(self, value):
+		self.fp._linecount = value
 
 
 # shamelessly copied from matplotlib 1.2.0 to provide compatibility with older
@@ -279,35 +780,198 @@ def pil_to_array( pilImage ):
 	return x
 
 
-class StackCache(object):
-	def __init__(self, limit=None):
-		self.limit = limit
-		self.activity = []
-		self.lookup = {}
+class LRUCache(object):
+	# Thread-safe least recently used cache with a size budget, by default
+	# in bytes of numpy arrays. Values larger than the budget are not stored.
+	# Pinned keys are never evicted. Caches can also share a MemoryBudget,
+	# which evicts the least recently used entries of all its caches.
+	_clock = itertools.count() # access order across caches
+
+	def __init__(self, max_bytes, sizeof=lambda value: value.nbytes, budget=None):
+		self.max_bytes = max_bytes
+		self.sizeof = sizeof
+		self.items = collections.OrderedDict() # key: (value, size, last access)
+		self.pinned = set()
+		self.bytes = 0
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+		self.lock = threading.Lock()
+		self.budget = budget
+		if budget:
+			budget.register(self)
+
+	def __len__(self):
+		return len(self.items)
 
 	def find(self, key):
-		if key in self.lookup:
-			self.activity.remove(key)
-			self.activity.insert(0, key)
-			return self.lookup[key]
-		return None
+		with self.lock:
+			try:
+				value, size, tick = self.items.pop(key)
+			except KeyError:
+				self.misses += 1
+				return None
+			self.items[key] = value, size, next(self._clock)
+			self.hits += 1
+			return value
 
 	def insert(self, key, value):
-		self.lookup[key] = value
-		self.activity.insert(0, key)
-		self._check_limit()
-
-	def set_limit(self, limit):
-		self.limit = limit
-		self._check_limit()
+		size = self.sizeof(value)
+		with self.lock:
+			if key in self.items:
+				self.bytes -= self.items.pop(key)[1]
+			if size > self.max_bytes:
+				return
+			self.items[key] = value, size, next(self._clock)
+			self.bytes += size
+			self._check_limit()
+		if self.budget:
+			self.budget.check()
+
+	def get(self, key, factory):
+		# returns the cached value, or calls factory() and caches its result
+		value = self.find(key)
+		if value is None:
+			value = factory()
+			self.insert(key, value)
+		return value
+
+	def pin(self, key):
+		# key (which need not be cached yet) is not evicted until unpinned
+		with self.lock:
+			self.pinned.add(key)
+
+	def unpin(self, key):
+		with self.lock:
+			self.pinned.discard(key)
+			self._check_limit()
+		if self.budget:
+			self.budget.check()
+
+	def set_limit(self, max_bytes):
+		with self.lock:
+			self.max_bytes = max_bytes
+			self._check_limit()
 
 	def _check_limit(self):
-		if self.limit is None or len(self.activity) <= self.limit:
-			return
-		excess = self.activity[self.limit:]
-		for key in excess:
-			del self.lookup[key]
-		self.activity = self.activity[:self.limit]
+		while self.bytes > self.max_bytes and self._evict_oldest() is not None:
+			pass
+
+	def _evict_oldest(self):
+		# removes the least recently used entry that is not pinned, returns its size or None
+		for key in self.items:
+			if key not in self.pinned:
+				value, size, tick = self.items.pop(key)
+				self.bytes -= size
+				self.evictions += 1
+				return size
+		return None
+
+	def oldest_access(self):
+		# last access of the least recently used entry that is not pinned, or None
+		with self.lock:
+			for key, (value, size, tick) in self.items.iteritems():
+				if key not in self.pinned:
+					return tick
+			return None
+
+	def evict_oldest(self):
+		with self.lock:
+			return self._evict_oldest()
+
+	def clear(self):
+		with self.lock:
+			self.items.clear()
+			self.bytes = 0
+
+	def stats(self):
+		return Struct(hits=self.hits, misses=self.misses, evictions=self.evictions, items=len(self.items), pinned=len(self.pinned), bytes=self.bytes, max_bytes=self.max_bytes)
+
+
+class MemoryBudget(object):
+	# Byte budget shared by several LRUCaches, for example the images of all
+	# image graphs. When the caches together exceed it, the least recently
+	# used entries are evicted first, whichever cache they are in.
+	def __init__(self, max_bytes):
+		self.max_bytes = max_bytes
+		self.caches = weakref.WeakSet()
+		self.lock = threading.Lock()
+
+	def register(self, cache):
+		with self.lock:
+			self.caches.add(cache)
+
+	def get_bytes(self):
+		return sum(cache.bytes for cache in list(self.caches))
+
+	def check(self):
+		with self.lock:
+			total = self.get_bytes()
+			while total > self.max_bytes:
+				candidates = [(cache.oldest_access(), cache) for cache in list(self.caches)]
+				candidates = [(tick, cache) for (tick, cache) in candidates if tick is not None]
+				if not candidates:
+					break
+				size = min(candidates)[1].evict_oldest()
+				if size is not None:
+					total -= size
+
+	def set_limit(self, max_bytes):
+		self.max_bytes = max_bytes
+		self.check()
+
+	def stats(self):
+		caches = list(self.caches)
+		return Struct(caches=len(caches), bytes=sum(cache.bytes for cache in caches), evictions=sum(cache.evictions for cache in caches), max_bytes=self.max_bytes)
+
+
+class Prefetcher(object):
+	# Runs jobs in a background thread, in order of submission. Submitting a
+	# new batch of jobs cancels all jobs of earlier batches that did not start
+	# yet. Jobs are expected to store their results in a (thread-safe) cache.
+	# close() stops the thread, it is started again by the next submit().
+	def __init__(self):
+		self.queue = Queue.Queue()
+		self.generation = 0
+		self.thread = None
+
+	def submit(self, jobs):
+		self.generation += 1
+		for job in jobs:
+			self.queue.put((self.generation, job))
+		if self.thread is None:
+			self.thread = threading.Thread(target=self.run, args=(self.queue,), name='prefetcher')
+			self.thread.daemon = True
+			self.thread.start()
+
+	def cancel(self):
+		self.generation += 1
+
+	def close(self):
+		# drops the pending jobs (and whatever they refer to) and lets the thread exit
+		self.generation += 1
+		queue, self.queue = self.queue, Queue.Queue()
+		while 1:
+			try:
+				queue.get_nowait()
+			except Queue.Empty:
+				break
+		if self.thread:
+			queue.put((None, None))
+			self.thread = None
+
+	def run(self, queue):
+		while 1:
+			generation, job = queue.get()
+			if job is None:
+				break
+			if generation != self.generation:
+				continue
+			try:
+				job()
+			except:
+				# failures will show up again when the data is actually needed
+				pass
 
 
 def _win32_get_appdata():
@@ -348,6 +1012,15 @@ def get_persistant_path(id):
 	return os.path.join(os.path.expanduser('~'), '.spacetime.{0}'.format(id))
 
 
+def can_spawn_processes():
+	# Whether multiprocessing can start worker processes. On Windows, workers
+	# import the main module of the parent again, which only works for entry
+	# points written for it (spacetime.gui.__main__); elsewhere they fork.
+	if platform.system() != 'Windows':
+		return True
+	return getattr(sys.modules.get('__main__'), 'spawn_safe', False)
+
+
 class LineCounterError(Exception):
 	pass
 
@@ -0,0 +1 @@
+@python spacetime-batch %*
@@ -1,4 +1,4 @@
 @echo off
-python -m spacetime.gui.main --debug
+python -m spacetime.gui --debug
 echo.
 set /p=(press enter to quit)
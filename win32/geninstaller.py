@@ -194,21 +194,21 @@ print r"""
 
   SetOutPath "$INSTDIR"
 
-  CreateShortCut "$INSTDIR\Spacetime.lnk" "$INSTDIR\pythonw.exe" "-m spacetime.gui.main" "$INSTDIR\spacetime\icons\spacetime-icon.ico"
+  CreateShortCut "$INSTDIR\Spacetime.lnk" "$INSTDIR\pythonw.exe" "-m spacetime.gui" "$INSTDIR\spacetime\icons\spacetime-icon.ico"
   CreateShortCut "$INSTDIR\Spacetime (debug mode).lnk" "$INSTDIR\debug.bat" "" "$INSTDIR\spacetime\icons\spacetime-icon.ico"
 
   CreateDirectory "$SMPROGRAMS\Spacetime"
-  CreateShortCut "$SMPROGRAMS\Spacetime\Spacetime.lnk" "$INSTDIR\pythonw.exe" "-m spacetime.gui.main" "$INSTDIR\spacetime\icons\spacetime-icon.ico"
+  CreateShortCut "$SMPROGRAMS\Spacetime\Spacetime.lnk" "$INSTDIR\pythonw.exe" "-m spacetime.gui" "$INSTDIR\spacetime\icons\spacetime-icon.ico"
   CreateShortCut "$SMPROGRAMS\Spacetime\Spacetime (debug mode).lnk" "$INSTDIR\debug.bat" "" "$INSTDIR\spacetime\icons\spacetime-icon.ico"
 """
 if pypy:
-	print r'  CreateShortCut "$SMPROGRAMS\Spacetime\Spacetime (pypy, experimental).lnk" "$INSTDIR\pythonw.exe" "-m spacetime.gui.main --pypy" "$INSTDIR\spacetime\icons\spacetime-icon.ico"'
+	print r'  CreateShortCut "$SMPROGRAMS\Spacetime\Spacetime (pypy, experimental).lnk" "$INSTDIR\pythonw.exe" "-m spacetime.gui --pypy" "$INSTDIR\spacetime\icons\spacetime-icon.ico"'
 
 print r"""
   CreateShortCut "$SMPROGRAMS\Spacetime\Reset preferences.lnk" "$INSTDIR\pythonw.exe" "reset_preferences.py"
   CreateShortCut "$SMPROGRAMS\Spacetime\Uninstall.lnk" "$INSTDIR\Uninstall.exe"
   
-  !insertmacro APP_ASSOCIATE "spacetime" "Spacetime.Project" "Spacetime project" "$INSTDIR\spacetime\icons\spacetime-project.ico" "Open with Spacetime" '$INSTDIR\pythonw.exe -m spacetime.gui.main "%1"'
+  !insertmacro APP_ASSOCIATE "spacetime" "Spacetime.Project" "Spacetime project" "$INSTDIR\spacetime\icons\spacetime-project.ico" "Open with Spacetime" '$INSTDIR\pythonw.exe -m spacetime.gui "%1"'
   !insertmacro UPDATEFILEASSOC
 
   ;Store installation folder